@@ -0,0 +1,222 @@
+import logging
+from bisect import bisect_left
+
+from .base import text_fingerprint, text_numbers
+
+
+def _fingerprint_keys(markers, texts):
+    return [
+        (m, text_fingerprint(t, casefold=True, placeholders=True))
+        for m, t in zip(markers, texts)
+    ]
+
+
+def _number_keys(markers, texts):
+    keys = list()
+    for m, t in zip(markers, texts):
+        numbers = text_numbers(t)
+        keys.append((m, numbers) if numbers else None)
+    return keys
+
+
+def _longest_increasing_pairs(pairs):
+    """Return the longest subsequence of (sfm_idx, odt_idx) pairs, already
+    sorted by sfm_idx, whose odt_idx values are also increasing. This is the
+    patience-sorting LIS, which runs in O(n log n)."""
+
+    tails = []  # odt_idx at the end of each pile
+    tail_ids = []  # index into pairs of the end of each pile
+    previous = [None] * len(pairs)
+    for i, (_, odt_idx) in enumerate(pairs):
+        pile = bisect_left(tails, odt_idx)
+        if pile > 0:
+            previous[i] = tail_ids[pile - 1]
+        if pile == len(tails):
+            tails.append(odt_idx)
+            tail_ids.append(i)
+        else:
+            tails[pile] = odt_idx
+            tail_ids[pile] = i
+
+    result = []
+    i = tail_ids[-1] if tail_ids else None
+    while i is not None:
+        result.append(pairs[i])
+        i = previous[i]
+    return result[::-1]
+
+
+def _unique_anchors(sfm_keys, odt_keys, s_lo, s_hi, o_lo, o_hi):
+    """Return ordered (sfm_idx, odt_idx) pairs for keys that occur exactly once
+    in both ranges."""
+
+    sfm_seen = dict()
+    for i in range(s_lo, s_hi):
+        k = sfm_keys[i]
+        if k is not None:
+            sfm_seen[k] = None if k in sfm_seen else i
+    odt_seen = dict()
+    for i in range(o_lo, o_hi):
+        k = odt_keys[i]
+        if k is not None and k in sfm_seen:
+            odt_seen[k] = None if k in odt_seen else i
+
+    pairs = [
+        (sfm_seen[k], o)
+        for k, o in odt_seen.items()
+        if o is not None and sfm_seen[k] is not None
+    ]
+    pairs.sort()
+    return _longest_increasing_pairs(pairs)
+
+
+class ParagraphAlignment:
+    """Pairs of SFM and ODT paragraphs of one chapter, matched by their marker
+    sequence and text fingerprints rather than by position."""
+
+    def __init__(self, sfm_paragraphs, odt_paragraphs, sfm_markers, odt_markers):
+        self.sfm_paragraphs = list(sfm_paragraphs)
+        self.odt_paragraphs = list(odt_paragraphs)
+        self.sfm_markers = list(sfm_markers)
+        self.odt_markers = list(odt_markers)
+        self._pairs = None
+
+    @property
+    def pairs(self):
+        """Return aligned (sfm_idx, odt_idx) pairs in document order."""
+        if self._pairs is None:
+            self._pairs = self._align()
+        return self._pairs
+
+    @property
+    def matched(self):
+        """Return aligned pairs whose SFM marker agrees with the ODT style."""
+        return [
+            (self.sfm_paragraphs[s], self.odt_paragraphs[o])
+            for s, o in self.pairs
+            if self.sfm_markers[s] == self.odt_markers[o]
+        ]
+
+    @property
+    def mismatched(self):
+        """Return (sfm_idx, odt_idx) pairs aligned by position only, whose SFM
+        marker disagrees with the ODT style."""
+        return [
+            (s, o) for s, o in self.pairs if self.sfm_markers[s] != self.odt_markers[o]
+        ]
+
+    @property
+    def unmatched_sfm(self):
+        paired = {s for s, _ in self.pairs}
+        return [i for i in range(len(self.sfm_paragraphs)) if i not in paired]
+
+    @property
+    def unmatched_odt(self):
+        paired = {o for _, o in self.pairs}
+        return [i for i in range(len(self.odt_paragraphs)) if i not in paired]
+
+    @property
+    def is_complete(self):
+        return not self.unmatched_sfm and not self.unmatched_odt and not self.mismatched
+
+    def report(self):
+        """Return one line per paragraph that could not be aligned."""
+        lines = list()
+        for i in self.unmatched_sfm:
+            p = self.sfm_paragraphs[i]
+            lines.append(f"SFM paragraph {i} has no ODT match: {p.marker} {p.intro}")
+        for i in self.unmatched_odt:
+            p = self.odt_paragraphs[i]
+            lines.append(f"ODT paragraph {i} has no SFM match: [{p.style}] {p.intro}")
+        for s, o in self.mismatched:
+            lines.append(
+                f"SFM paragraph {s} ({self.sfm_markers[s]}) aligned by position with ODT paragraph {o} ({self.odt_markers[o]}); markers differ"
+            )
+        return lines
+
+    def _align(self):
+        # The SFM paragraphs' children aren't needed to find their words.
+        sfm_texts = [p.plain_text for p in self.sfm_paragraphs]
+        odt_texts = [p.text_recursive for p in self.odt_paragraphs]
+        # Key levels, from most to least specific. Each level is only used to
+        # find anchors in the gaps left by the previous level, so every
+        # paragraph is keyed at most once per level.
+        levels = (
+            (
+                _fingerprint_keys(self.sfm_markers, sfm_texts),
+                _fingerprint_keys(self.odt_markers, odt_texts),
+            ),
+            (
+                _number_keys(self.sfm_markers, sfm_texts),
+                _number_keys(self.odt_markers, odt_texts),
+            ),
+            (self.sfm_markers, self.odt_markers),
+        )
+
+        pairs = list()
+        # Iterative rather than recursive to handle very long chapters.
+        stack = [(0, len(sfm_texts), 0, len(odt_texts), 0)]
+        while stack:
+            s_lo, s_hi, o_lo, o_hi, level = stack.pop()
+            if s_lo >= s_hi or o_lo >= o_hi:
+                continue
+            if level < len(levels):
+                sfm_keys, odt_keys = levels[level]
+                anchors = _unique_anchors(sfm_keys, odt_keys, s_lo, s_hi, o_lo, o_hi)
+                if not anchors:
+                    stack.append((s_lo, s_hi, o_lo, o_hi, level + 1))
+                    continue
+                prev_s, prev_o = s_lo, o_lo
+                for s, o in anchors:
+                    stack.append((prev_s, s, prev_o, o, level + 1))
+                    pairs.append((s, o))
+                    prev_s, prev_o = s + 1, o + 1
+                stack.append((prev_s, s_hi, prev_o, o_hi, level + 1))
+            else:
+                pairs.extend(self._align_gap(s_lo, s_hi, o_lo, o_hi))
+        pairs.sort()
+        return pairs
+
+    def _align_gap(self, s_lo, s_hi, o_lo, o_hi):
+        """Align a gap without anchors: match leading and trailing paragraphs
+        with equal markers, then pair any remainder by position only if both
+        sides have the same length."""
+
+        pairs = list()
+        while (
+            s_lo < s_hi
+            and o_lo < o_hi
+            and self.sfm_markers[s_lo] == self.odt_markers[o_lo]
+        ):
+            pairs.append((s_lo, o_lo))
+            s_lo += 1
+            o_lo += 1
+        while (
+            s_lo < s_hi
+            and o_lo < o_hi
+            and self.sfm_markers[s_hi - 1] == self.odt_markers[o_hi - 1]
+        ):
+            s_hi -= 1
+            o_hi -= 1
+            pairs.append((s_hi, o_hi))
+        if s_hi - s_lo == o_hi - o_lo:
+            pairs.extend(zip(range(s_lo, s_hi), range(o_lo, o_hi)))
+        return pairs
+
+    def log(self):
+        for line in self.report():
+            logging.warning(line)
+
+
+def align_paragraphs(sfm_paragraphs, odt_paragraphs):
+    """Align SFM paragraphs with ODT paragraphs, using the SFM markers that the
+    ODT paragraphs' styles map to."""
+
+    sfm_paragraphs = list(sfm_paragraphs)
+    odt_paragraphs = list(odt_paragraphs)
+    return ParagraphAlignment(
+        sfm_paragraphs,
+        odt_paragraphs,
+        [p.marker for p in sfm_paragraphs],
+        [p.sfm_marker for p in odt_paragraphs],
+    )
@@ -1,22 +1,174 @@
+import hashlib
 import logging
+import os
+import re
+import shutil
+import sys
 import unicodedata
-from datetime import datetime
+from contextlib import contextmanager
+from datetime import date, datetime, timezone
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # not available on Windows
+    resource = None
 
 SFM_PLACEHOLDERS = {
     "~": "\u00a0",
 }
 SFM_ONLY_MARKERS = ("\\id", "\\rem", "\\usfm")
 SFM_TEXT_SEP = " _"
+RE_NUMBERS = re.compile(r"[0-9]+")
+RE_WHITESPACE = re.compile(r"[ \t\n]+")
+# How text_fingerprint treats whitespace.
+FINGERPRINT_WHITESPACE = ("collapse", "lines", None)
+# Unicode normalization forms that SFM files can be exported in.
+NORMALIZATION_MODES = ("NFC", "NFD")
+# Where a reproducible export's timestamp comes from, besides a fixed date:
+# the newest input file, or the SOURCE_DATE_EPOCH environment variable.
+TIMESTAMP_SOURCES = ("mtime", "epoch")
+TIMESTAMP_FORMAT = "%Y-%m-%d"
+
+
+def parse_chapter_numbers(chapters):
+    """Return a sorted list of chapter numbers from e.g. "3,4", "1-5,7", or an
+    iterable of ints; return None for "all" (or None)."""
+    if chapters is None or chapters == "all":
+        return None
+    if isinstance(chapters, str):
+        numbers = set()
+        for part in chapters.split(","):
+            part = part.strip()
+            if not part:
+                continue
+            first, sep, last = part.partition("-")
+            try:
+                if sep:
+                    numbers.update(range(int(first), int(last) + 1))
+                else:
+                    numbers.add(int(first))
+            except ValueError:
+                raise ValueError(f"Invalid chapter range: {part}")
+        return sorted(numbers)
+    return sorted(set(int(n) for n in chapters))
+
+
+def get_peak_rss():
+    """Return the peak resident memory of this process in bytes, if known."""
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # macOS reports bytes; Linux reports kilobytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
 
+@contextmanager
+def partial_output_folder(dest_path):
+    """Yield a temporary ".partial" folder next to dest_path to write files
+    into. When the with block completes, the folder is renamed to dest_path,
+    or its files are moved into dest_path if it already exists; if the block
+    fails or is cancelled, the folder is removed, so no half-written output is
+    left behind."""
+    dest_path = Path(dest_path)
+    partial_path = dest_path.with_name(f"{dest_path.name}.partial")
+    if partial_path.exists():
+        shutil.rmtree(partial_path)
+    try:
+        yield partial_path
+    except BaseException:
+        if partial_path.exists():
+            logging.info(f"Removing incomplete output: {partial_path}")
+            shutil.rmtree(partial_path)
+        raise
+    if not partial_path.exists():
+        return
+    if not dest_path.exists():
+        os.replace(partial_path, dest_path)
+        names = sorted(p.name for p in dest_path.iterdir())
+    else:
+        names = sorted(p.name for p in partial_path.iterdir())
+        for name in names:
+            os.replace(partial_path / name, dest_path / name)
+        partial_path.rmdir()
+    for name in names:
+        print(f'Saved to: "{dest_path / name}"')
 
-def get_timestamp():
-    return datetime.today().strftime("%Y-%m-%d")
+
+def get_timestamp(epoch=None):
+    """Return today's date, or the UTC date of the POSIX time, as text."""
+    if epoch is None:
+        return datetime.today().strftime(TIMESTAMP_FORMAT)
+    return datetime.fromtimestamp(epoch, tz=timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+
+def get_source_date_epoch():
+    """Return the POSIX time given by the SOURCE_DATE_EPOCH environment
+    variable, or None if it isn't set."""
+    value = os.environ.get("SOURCE_DATE_EPOCH")
+    if not value:
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise ValueError(f"Invalid SOURCE_DATE_EPOCH: {value}")
+
+
+def validate_timestamp_source(value):
+    """Return the timestamp source ("mtime", "epoch", or a fixed date given
+    as YYYY-MM-DD) if it's valid, or raise ValueError."""
+    if value is None or value in TIMESTAMP_SOURCES:
+        return value
+    try:
+        date.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ValueError(
+            f"Invalid timestamp: {value}; use one of {TIMESTAMP_SOURCES} or YYYY-MM-DD"
+        )
+    return value
 
 
 def normalize_text(normalization_form, text):
+    """Return the text in the normalization form; as it is if that's None."""
+    if normalization_form is None:
+        return text
     return unicodedata.normalize(normalization_form, text)
 
 
+def text_fingerprint(
+    text,
+    normalization_form="NFC",
+    whitespace="collapse",
+    casefold=False,
+    placeholders=False,
+):
+    """Return a short, stable hash of the text in the normalization form (as
+    it is if that's None). Whitespace is "collapse"d to single spaces, or for
+    "lines" is only ignored at line ends and in blank lines, or is kept if
+    None. Letter case is ignored if casefold is True, and Paratext placeholder
+    characters (e.g. "~") count as the characters they stand for if
+    placeholders is True."""
+    if whitespace not in FINGERPRINT_WHITESPACE:
+        raise ValueError(f"Invalid whitespace handling: {whitespace}")
+    if placeholders:
+        text = undo_paratext_replacements(text)
+    if whitespace == "collapse":
+        text = RE_WHITESPACE.sub(" ", text).strip()
+    text = normalize_text(normalization_form, text)
+    if whitespace == "lines":
+        lines = (line.rstrip() for line in text.splitlines())
+        text = "\n".join(line for line in lines if line)
+    if casefold:
+        text = text.casefold()
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def text_numbers(text):
+    """Return the sequence of numbers found in the text (e.g. verse numbers),
+    which usually survives translation unchanged."""
+    return tuple(RE_NUMBERS.findall(text))
+
+
 def do_paratext_replacements(text):
     for sfm_str, odt_str in SFM_PLACEHOLDERS.items():
         text = text.replace(odt_str, sfm_str)
@@ -27,46 +179,3 @@ def undo_paratext_replacements(text):
     for sfm_str, odt_str in SFM_PLACEHOLDERS.items():
         text = text.replace(sfm_str, odt_str)
     return text
-
-
-def verify_paragraph_count(sfm_chapter, odt_chapter):
-    # Compare paragraph counts in original data and updated data.
-    sfm_ps = [p for p in sfm_chapter.paragraphs if p.marker not in SFM_ONLY_MARKERS]
-    odt_ps = odt_chapter.paragraphs
-    len_sfm = len(sfm_ps)
-    len_odt = len(odt_ps)
-    if len_sfm != len_odt:
-        for i, (p1, p2) in enumerate(zip(sfm_ps, odt_ps)):
-            logging.error(f"{i}:SFM: {p1}")
-            logging.error(f"{i}:ODT: {p2}")
-        raise ValueError(
-            f"Paragraph counts differ for ch. {sfm_chapter.number}; SFM: {len_sfm}; ODT: {len_odt}"
-        )
-
-
-def verify_paragraph_children_count(sfm_paragraph, odt_paragraph):
-    sfm_children = sfm_paragraph.children
-    odt_children = odt_paragraph.children
-    len_sfm = len(sfm_children)
-    len_odt = len(odt_children)
-    if len_sfm != len_odt:
-        logging.warning(
-            f"Unmatched children for ODT ({len_odt}) & SFM ({len_sfm}): {odt_paragraph.intro}|{sfm_paragraph.intro}"
-        )
-        for i, (c1, c2) in enumerate(zip(sfm_children, odt_children)):
-            logging.info(f"{i}:SFM: {c1.text}")
-            logging.info(f"{i}:ODT: {c2.text}")
-    return len_sfm - len_odt
-
-
-def verify_sfm_markers(sfm_chapter, odt_chapter):
-    sfm_paragraphs = [
-        p for p in sfm_chapter.paragraphs if p.marker not in SFM_ONLY_MARKERS
-    ]
-    for i, p in enumerate(odt_chapter.paragraphs):
-        sfm = sfm_paragraphs[i].marker
-        marker = odt_chapter.styles.get(p.style)
-        if marker != sfm:
-            raise ValueError(
-                f'SFM marker ({sfm}) does not correspond to ODT style ({p.style}) for text "{p.text}"; expected: {marker}'
-            )
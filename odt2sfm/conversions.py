@@ -1,18 +1,69 @@
 import logging
+import os
 from pathlib import Path
 
-from .base import get_timestamp
-from .odt import OdtBook, OdtChapter
+from .base import get_timestamp, parse_chapter_numbers
+from .metrics import Metrics
+from .progress import Progress
+from .odt import ODT_SUFFIXES, OdtBook, OdtChapter, SfmExportTarget
 from .sfm import SfmBook, SfmChapter
+from .sfm.diff import SfmBookDiff
+from .workqueue import QueueCoordinator, WorkQueue
 
 
 class Conversion:
     """Base class for ODT-to-SFM or SFM-to-ODT conversions."""
 
-    def __init__(self, source=None, destination=None, normalization_mode="NFC"):
+    def __init__(
+        self,
+        source=None,
+        destination=None,
+        chapters="all",
+        normalization_mode="NFC",
+        prefetch=2,
+        max_open=8,
+        max_memory=None,
+        slot_maps=False,
+        encoding=None,
+        changed_since=None,
+        metrics_path=None,
+        progress_callback=None,
+        preflight_workers=4,
+        queue=None,
+        claim_timeout=None,
+        queue_timeout=None,
+        timestamp_source=None,
+    ):
+        # Chapter numbers to convert, e.g. "all", "3,4" or "1-5,7".
+        self.chapters = chapters
+        # A previous version of the SFM source; only chapters that differ from
+        # it are imported.
+        self.changed_since = changed_since
         self._destination_path = None
         self.destination_format = None
+        # Encoding of SFM source files without a byte order mark.
+        self.encoding = encoding
+        self.max_memory = max_memory
+        self.metrics = Metrics(conversion=type(self).__name__)
+        # File that the run's metrics are written to: a Prometheus textfile
+        # (".prom") or JSON lines (any other suffix).
+        self.metrics_path = metrics_path
+        self.max_open = max_open
         self.normalization_mode = normalization_mode
+        self.prefetch = prefetch
+        # Chapters verified at a time before an import updates any; 0 for none.
+        self.preflight_workers = preflight_workers
+        # Reports progress to the optional callback; also used to cancel.
+        self.progress = Progress(callback=progress_callback)
+        self.slot_maps = slot_maps
+        # Makes exports reproducible: "mtime", "epoch", or a YYYY-MM-DD date.
+        self.timestamp_source = timestamp_source
+        # Folder of a WorkQueue, shared with workers on other machines, to
+        # convert chapters in; the time after which a worker's job is given
+        # to another worker; and the time after which waiting for jobs fails.
+        self.queue = queue
+        self.claim_timeout = claim_timeout
+        self.queue_timeout = queue_timeout
         self._source_path = None
         self.source_format = None
         if destination is not None:
@@ -42,39 +93,94 @@ class Conversion:
         self.source_format = source.suffix
         self._source_path = source
 
+    @property
+    def coordinator(self):
+        """Return a QueueCoordinator for the conversion's queue, if any."""
+        if self.queue is None:
+            return None
+        return QueueCoordinator(
+            WorkQueue(self.queue),
+            timeout=self.queue_timeout,
+            claim_timeout=self.claim_timeout,
+            metrics=self.metrics,
+            progress=self.progress,
+        )
+
+    def cancel(self):
+        """Stop the conversion before its next chapter, from any thread. The
+        run raises ConversionCancelled and leaves no partial output."""
+        self.progress.cancel()
+
     def run(self):
         raise NotImplementedError
 
+    def write_metrics(self):
+        if self.metrics_path is not None:
+            self.metrics.write(self.metrics_path)
+
     @staticmethod
     def _validate_path(path):
-        if path.suffix == ".odt" and not path.is_dir():
+        if path.suffix in ODT_SUFFIXES and not path.is_dir():
             raise ValueError("ODT book must be defined as its root folder.")
         elif path.suffix == ".sfm" and not path.is_file():
             raise ValueError("SFM book must be a readable file.")
 
 
 class OdtToSfm(Conversion):
-    """Get formatted text from the files in the source dir and generate the destination SFM file."""
+    """Get formatted text from the files in the source dir and generate the destination SFM file.
+    More SFM files, e.g. in another normalization mode or with another book
+    ID, can be given as extra SfmExportTargets; the ODT files are only read
+    and exported once for all of them."""
 
-    def __init__(self, **kwargs):
+    def __init__(self, targets=None, **kwargs):
         super().__init__(**kwargs)
+        self.targets = [
+            SfmExportTarget(self.normalization_mode, destination=self.destination_path)
+        ]
+        self.targets.extend(targets or [])
         logging.info(f"Evaluating source path: {self.source_path}")
         self.odt_book = OdtBook(
             self.source_path,
             filename=self.destination_path.stem,
             normalization_mode=self.normalization_mode,
+            prefetch=self.prefetch,
+            max_open=self.max_open,
+            max_memory=self.max_memory,
+            metrics=self.metrics,
+            timestamp_source=self.timestamp_source,
         )
         logging.info(f"Evaluating destination path: {self.destination_path}")
         self.sfm_book = SfmBook(self.destination_path)
 
     def run(self):
-        # FIXME: Add any book details here.
-        chapters = "all"
-        if self.destination_path:
-            self.destination_path.write_text(self.odt_book.to_sfm(chapters=chapters))
-            print(f"SFM data written to {self._destination_path}")
-        else:
-            print(self.odt_book.to_sfm(chapters=chapters))
+        with self.metrics.run():
+            # FIXME: Add any book details here.
+            if self.queue is not None:
+                sfm_texts = self.coordinator.to_sfm_targets(
+                    self.odt_book, self.targets, chapters=self.chapters
+                )
+            else:
+                sfm_texts = self.odt_book.to_sfm_targets(
+                    self.targets, chapters=self.chapters, progress=self.progress
+                )
+            for target, sfm_text in zip(self.targets, sfm_texts):
+                if target.destination:
+                    self.write_sfm(sfm_text, target.destination)
+                else:
+                    print(sfm_text)
+        self.write_metrics()
+
+    def write_sfm(self, sfm_text, destination):
+        # Leave an unchanged file as it is, e.g. for tools that check its mtime.
+        if destination.is_file() and destination.read_text() == sfm_text:
+            print(f"SFM data unchanged in {destination}")
+            return
+        # Replace the destination only once the whole text is written.
+        tmp_path = destination.with_name(f".{destination.name}.partial")
+        tmp_path.write_text(sfm_text)
+        os.replace(tmp_path, destination)
+        self.metrics.add("bytes_written", destination.stat().st_size)
+        print(f"SFM data written to {destination}")
 
 
 class SfmToOdt(Conversion):
@@ -83,10 +189,17 @@ class SfmToOdt(Conversion):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
         logging.info(f"Evaluating source path: {self.source_path}")
-        self.sfm_book = SfmBook(self.source_path)
+        self.sfm_book = SfmBook(self.source_path, encoding=self.encoding)
         logging.info(f"Evaluating destination path: {self.destination_path}")
         self.odt_book = OdtBook(
-            self.destination_path, normalization_mode=self.normalization_mode
+            self.destination_path,
+            normalization_mode=self.normalization_mode,
+            prefetch=self.prefetch,
+            max_open=self.max_open,
+            max_memory=self.max_memory,
+            slot_maps=self.slot_maps,
+            metrics=self.metrics,
+            preflight_workers=self.preflight_workers,
         )
 
     @staticmethod
@@ -115,10 +228,163 @@ class SfmToOdt(Conversion):
                 style = text = None
             print(f'[{style}] "{text}"\n')
 
+    def get_changed_chapters(self):
+        """Return the chapters to import: those selected that differ from the
+        previous version of the SFM file, if one was given."""
+        if self.changed_since is None:
+            return self.chapters
+        old_book = SfmBook(self.changed_since, encoding=self.encoding)
+        diff = SfmBookDiff(old_book, self.sfm_book, self.normalization_mode)
+        for change in diff.changes:
+            logging.info(f"Changed since {old_book.name}: {change}")
+        numbers = parse_chapter_numbers(self.chapters)
+        return [n for n in diff.changed_chapters if numbers is None or n in numbers]
+
     def run(self):
         """Create updated ODT file(s) based on the data found in the given SFM file."""
 
-        new_dest_path = self.destination_path.with_name(
-            f"{self.destination_path.name}_updated_{get_timestamp()}"
+        with self.metrics.run():
+            chapters = self.get_changed_chapters()
+            if chapters:
+                new_dest_path = self.destination_path.with_name(
+                    f"{self.destination_path.name}_updated_{get_timestamp()}"
+                )
+                if self.queue is not None:
+                    self.coordinator.update_text(
+                        self.odt_book, self.sfm_book, new_dest_path, chapters=chapters
+                    )
+                else:
+                    self.odt_book.update_text(
+                        self.sfm_book,
+                        new_dest_path,
+                        chapters=chapters,
+                        progress=self.progress,
+                    )
+            else:
+                print(f"No chapters changed since {self.changed_since}")
+        self.write_metrics()
+
+
+class OdtBytesToSfm(Conversion):
+    """Get formatted text from ODT files held in memory and return the SFM
+    text, without reading or writing any files. The lessons are given as
+    {filename: bytes or binary stream}, with the text of their
+    styles-reference file; the book's filename gives its ID, e.g. "01LUK".
+    The lessons have no modification times, so the "mtime" timestamp source
+    can't be used."""
+
+    def __init__(self, lessons=None, styles_reference=None, filename=None, **kwargs):
+        super().__init__(**kwargs)
+        if not lessons:
+            raise ValueError("No ODT files were given.")
+        if styles_reference is None:
+            raise ValueError("No styles reference was given.")
+        if filename is None:
+            raise ValueError("No book filename was given.")
+        self.odt_book = OdtBook(
+            filename=filename,
+            normalization_mode=self.normalization_mode,
+            prefetch=self.prefetch,
+            max_open=self.max_open,
+            max_memory=self.max_memory,
+            metrics=self.metrics,
+            timestamp_source=self.timestamp_source,
+            lessons=lessons,
+            styles_reference=styles_reference,
         )
-        self.odt_book.update_text(self.sfm_book, new_dest_path)
+
+    def run(self):
+        """Return the SFM text of the book."""
+        with self.metrics.run():
+            sfm_text = self.odt_book.to_sfm(
+                chapters=self.chapters, progress=self.progress
+            )
+            self.metrics.add("bytes_written", len(sfm_text.encode("utf-8")))
+        self.write_metrics()
+        return sfm_text
+
+
+class SfmToOdtBytes(Conversion):
+    """Update ODT files held in memory from SFM text and return the updated
+    files' bytes, without reading or writing any files. The lessons are given
+    as {filename: bytes or binary stream}, with the text of their
+    styles-reference file. Slot maps, which are saved next to ODT files,
+    aren't used."""
+
+    def __init__(self, sfm=None, lessons=None, styles_reference=None, **kwargs):
+        super().__init__(**kwargs)
+        if sfm is None:
+            raise ValueError("No SFM text was given.")
+        if not lessons:
+            raise ValueError("No ODT files were given.")
+        if styles_reference is None:
+            raise ValueError("No styles reference was given.")
+        self.sfm_book = SfmBook.from_text(sfm, encoding=self.encoding)
+        self.odt_book = OdtBook(
+            normalization_mode=self.normalization_mode,
+            max_open=self.max_open,
+            max_memory=self.max_memory,
+            metrics=self.metrics,
+            preflight_workers=self.preflight_workers,
+            lessons=lessons,
+            styles_reference=styles_reference,
+        )
+        # Verifications of the last run, listing paragraphs not updated.
+        self.verifications = None
+
+    def run(self):
+        """Return the updated ODT files as {filename: bytes}."""
+        with self.metrics.run():
+            outputs, self.verifications = self.odt_book.update_text_in_memory(
+                self.sfm_book, chapters=self.chapters, progress=self.progress
+            )
+        self.write_metrics()
+        return outputs
+
+
+class SfmBooksToOdt(Conversion):
+    """Get formatted text from several SFM files (e.g. one per language) and
+    create updated ODT files for each of them next to the destination dir.
+    Each ODT file is only read once."""
+
+    def __init__(self, sources=None, max_workers=1, **kwargs):
+        super().__init__(**kwargs)
+        if not sources:
+            raise ValueError("No SFM files were given.")
+        self.max_workers = max_workers
+        self.sfm_books = list()
+        for source in sources:
+            source = Path(source)
+            logging.info(f"Evaluating source path: {source}")
+            self._validate_path(source)
+            self.sfm_books.append(SfmBook(source, encoding=self.encoding))
+        logging.info(f"Evaluating destination path: {self.destination_path}")
+        self.odt_book = OdtBook(
+            self.destination_path,
+            normalization_mode=self.normalization_mode,
+            prefetch=self.prefetch,
+            max_open=self.max_open,
+            max_memory=self.max_memory,
+            slot_maps=self.slot_maps,
+            metrics=self.metrics,
+            preflight_workers=self.preflight_workers,
+        )
+
+    def run(self):
+        """Create updated ODT files in one folder per SFM file."""
+
+        timestamp = get_timestamp()
+        targets = dict()
+        for sfm_book in self.sfm_books:
+            new_dest_path = self.destination_path.with_name(
+                f"{self.destination_path.name}_{sfm_book.file_path.stem}_updated_{timestamp}"
+            )
+            targets[new_dest_path] = sfm_book
+        with self.metrics.run():
+            self.odt_book.update_texts(
+                targets,
+                chapters=self.chapters,
+                max_workers=self.max_workers,
+                progress=self.progress,
+            )
+        self.write_metrics()
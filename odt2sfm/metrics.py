@@ -0,0 +1,214 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+# Counters recorded for each chapter, and summed for the whole run.
+COUNTERS = (
+    "nodes_visited",
+    "paragraphs",
+    "spans",
+    "bytes_read",
+    "bytes_written",
+    "cache_hits",
+)
+METRIC_HELP = {
+    "nodes_visited": "XML elements visited while scanning ODT documents.",
+    "paragraphs": "Paragraphs produced (export) or read (import).",
+    "spans": "Spans produced (export) or read (import).",
+    "bytes_read": "Bytes of input files read.",
+    "bytes_written": "Bytes of output files written.",
+    "cache_hits": "Lookups answered from a cache (styles, slot maps).",
+    "wall_seconds": "Wall-clock time.",
+    "cpu_seconds": "CPU time (the chapter's thread, or the whole process).",
+}
+PROMETHEUS_PREFIX = "odt2sfm"
+
+
+class ChapterMetrics:
+    """Counters and times of converting one chapter (for one target)."""
+
+    def __init__(self, number, target=None):
+        self.number = number
+        self.target = target
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+
+    def add(self, name, value):
+        self.counts[name] += value
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return the metrics from their as_dict(), e.g. as sent by another
+        process."""
+        record = cls(data["chapter"], target=data["target"])
+        for name in COUNTERS:
+            record.counts[name] = data[name]
+        record.wall_seconds = data["wall_seconds"]
+        record.cpu_seconds = data["cpu_seconds"]
+        return record
+
+    def add_file_read(self, file_path):
+        self.add("bytes_read", Path(file_path).stat().st_size)
+
+    def add_file_written(self, file_path):
+        self.add("bytes_written", Path(file_path).stat().st_size)
+
+    def as_dict(self):
+        return {
+            "chapter": self.number,
+            "target": self.target,
+            **self.counts,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+        }
+
+
+class Metrics:
+    """Runtime metrics of one conversion run, and of each of its chapters, for
+    trending conversion cost. They can be written as a Prometheus textfile
+    (e.g. for node_exporter's textfile collector) or appended to a JSON lines
+    file."""
+
+    def __init__(self, conversion=None):
+        # Name of the conversion, e.g. "OdtToSfm", used as a label.
+        self.conversion = conversion
+        self.chapters = list()
+        # Counts that don't belong to any one chapter, e.g. the SFM file written.
+        self.counts = dict.fromkeys(COUNTERS, 0)
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.started = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def chapter(self, number, target=None):
+        """Time the work done in the with block for one chapter, yielding its
+        ChapterMetrics to add counts to. CPU time is the current thread's."""
+        record = ChapterMetrics(number, target=target)
+        wall_start = time.perf_counter()
+        cpu_start = time.thread_time()
+        try:
+            yield record
+        finally:
+            record.wall_seconds = time.perf_counter() - wall_start
+            record.cpu_seconds = time.thread_time() - cpu_start
+            with self._lock:
+                self.chapters.append(record)
+
+    @contextmanager
+    def run(self):
+        """Time the whole run. CPU time includes all of the process' threads."""
+        self.started = time.time()
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield self
+        finally:
+            self.wall_seconds = time.perf_counter() - wall_start
+            self.cpu_seconds = time.process_time() - cpu_start
+
+    def add(self, name, value):
+        with self._lock:
+            self.counts[name] += value
+
+    def add_chapter(self, record):
+        """Add the ChapterMetrics of a chapter converted elsewhere."""
+        with self._lock:
+            self.chapters.append(record)
+
+    @property
+    def totals(self):
+        """Return the run's counts, including those of all its chapters."""
+        totals = dict(self.counts)
+        for record in self.chapters:
+            for name, value in record.counts.items():
+                totals[name] += value
+        return totals
+
+    def as_dict(self):
+        return {
+            "conversion": self.conversion,
+            "started": self.started,
+            "chapters": len(self.chapters),
+            **self.totals,
+            "wall_seconds": round(self.wall_seconds, 6),
+            "cpu_seconds": round(self.cpu_seconds, 6),
+        }
+
+    def to_json_lines(self):
+        """Return one JSON line for the run, then one per chapter."""
+        lines = [json.dumps(dict(self.as_dict(), record="run"))]
+        for record in self.chapters:
+            lines.append(
+                json.dumps(
+                    dict(
+                        record.as_dict(),
+                        record="chapter",
+                        conversion=self.conversion,
+                        started=self.started,
+                    ),
+                    ensure_ascii=False,
+                )
+            )
+        return "\n".join(lines) + "\n"
+
+    def to_prometheus(self):
+        """Return the metrics in the Prometheus text exposition format."""
+        run_labels = self._labels(conversion=self.conversion)
+        run_values = dict(
+            self.totals,
+            wall_seconds=self.wall_seconds,
+            cpu_seconds=self.cpu_seconds,
+        )
+        lines = list()
+        for name, value in run_values.items():
+            metric = f"{PROMETHEUS_PREFIX}_{name}"
+            lines.append(f"# HELP {metric} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {metric} gauge")
+            lines.append(f"{metric}{run_labels} {value}")
+        for name in run_values:
+            metric = f"{PROMETHEUS_PREFIX}_chapter_{name}"
+            lines.append(f"# HELP {metric} {METRIC_HELP[name]}")
+            lines.append(f"# TYPE {metric} gauge")
+            for record in self.chapters:
+                labels = self._labels(
+                    conversion=self.conversion,
+                    chapter=record.number,
+                    target=record.target,
+                )
+                value = record.as_dict()[name]
+                lines.append(f"{metric}{labels} {value}")
+        lines.append(f"# TYPE {PROMETHEUS_PREFIX}_last_run_timestamp_seconds gauge")
+        lines.append(
+            f"{PROMETHEUS_PREFIX}_last_run_timestamp_seconds{run_labels} {self.started}"
+        )
+        return "\n".join(lines) + "\n"
+
+    @staticmethod
+    def _labels(**labels):
+        pairs = list()
+        for key, value in labels.items():
+            if value is None:
+                continue
+            value = str(value).replace("\\", "\\\\").replace('"', '\\"')
+            pairs.append(f'{key}="{value}"')
+        return f"{{{','.join(pairs)}}}" if pairs else ""
+
+    def write(self, file_path):
+        """Write the metrics to the given file: a ".prom" file is replaced by a
+        Prometheus textfile (atomically, so a collector never reads half of
+        it); any other file has JSON lines appended to it."""
+        file_path = Path(file_path)
+        if file_path.suffix == ".prom":
+            tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.tmp")
+            tmp_path.write_text(self.to_prometheus(), encoding="utf-8")
+            os.replace(tmp_path, file_path)
+        else:
+            with file_path.open("a", encoding="utf-8") as f:
+                f.write(self.to_json_lines())
+        logging.info(f"Metrics written to: {file_path}")
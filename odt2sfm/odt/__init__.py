@@ -1,27 +1,49 @@
+import hashlib
+import io
 import logging
 import re
+import zipfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
 from pathlib import Path
 
-from odfdo import Document
+from odfdo import Document, Element
 
 from ..base import (
-    SFM_ONLY_MARKERS,
+    NORMALIZATION_MODES,
+    get_peak_rss,
+    get_source_date_epoch,
     get_timestamp,
-    verify_paragraph_count,
-    verify_sfm_markers,
+    normalize_text,
+    parse_chapter_numbers,
+    partial_output_folder,
+    validate_timestamp_source,
+)
+from ..metrics import Metrics
+from ..progress import Progress
+from ..verification import (
+    ChapterVerification,
+    PreflightError,
+    verify_chapter,
+    verify_span_styles,
 )
 from .base import (
-    get_node_doc_style,
-    # get_node_row,
-    # get_node_table,
-    # get_node_table_pos,
-    node_has_paragraph_descendent_with_text,
-    # node_in_table,
+    clone_document,
+    get_doc_style,
+    get_node_row,
+    node_in_table,
 )
+from .annotations import OdtTextScan
+from .edits import TextEdits
+from .flat import FLAT_SUFFIX, ODT_SUFFIXES, read_flat_document, write_flat_document
 from .elements import (
     OdtParagraph,
-    # OdtTableRow,
+    OdtTableRow,
 )
+from .loader import OdtChapterLoader, OdtDocumentPool
+from .slots import SlotChapter, SlotMap
+from .tables import TableIndex, get_cell_table
 
 
 class OdtChapter:
@@ -29,22 +51,42 @@ class OdtChapter:
     "chapter" in Paratext."""
 
     RE_2_DIGITS = re.compile(r"(?<=L)[0-9]{2}")
-    RE_PIC = re.compile(r"\(Pictures/[0-9A-F]+\.[a-zA-Z1-9]{2,}\)")
+    # Rough ratio of parsed XML tree size to XML text size.
+    XML_MEMORY_FACTOR = 8
+    # Bytes of the ODT file read at a time when it's hashed.
+    HASH_CHUNK_SIZE = 1 << 20
 
-    def __init__(self, file_path=None):
+    def __init__(self, file_path=None, pool=None, data=None, styles_reference=None):
         if file_path is None:
             raise ValueError("No file path was given for this lesson.")
         else:
             self.file_path = Path(file_path)
-        if not self.file_path.is_file():
+        # The ODT file's bytes, or a binary stream of them, if the lesson is
+        # held in memory; file_path is then only used for its name.
+        self.data = data
+        if data is None and not self.file_path.is_file():
             raise ValueError(f"File does not exist: {self.file_path}")
+        # Text of a styles-reference file, used instead of searching for one.
+        self.styles_reference = styles_reference
 
+        # True when the document has changes that haven't been saved.
+        self.is_modified = False
+        # Lookups answered from the chapter's caches (styles, slot map).
+        self.cache_hits = 0
+        # Optional OdtDocumentPool that limits how many documents stay loaded.
+        self.pool = pool
         self._all_paragraphs = None
+        self._memory_estimate = None
         self._odt = None
         self._paragraphs = None
         self._styles_reference_file = None
         self._sfm_ref = None
         self._styles = None
+        self._table_indexes = dict()
+        self._text_scan = None
+        self._doc_styles = dict()
+        self._style_histogram = None
+        self._slot_map = None
 
     @property
     def all_paragraphs(self):
@@ -59,7 +101,7 @@ class OdtChapter:
                 f'Getting all "paragraphs" ("text:h", "text:p") in "{self.name}".'
             )
             self._all_paragraphs = [
-                p for p in self._get_elements_by_nstypes(self.odt, ("h", "p"))
+                Element.from_tag(p) for p in self.text_scan.paragraphs
             ]
         return self._all_paragraphs
 
@@ -67,14 +109,82 @@ class OdtChapter:
     def all_spans(self):
         return self.odt.body.spans
 
+    @property
+    def memory_estimate(self):
+        """Rough estimate, in bytes, of the memory used by the loaded document:
+        the size of its uncompressed parts, weighted for parsed XML."""
+        if self._memory_estimate is None:
+            if self.is_flat:
+                self._memory_estimate = self.size * self.XML_MEMORY_FACTOR
+                return self._memory_estimate
+            size = 0
+            with zipfile.ZipFile(self.open_data()) as odt_zip:
+                for info in odt_zip.infolist():
+                    if info.filename.endswith(".xml"):
+                        size += info.file_size * self.XML_MEMORY_FACTOR
+                    else:
+                        size += info.file_size
+            self._memory_estimate = size
+        return self._memory_estimate
+
+    @property
+    def size(self):
+        """Return the size in bytes of the ODT file, or of its data."""
+        if self.data is None:
+            return self.file_path.stat().st_size
+        elif isinstance(self.data, (bytes, bytearray, memoryview)):
+            return len(self.data)
+        return self.data.seek(0, io.SEEK_END)
+
+    @property
+    def mtime(self):
+        """Return the ODT file's modification time, or None for data."""
+        if self.data is None:
+            return self.file_path.stat().st_mtime
+        return None
+
+    def open_data(self):
+        """Return the ODT file's path, or a binary stream of its data from the
+        start; a stream can be read again, e.g. after the chapter has been
+        unloaded."""
+        if self.data is None:
+            return self.file_path
+        elif isinstance(self.data, (bytes, bytearray, memoryview)):
+            return io.BytesIO(self.data)
+        self.data.seek(0)
+        return self.data
+
+    def update_hash(self, hasher):
+        """Feed the chapter's inputs to the hashlib object: its name, the
+        bytes of its ODT file, and its styles reference."""
+        hasher.update(self.name.encode())
+        data = self.open_data()
+        stream = data.open("rb") if isinstance(data, Path) else nullcontext(data)
+        with stream as f:
+            for chunk in iter(lambda: f.read(self.HASH_CHUNK_SIZE), b""):
+                hasher.update(chunk)
+        hasher.update(self.styles_reference_text.encode())
+
+    @property
+    def is_flat(self):
+        """Whether the chapter is a flat (single XML) ODT file."""
+        return self.file_path.suffix == FLAT_SUFFIX
+
     @property
     def name(self):
         return self.file_path.name
 
     @property
     def number(self):
-        num_match = self.RE_2_DIGITS.search(self.file_path.stem)
-        if "TOC" in self.file_path.name:
+        return self.number_from_path(self.file_path)
+
+    @classmethod
+    def number_from_path(cls, file_path):
+        """Return the chapter number given by the ODT file's name: 0 for the
+        table of contents, otherwise the 2 digits following "L"."""
+        file_path = Path(file_path)
+        num_match = cls.RE_2_DIGITS.search(file_path.stem)
+        if "TOC" in file_path.name:
             return 0
         elif num_match:
             return int(num_match[0])
@@ -83,7 +193,12 @@ class OdtChapter:
     def odt(self):
         if self._odt is None:
             logging.info(f"Reading file: {self.file_path}")
-            self._odt = Document(self.file_path)
+            if self.is_flat:
+                self._odt = read_flat_document(self.open_data())
+            else:
+                self._odt = Document(self.open_data())
+            if self.pool is not None:
+                self.pool.loaded(self)
         return self._odt
 
     @property
@@ -93,79 +208,78 @@ class OdtChapter:
         if self._paragraphs is None:
             logging.info(f'Getting translatable paragraphs in "{self.name}"')
             paragraphs = []
-            # active_table = None
             for node in self.all_paragraphs:
-                for s in ("1:5–25", "1:57–64"):
-                    if s in str(node):
-                        logging.debug(
-                            f"FIXME: {node.text=}; {node.tail}; {node.children=}; {node.text_recursive=}"
-                        )
-                        for c in node.children:
-                            logging.debug(f"FIXME: {c.text=}; {c.tail=}; {c.children=}")
-                node_all_text = node.text_recursive
+                annotation = self.text_scan.get(node)
                 node_name = f"{node.tag}:{node.style}"
-                node_desc = f"{node_name}={node_all_text[:30]}..."
-                if len(node_all_text) == 0:
-                    logging.info(f" Skipping non-text node: {node_desc}")
+                node_desc = f"{node_name}={node.text[:30]}..."
+                if annotation.is_picture_only:
+                    # Ignore nodes with attachment-only "text".
+                    logging.info(f" Skipping node w/ no valid children: {node_desc}")
                     continue
-                # Ignore nodes with attachment-only "text".
-                if self.RE_PIC.sub("", node_all_text) == "":
-                    logging.info(
-                        f" Skipping node w/ no valid children: {node_name}/{node.children}={node_all_text[:30]}"
-                    )
+                if not annotation.has_text:
+                    logging.info(f" Skipping non-text node: {node_desc}")
                     continue
-                if get_node_doc_style(node, self.odt) not in self.styles:
+                if self.get_doc_style(node.style) not in self.styles:
                     logging.info(f" Skipping node w/ ignored style: {node_desc}")
                     continue
                 # Ignore nodes that have no text of their own and have at least
                 # one paragraph with text among their descendants.
                 if (
-                    not node.text
-                    and not any(c.tail for c in node.children)
-                    and node_has_paragraph_descendent_with_text(node)
+                    not annotation.has_own_text
+                    and annotation.has_text_paragraph_descendant
                 ):
                     logging.info(
-                        f" Skipping node whose text comes from a descendent paragraph: {node_name}/{node.children}={node_all_text[:30]}"
+                        f" Skipping node whose text comes from a descendent paragraph: {node_desc}"
                     )
                     continue
-                """
                 if node_in_table(node):
+                    cell = node._xml_element.getparent()
+                    index = self.get_table_index(cell)
+                    row_idx, col_idx = index.position(cell)
                     logging.info(
-                        f" Handling table node: {active_table=}/{get_node_table_pos(node)}:{node_desc}"
+                        f" Handling table node: ({row_idx}, {col_idx}):{node_desc}"
                     )
-                    if active_table is None:
-                        active_table = get_node_table(node)._xml_element
-                    elif active_table is not get_node_table(node)._xml_element:
-                        raise ValueError(
-                            "New table found before previous table finished."
-                        )
-                    row, col = get_node_table_pos(node)
-                    logging.debug(f"cell pos: ({row}, {col})")
                     # Ensure TableRow paragraph.
-                    if not isinstance(paragraphs[-1], OdtTableRow):
+                    row = cell.getparent()
+                    if not (
+                        paragraphs
+                        and isinstance(paragraphs[-1], OdtTableRow)
+                        and paragraphs[-1].node._xml_element is row
+                    ):
                         paragraphs.append(OdtTableRow(get_node_row(node), chapter=self))
-                    # Update previous Table paragraph with new cell data.
-                    p = paragraphs[-1]
-                    logging.debug(f"{type(p)}:{p.children=}; {p.text_recursive=}")
-                    p.add_cell(node, col)
-                    logging.debug(f"{type(p)}:{p.children=}; {p.text_recursive=}")
+                    # Update Table paragraph with new cell data.
+                    paragraphs[-1].add_cell(node, col_idx, header=index.is_header(cell))
                     continue
-                else:
-                    active_table = None
-                """
 
                 paragraphs.append(OdtParagraph(node, chapter=self))
             self._paragraphs = paragraphs
         return self._paragraphs
 
+    @property
+    def nodes_visited(self):
+        """Return the number of XML elements visited to scan the document's
+        text, or 0 if it hasn't been scanned."""
+        if self._text_scan is None:
+            return 0
+        return self._text_scan.nodes
+
+    @property
+    def text_scan(self):
+        """Return the OdtTextScan of the document's body: its paragraphs, and
+        their text annotations, found in a single walk."""
+        if self._text_scan is None:
+            logging.info(f'Scanning text of "{self.name}"')
+            self._text_scan = OdtTextScan(self.odt.body._xml_element)
+        return self._text_scan
+
     @property
     def sfm_ref(self):
         if not self._sfm_ref:
             logging.info(
-                f"Building SFM reference dict from {self.styles_reference_file}"
+                f"Building SFM reference dict from {self.styles_reference_name}"
             )
             self._sfm_ref = dict()
-            for line in self.styles_reference_file.read_text().splitlines():
+            for line in self.styles_reference_text.splitlines():
                 line = line.strip()
                 if line.startswith("#"):  # skip commented lines
                     continue
@@ -185,6 +299,19 @@ class OdtChapter:
         else:
             self._sfm_ref = value
 
+    @property
+    def styles_reference_text(self):
+        if self.styles_reference is not None:
+            return self.styles_reference
+        return self.styles_reference_file.read_text()
+
+    @property
+    def styles_reference_name(self):
+        """Return where the chapter's SFM markers come from, for messages."""
+        if self.styles_reference is not None:
+            return "the given styles reference"
+        return str(self.styles_reference_file)
+
     @property
     def styles_reference_file(self):
         if self._styles_reference_file is None:
@@ -210,6 +337,53 @@ class OdtChapter:
             )
         return self._styles_reference_file
 
+    def clone(self):
+        """Return a copy of this chapter, with a deep copy of its parsed
+        document, that can be updated and saved independently. Nothing is
+        read from the file again, and the chapter's styles and text scan are
+        reused."""
+        odt = self.odt
+        chapter = OdtChapter(
+            self.file_path, data=self.data, styles_reference=self.styles_reference
+        )
+        chapter._odt = clone_document(odt)
+        chapter._sfm_ref = self._sfm_ref
+        chapter._styles_reference_file = self._styles_reference_file
+        chapter._styles = self._styles
+        chapter._style_histogram = self._style_histogram
+        chapter._text_scan = self.text_scan.copy(chapter.odt.body._xml_element)
+        chapter._slot_map = self._slot_map
+        return chapter
+
+    @property
+    def slot_chapter(self):
+        """Return the chapter's slot map bound to its document, to verify and
+        update the document without re-deriving its paragraphs."""
+        return SlotChapter(self.slot_map, self.odt, number=self.number)
+
+    @property
+    def slot_map(self):
+        """Return the chapter's SlotMap, saved next to the ODT file, which is
+        compiled only if the file or its styles have changed."""
+        if self._slot_map is None:
+            self._slot_map = SlotMap.for_chapter(self)
+            if not self._slot_map.compiled:
+                self.cache_hits += 1
+        return self._slot_map
+
+    @property
+    def style_histogram(self):
+        """Return a Counter of the Document styles used by paragraphs and spans
+        that have text."""
+        if self._style_histogram is None:
+            histogram = Counter()
+            for style, count in self.text_scan.style_counts.items():
+                # Get the Document style (many nodes have a Content style
+                # defined instead.)
+                histogram[self.get_doc_style(style)] += count
+            self._style_histogram = histogram
+        return self._style_histogram
+
     @property
     def styles(self):
         """Return list of valid styles for translatable paragraphs and spans."""
@@ -217,51 +391,81 @@ class OdtChapter:
         if self._styles is None:
             logging.info(f'Getting valid styles from "{self.name}"')
             styles = dict()
-            nodes = [n for n in self.all_paragraphs]
-            nodes.extend([n for n in self.all_spans])
-            for node in nodes:
-                # Ignore items with no style info.
-                if node.style is None:
-                    continue
-                # Ignore items with no text.
-                if len(node.text_recursive) == 0:
-                    continue
-                # Get node's Document style (many nodes have a Content style
-                # defined instead.)
-                style = get_node_doc_style(node, self.odt)
+            for style in self.style_histogram:
                 if style in self.sfm_ref.keys():
                     styles[style] = self.sfm_ref.get(style)
             self._styles = styles
+            unmapped = self.unmapped_styles
+            if unmapped:
+                logging.info(f'Styles with no SFM marker in "{self.name}": {unmapped}')
         return self._styles
 
-    def _get_elements_by_nstypes(self, node, nstypes, accumulator=None):
-        """Return valid "header" and "paragraph" elements in document order to
-        preserve indexing."""
-
-        qnames = [f"text:{t}" for t in nstypes]
-        if accumulator is None:
-            accumulator = list()
-
-        # If "node" is a document, choose its top Node.
-        if not hasattr(node, "tag"):
-            node = node.body
+    @property
+    def unmapped_styles(self):
+        """Return the styles used for text that have no SFM marker in the
+        styles-reference file, with how often each is used, most used
+        first."""
+        return {
+            style: count
+            for style, count in self.style_histogram.most_common()
+            if style not in self.sfm_ref
+        }
 
-        if node.tag in qnames:
-            accumulator.append(node)
+    def get_doc_style(self, style):
+        """Return the Document style of the given style name, looking it up
+        only once per chapter."""
+        if style is None:
+            return None
+        if style in self._doc_styles:
+            self.cache_hits += 1
+        else:
+            self._doc_styles[style] = get_doc_style(style, self.odt)
+        return self._doc_styles[style]
 
-        for c in node.children:
-            accumulator = self._get_elements_by_nstypes(c, nstypes, accumulator)
+    def get_table_index(self, cell):
+        """Return the TableIndex of the table containing the given XML cell
+        element, building it on first use."""
+        table = get_cell_table(cell)
+        index = self._table_indexes.get(table)
+        if index is None:
+            logging.debug(f"Indexing table cells: {table}")
+            index = TableIndex(table)
+            self._table_indexes[table] = index
+        return index
 
-        return accumulator
+    def load(self):
+        """Read, decompress, and parse the ODT file now rather than on first
+        use. Safe to call from a background thread."""
+        _ = self.odt.body
+        return self
 
     def save(self, file_path):
         lock_file = file_path.parent / f".~lock.{self.file_path.name}#"
         if lock_file.is_file():
             raise OSError(f"Can't save; file already open: {self.file_path}")
         logging.info(f"Saving ODT to: {file_path}")
-        self.odt.save(str(file_path))
+        if Path(file_path).suffix == FLAT_SUFFIX:
+            write_flat_document(self.odt, file_path)
+        else:
+            self.odt.save(str(file_path))
+        self.is_modified = False
+
+    def to_bytes(self, flat=None):
+        """Return the document as the bytes of a zipped ODT file, or of a flat
+        one if flat is True; by default, in the chapter's own format."""
+        if flat is None:
+            flat = self.is_flat
+        output = io.BytesIO()
+        if flat:
+            write_flat_document(self.odt, output)
+        else:
+            self.odt.save(output)
+        self.is_modified = False
+        return output.getvalue()
 
-    def to_sfm(self, normalization_mode):
+    def to_sfm(self, normalization_mode, progress=None):
+        """Return the chapter's SFM text, reporting each paragraph to the
+        optional Progress."""
         logging.info(f'Generating SFM output for "{self.name}"')
         # Initialize data.
         out_text = list()
@@ -270,8 +474,10 @@ class OdtChapter:
             out_text.append(f"\\c {self.number}")
         # Add lines from ODT document.
         for paragraph in self.paragraphs:
-            # Ignore paragraphs with no style info.
-            if paragraph.style is None:
+            if progress is not None:
+                progress.paragraph_done()
+            # Ignore paragraphs with no style info (and so no SFM marker).
+            if paragraph.sfm_marker is None:
                 continue
             # Ignore paragraphs with no text.
             if len(paragraph.text_recursive) == 0:
@@ -281,33 +487,122 @@ class OdtChapter:
 
         return "\n".join(out_text)
 
-    def update_text(self, sfm_chapter, normalization_mode):
-        sfm_paragraphs = [
-            p for p in sfm_chapter.paragraphs if p.marker not in SFM_ONLY_MARKERS
-        ]
-        for i, odt_p in enumerate(self.paragraphs):
-            logging.debug(f"Checking paragraph: {odt_p.intro}")
-            odt_p.update_text(sfm_paragraphs[i], normalization_mode)
+    def update_text(
+        self, sfm_chapter, normalization_mode, verification=None, progress=None
+    ):
+        """Update the text of ODT paragraphs from their aligned SFM paragraphs.
+        If no verification is given, the chapter is verified first. Each
+        updated paragraph is reported to the optional Progress. The changed
+        texts are collected first and then written to the document in one
+        pass. Return the verification, whose report lists every paragraph that
+        was not updated."""
+        if verification is None:
+            verification = verify_chapter(sfm_chapter, self, normalization_mode)
+        if progress is not None:
+            progress.paragraphs_total = len(verification.pairs)
+        edits = TextEdits()
+        log_paragraphs = logging.getLogger().isEnabledFor(logging.DEBUG)
+        for sfm_p, odt_p in verification.pairs:
+            if log_paragraphs:
+                logging.debug(f"Updating paragraph: {odt_p.intro}")
+            odt_p.update_children(sfm_p, normalization_mode, edits=edits)
+            if progress is not None:
+                progress.paragraph_done()
+        if len(edits):
+            logging.info(f"Writing {len(edits)} changed texts to {self.name}")
+            edits.apply()
+            self.is_modified = True
+        return verification
+
+    def unload(self):
+        """Release the parsed document and the paragraphs that refer to its
+        nodes. It will be read again from the file if needed."""
+        if self.is_modified:
+            raise ValueError(f"Can't unload unsaved changes in {self.name}")
+        self._all_paragraphs = None
+        self._odt = None
+        self._paragraphs = None
+        self._table_indexes = dict()
+        self._text_scan = None
+        self._doc_styles = dict()
+        if self.pool is not None:
+            self.pool.unloaded(self)
 
     def __str__(self):
         return self.name
 
 
+class SfmExportTarget:
+    """One SFM output of a book's export: its normalization mode, its book ID
+    (by default, the one given by the book's filename), and the file it's
+    written to, if any."""
+
+    def __init__(self, normalization_mode, book_id=None, destination=None):
+        if normalization_mode not in NORMALIZATION_MODES:
+            raise ValueError(f"Invalid normalization mode: {normalization_mode}")
+        self.normalization_mode = normalization_mode
+        self.book_id = book_id
+        self.destination = Path(destination) if destination is not None else None
+
+    def __str__(self):
+        name = self.destination.name if self.destination else self.book_id
+        return f"{name} ({self.normalization_mode})"
+
+
 class OdtBook:
     """The full content of all of "Lessons from Luke" lessons, which is a
     sequence of ODT files in a single parent folder."""
 
     RE_BOOK_ID = re.compile(r"(?<=[0-9])[A-Z]{3}")
 
-    def __init__(self, dir=None, lang=None, filename=None, normalization_mode=None):
+    def __init__(
+        self,
+        dir=None,
+        lang=None,
+        filename=None,
+        normalization_mode=None,
+        prefetch=2,
+        max_open=8,
+        max_memory=None,
+        slot_maps=False,
+        metrics=None,
+        preflight_workers=4,
+        lessons=None,
+        styles_reference=None,
+        timestamp_source=None,
+    ):
+        self._chapter_paths = None
+        self._chapters = dict()
         self._dir_path = None
         self.filename = filename
         self._language = lang
-        if dir is None:
+        # ODT files held in memory, as {filename: bytes or binary stream},
+        # instead of the files in a folder.
+        self.lessons = lessons
+        # Text of the styles-reference file, instead of searching for one.
+        self.styles_reference = styles_reference
+        if lessons is not None:
+            if dir is not None:
+                self.dir_path = dir
+        elif dir is None:
             raise ValueError("No folder was given.")
         else:
             self.dir_path = dir
         self.normalization_mode = normalization_mode
+        # Number of chapters to load in the background ahead of the current one.
+        self.prefetch = prefetch
+        # Limit the number of chapter documents (or bytes) kept in memory.
+        self.pool = OdtDocumentPool(max_open=max_open, max_memory=max_memory)
+        # Import using slot maps that are saved next to the ODT files.
+        self.slot_maps = slot_maps
+        # Per-chapter runtime metrics of exports and imports.
+        self.metrics = metrics if metrics is not None else Metrics()
+        # Number of chapters verified at a time before an import updates any
+        # of them; 0 to skip this preflight.
+        self.preflight_workers = preflight_workers
+        # Where the export's timestamp comes from, for reproducible output:
+        # "mtime", "epoch", or a fixed YYYY-MM-DD date; None for today.
+        self.timestamp_source = validate_timestamp_source(timestamp_source)
 
     def __str__(self):
         return self.name
@@ -333,59 +628,178 @@ class OdtBook:
     def language(self, value):
         self._language = str(value)
 
+    @property
+    def chapter_paths(self):
+        """Map chapter numbers to ODT files using only their filenames, so no
+        file needs to be opened."""
+        if self._chapter_paths is None:
+            logging.info(f'Getting chapters for "{self.name}"')
+            chapter_paths = dict()
+            if self.lessons is not None:
+                names = [Path(name) for name in self.lessons]
+            else:
+                names = self.dir_path.iterdir()
+            chapter_files = sorted([f for f in names if f.suffix in ODT_SUFFIXES])
+            for lf in chapter_files:
+                chapter_paths[OdtChapter.number_from_path(lf)] = lf
+            self._chapter_paths = chapter_paths
+        return self._chapter_paths
+
     @property
     def chapters(self):
-        logging.info(f'Getting chapters for "{self.name}"')
+        return self.get_chapters()
+
+    def get_chapters(self, numbers=None):
+        """Return {number: OdtChapter} for the given chapter numbers, or for
+        all chapters if None. Chapters without an ODT file are left out."""
+        if numbers is None:
+            numbers = self.chapter_paths.keys()
         chapters = dict()
-        chapter_files = sorted(
-            [f for f in self.dir_path.iterdir() if f.suffix == ".odt"]
-        )
-        for lf in chapter_files:
-            chapter = OdtChapter(lf)
-            chapters[chapter.number] = chapter
+        for n in numbers:
+            if n not in self._chapters:
+                file_path = self.chapter_paths.get(n)
+                if file_path is None:
+                    logging.warning(f'No ODT file for ch. {n} in "{self.name}"')
+                    continue
+                data = None
+                if self.lessons is not None:
+                    data = self.lessons[file_path.name]
+                self._chapters[n] = OdtChapter(
+                    file_path,
+                    pool=self.pool,
+                    data=data,
+                    styles_reference=self.styles_reference,
+                )
+            chapters[n] = self._chapters[n]
         return chapters
 
     @property
     def name(self):
+        if self.dir_path is None:
+            return self.filename or ""
         return self.dir_path.name
 
+    @property
+    def is_reproducible(self):
+        """Whether exports are reproducible: their timestamp doesn't depend on
+        the day they're made, and their header has a hash of their inputs.
+        Setting SOURCE_DATE_EPOCH makes them reproducible by default."""
+        return self.timestamp_source is not None or get_source_date_epoch() is not None
+
+    def timestamp(self, chapters=None):
+        """Return the date of an export of the chapters: today's, unless it's
+        reproducible; then the newest ODT file's ("mtime"), SOURCE_DATE_EPOCH's
+        ("epoch", or by default when it's set), or the fixed date given."""
+        source = self.timestamp_source
+        if source is None:
+            if get_source_date_epoch() is None:
+                return get_timestamp()
+            source = "epoch"
+        if source == "epoch":
+            epoch = get_source_date_epoch()
+            if epoch is None:
+                raise ValueError("SOURCE_DATE_EPOCH is not set.")
+            return get_timestamp(epoch)
+        elif source == "mtime":
+            mtimes = [c.mtime for c in chapters or []]
+            if not mtimes or None in mtimes:
+                raise ValueError("No ODT file modification times to use.")
+            return get_timestamp(max(mtimes))
+        return source
+
     @staticmethod
-    def timestamp():
-        return get_timestamp()
+    def content_hash(chapters):
+        """Return a hash of the chapters' inputs, which is the same for any
+        export of the same ODT files and styles references."""
+        hasher = hashlib.blake2b(digest_size=16)
+        for chapter in chapters:
+            chapter.update_hash(hasher)
+        return hasher.hexdigest()
+
+    @property
+    def book_id(self):
+        """Return the book ID given by the book's filename, e.g. "01LUK"."""
+        r = self.RE_BOOK_ID.search(self.filename or "")
+        logging.debug(f"{r=}")
+        if r is None:
+            raise ValueError(f"No book ID in filename: {self.filename}")
+        return r[0]
 
-    def to_sfm(self, chapters="all"):
+    def to_sfm(self, chapters="all", progress=None):
+        """Return the SFM text of the book, or of some of its chapters, given
+        as e.g. "3,4" or "1-5,7". Only the chosen chapters' files are read.
+        Chapters and paragraphs are reported to the optional Progress, which
+        can also cancel the export before any chapter."""
         if self.normalization_mode is None:
             raise ValueError("Character normalization mode not specified.")
+        target = SfmExportTarget(self.normalization_mode)
+        return self.to_sfm_targets([target], chapters=chapters, progress=progress)[0]
+
+    def to_sfm_targets(self, targets, chapters="all", progress=None):
+        """Return the SFM text of the book for each SfmExportTarget, in the
+        same order. Each chapter is parsed and exported once, without
+        normalization, and its text is then normalized for each target, which
+        gives the same text as exporting it in that target's mode."""
+        if progress is None:
+            progress = Progress()
         logging.info(f'Generating SFM output for book "{self.name}"')
-        # Initialize data.
-        out_text = list()
-        # Add "book" info.
-        r = self.RE_BOOK_ID.search(self.filename)
-        logging.debug(f"{r=}")
-        book_id = r[0]
+        # Add lines from given chapter numbers.
+        chs = self.get_chapters(parse_chapter_numbers(chapters))
 
-        out_text.append(f'\\id {book_id} "{self.name}", Sango [sag] translation')
-        out_text.append(
-            f'\\rem Initial import to SFM by nate_marti@sil.org using Python module "odt2sfm" (https://github.com/sil-car/lfl-odt2sfm) on {self.timestamp()}'
-        )
-        out_text.append("\\usfm 3.0")
+        # Handle TOC chapter (if included), then remaining chapters.
+        toc = chs.pop(0, None)
+        ordered = [toc] if toc else []
+        ordered.extend(chs.values())
+        # Initialize data, with "book" info.
+        out_texts = self.sfm_headers(targets, ordered)
+        progress.start(len(ordered))
+        for chapter in OdtChapterLoader(ordered, prefetch=self.prefetch):
+            with self.pool.pin(chapter), self.metrics.chapter(chapter.number) as m:
+                # Hits from earlier work on the chapter aren't counted again.
+                cache_hits = chapter.cache_hits
+                progress.start_chapter(chapter.number, len(chapter.paragraphs))
+                sfm = chapter.to_sfm(None, progress=progress)
+                for target, out_text in zip(targets, out_texts):
+                    text = normalize_text(target.normalization_mode, sfm)
+                    out_text.extend(text.splitlines())
+                m.add("bytes_read", chapter.size)
+                m.add("nodes_visited", chapter.nodes_visited)
+                m.add("paragraphs", len(chapter.paragraphs))
+                m.add("spans", sum(len(p.spans) for p in chapter.paragraphs))
+                m.add("cache_hits", chapter.cache_hits - cache_hits)
+            progress.chapter_done()
+        self.log_memory()
 
-        # Add lines from given chapter numbers.
-        if chapters == "all":
-            chs = self.chapters.copy()
-        else:
-            ch_nums = chapters.split(",")
-            ch_nums = [int(n) for n in ch_nums]
-            chs = {i: self.chapters.get(i) for i in ch_nums}
-
-        # Handle TOC chapter.
-        toc = chs.pop(0)
-        if toc:
-            out_text.extend(toc.to_sfm(self.normalization_mode).splitlines())
-        # Handle remaining chapters.
-        for n, chapter in chs.items():
-            out_text.extend(chapter.to_sfm(self.normalization_mode).splitlines())
+        return [self.join_sfm_lines(out_text) for out_text in out_texts]
 
+    def sfm_header(self, book_id=None, timestamp=None, content_hash=None):
+        """Return the lines that start the book's SFM text; the book ID is by
+        default the one given by the book's filename. A content hash of the
+        inputs is added as a remark if given."""
+        book_id = book_id or self.book_id
+        timestamp = timestamp or self.timestamp()
+        lines = [
+            f'\\id {book_id} "{self.name}", Sango [sag] translation',
+            f'\\rem Initial import to SFM by nate_marti@sil.org using Python module "odt2sfm" (https://github.com/sil-car/lfl-odt2sfm) on {timestamp}',
+        ]
+        if content_hash is not None:
+            lines.append(f"\\rem Content hash: blake2b:{content_hash}")
+        lines.append("\\usfm 3.0")
+        return lines
+
+    def sfm_headers(self, targets, chapters):
+        """Return the header lines of an export of the chapters for each
+        SfmExportTarget. A reproducible export's header has the same
+        timestamp and a hash of the chapters' inputs, so that it only changes
+        when they do."""
+        timestamp = self.timestamp(chapters)
+        content_hash = None
+        if self.is_reproducible:
+            content_hash = self.content_hash(chapters)
+        return [self.sfm_header(t.book_id, timestamp, content_hash) for t in targets]
+
+    @staticmethod
+    def join_sfm_lines(out_text):
         logging.debug(f"Writing out {len(out_text)} lines of SFM text data.")
         sfm_text_data = "\n".join(out_text)
         # Add final newline.
@@ -393,26 +807,297 @@ class OdtBook:
             sfm_text_data += "\n"
         return sfm_text_data
 
-    def update_text(self, sfm_book, new_dest_path):
+    def update_text(self, sfm_book, new_dest_path, chapters="all", progress=None):
+        """Update the book's ODT files from the SFM book's text, saving them in
+        the new destination folder. Updates can be limited to some chapters,
+        given as e.g. "3,4" or "1-5,7"; only those chapters are parsed.
+        Chapters and paragraphs are reported to the optional Progress, which
+        can also cancel the import before any chapter. Files are saved in a
+        temporary folder that only becomes the destination folder once every
+        chapter is done. Unless preflight is turned off, every chapter is
+        verified first, and nothing is updated if any of them has errors."""
         if self.normalization_mode is None:
             raise ValueError("Character normalization mode not specified.")
+        if progress is None:
+            progress = Progress()
+
+        verifications = list()
+        sfm_chapters = sfm_book.get_chapters(parse_chapter_numbers(chapters))
+        checked = dict()
+        if self.preflight_workers:
+            checked = self.preflight(
+                {new_dest_path.name: sfm_chapters}, progress=progress
+            )
+            checked = {v.number: v for v in checked[new_dest_path.name]}
+        odt_chapters = self.get_chapters([c.number for c in sfm_chapters])
+        odt_chapters = [odt_chapters.get(c.number) for c in sfm_chapters]
+        loader = OdtChapterLoader(odt_chapters, prefetch=self.prefetch)
+        progress.start(len(sfm_chapters))
+        with partial_output_folder(new_dest_path) as partial_path:
+            for sfm_chapter, odt_chapter in zip(sfm_chapters, loader):
+                progress.start_chapter(sfm_chapter.number)
+                pinned = self.pool.pin(odt_chapter) if odt_chapter else nullcontext()
+                with pinned:
+                    verifications.append(
+                        self._update_chapter(
+                            sfm_chapter,
+                            odt_chapter,
+                            partial_path,
+                            target_name=new_dest_path.name,
+                            progress=progress,
+                            verification=checked.get(sfm_chapter.number),
+                        )
+                    )
+                progress.chapter_done()
+        self.log_memory()
+        return verifications
 
-        for sfm_chapter in sfm_book.chapters:
+    def update_text_in_memory(self, sfm_book, chapters="all", progress=None):
+        """Update the book's ODT documents from the SFM book's text, like
+        update_text, but without writing any files: return the updated files'
+        bytes, as {filename: bytes}, and the verifications."""
+        if self.normalization_mode is None:
+            raise ValueError("Character normalization mode not specified.")
+        if progress is None:
+            progress = Progress()
+
+        outputs = dict()
+        verifications = list()
+        sfm_chapters = sfm_book.get_chapters(parse_chapter_numbers(chapters))
+        checked = dict()
+        if self.preflight_workers:
+            checked = self.preflight({self.name: sfm_chapters}, progress=progress)
+            checked = {v.number: v for v in checked[self.name]}
+        odt_chapters = self.get_chapters([c.number for c in sfm_chapters])
+        progress.start(len(sfm_chapters))
+        for sfm_chapter in sfm_chapters:
+            progress.start_chapter(sfm_chapter.number)
+            odt_chapter = odt_chapters.get(sfm_chapter.number)
+            pinned = self.pool.pin(odt_chapter) if odt_chapter else nullcontext()
+            with pinned:
+                verifications.append(
+                    self._update_chapter(
+                        sfm_chapter,
+                        odt_chapter,
+                        None,
+                        target_name=self.name,
+                        progress=progress,
+                        outputs=outputs,
+                        verification=checked.get(sfm_chapter.number),
+                    )
+                )
+            progress.chapter_done()
+        return outputs, verifications
+
+    def update_texts(self, targets, chapters="all", max_workers=1, progress=None):
+        """Update copies of the book's ODT files from several SFM books (e.g.
+        one per language), given as {new_dest_path: sfm_book}. Each ODT file
+        is read and parsed only once: every SFM book's chapter is applied to
+        a deep copy of the parsed document, which is saved in that book's
+        destination folder. Up to max_workers targets are updated at the same
+        time. Each target's chapter counts as a chapter of the optional
+        Progress, which can cancel the import between ODT files; destination
+        folders only appear once every chapter is done. Unless preflight is
+        turned off, every target's chapters are verified first, and nothing is
+        updated if any of them has errors. Return
+        {new_dest_path: verifications}."""
+        if self.normalization_mode is None:
+            raise ValueError("Character normalization mode not specified.")
+        if progress is None:
+            progress = Progress()
+
+        numbers = parse_chapter_numbers(chapters)
+        sfm_chapters = dict()
+        for new_dest_path, sfm_book in targets.items():
+            sfm_chapters[Path(new_dest_path)] = {
+                c.number: c for c in sfm_book.get_chapters(numbers)
+            }
+        checked = {new_dest_path.name: dict() for new_dest_path in sfm_chapters}
+        if self.preflight_workers:
+            results = self.preflight(
+                {
+                    new_dest_path.name: list(chapters_by_number.values())
+                    for new_dest_path, chapters_by_number in sfm_chapters.items()
+                },
+                progress=progress,
+            )
+            checked = {
+                name: {v.number: v for v in verifications}
+                for name, verifications in results.items()
+            }
+        verifications = {new_dest_path: list() for new_dest_path in sfm_chapters}
+        chapter_numbers = sorted(set().union(*sfm_chapters.values()))
+        odt_chapters = self.get_chapters(chapter_numbers)
+        odt_chapters = [odt_chapters.get(n) for n in chapter_numbers]
+        loader = OdtChapterLoader(odt_chapters, prefetch=self.prefetch)
+        progress.start(sum(len(c) for c in sfm_chapters.values()))
+        with ExitStack() as stack, ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="odt-update"
+        ) as executor:
+            partial_paths = {
+                new_dest_path: stack.enter_context(partial_output_folder(new_dest_path))
+                for new_dest_path in sfm_chapters
+            }
+            for number, odt_chapter in zip(chapter_numbers, loader):
+                progress.check()
+                pinned = self.pool.pin(odt_chapter) if odt_chapter else nullcontext()
+                with pinned:
+                    jobs = list()
+                    for new_dest_path, chapters_by_number in sfm_chapters.items():
+                        sfm_chapter = chapters_by_number.get(number)
+                        if sfm_chapter is None:
+                            continue
+                        # Copies are made here, so that only the copies are
+                        # shared with other threads.
+                        odt_copy = odt_chapter.clone() if odt_chapter else None
+                        job = executor.submit(
+                            self._update_chapter,
+                            sfm_chapter,
+                            odt_copy,
+                            partial_paths[new_dest_path],
+                            count_odt_read=False,
+                            target_name=new_dest_path.name,
+                            verification=checked[new_dest_path.name].get(number),
+                        )
+                        jobs.append((new_dest_path, job))
+                    for new_dest_path, job in jobs:
+                        verifications[new_dest_path].append(job.result())
+                        progress.chapter_done()
+                    if odt_chapter is not None:
+                        # The file is read and scanned once, for all targets.
+                        self.metrics.add("bytes_read", odt_chapter.size)
+                        self.metrics.add("nodes_visited", odt_chapter.nodes_visited)
+        self.log_memory()
+        return verifications
+
+    def preflight(self, targets, progress=None):
+        """Verify the SFM chapters of each target, given as
+        {target_name: [sfm_chapter, ...]}, against the book's ODT chapters,
+        before any of them is updated: paragraph counts, markers/styles, child
+        counts, and span styles with no SFM marker in styles-reference.txt.
+        Up to preflight_workers ODT chapters are checked at a time; each is
+        checked against all of the targets by the same thread. Raise a
+        PreflightError if any chapter has errors; otherwise return
+        {target_name: verifications}, which keep only their reports and
+        paragraph indexes, to be bound again when the chapters are updated."""
+        numbers = sorted({c.number for cs in targets.values() for c in cs})
+        odt_chapters = self.get_chapters(numbers)
+        logging.info(f'Preflight of {len(numbers)} chapters of "{self.name}"')
+
+        def check(number):
+            if progress is not None:
+                progress.check()
+            odt_chapter = odt_chapters.get(number)
+            pinned = self.pool.pin(odt_chapter) if odt_chapter else nullcontext()
+            with pinned:
+                return {
+                    name: self._preflight_chapter(sfm_chapter, odt_chapter)
+                    for name, sfm_chapters in targets.items()
+                    for sfm_chapter in sfm_chapters
+                    if sfm_chapter.number == number
+                }
+
+        with ThreadPoolExecutor(
+            max_workers=self.preflight_workers, thread_name_prefix="odt-preflight"
+        ) as executor:
+            results = list(executor.map(check, numbers))
+        verifications = {name: list() for name in targets}
+        failed = list()
+        for result in results:
+            for name, verification in result.items():
+                verifications[name].append(verification)
+                if not verification.ok:
+                    verification.log()
+                    failed.append(verification)
+        if failed:
+            raise PreflightError(failed)
+        return verifications
+
+    def _preflight_chapter(self, sfm_chapter, odt_chapter):
+        """Return the released verification of one chapter for preflight."""
+        try:
+            target = odt_chapter
+            if self.slot_maps and odt_chapter is not None:
+                target = odt_chapter.slot_chapter
+            verification = verify_chapter(sfm_chapter, target, self.normalization_mode)
+            if odt_chapter is not None:
+                verify_span_styles(odt_chapter, verification)
+        except ValueError as e:
+            # E.g. there's no styles-reference file.
+            verification = ChapterVerification(sfm_chapter.number)
+            verification.add("styles", str(e))
+        verification.release()
+        return verification
+
+    def _update_chapter(
+        self,
+        sfm_chapter,
+        odt_chapter,
+        new_dest_path,
+        count_odt_read=True,
+        target_name=None,
+        progress=None,
+        outputs=None,
+        verification=None,
+    ):
+        """Verify the ODT chapter against the SFM chapter, then update it and
+        save it in the new destination folder, or put its bytes in the
+        outputs dict if one is given. A verification from preflight() is
+        bound to the chapter instead of verifying it again. Return the
+        verification."""
+        with self.metrics.chapter(sfm_chapter.number, target_name) as m:
+            # Hits from earlier work on the chapter (e.g. its preflight) aren't
+            # counted again.
+            cache_hits = odt_chapter.cache_hits if odt_chapter is not None else 0
             logging.info(f"Evaluating SFM chapter: {sfm_chapter.number}")
-            odt_chapter = self.chapters.get(sfm_chapter.number)
-            # Compare paragraph counts in original data and updated data.
-            verify_paragraph_count(sfm_chapter, odt_chapter)
-            # Ensure that SFM marker is correct for ODT paragraph (or span) style.
-            verify_sfm_markers(sfm_chapter, odt_chapter)
-            # Ensure updated ODT folder exists.
-            new_dest_path.mkdir(exist_ok=True)
-            # Make copy of original ODT into updated folder.
-            odt_new_file = new_dest_path / odt_chapter.file_path.name
+            m.add("bytes_read", len(sfm_chapter.sfm_raw.encode("utf-8")))
+            m.add("paragraphs", len(sfm_chapter.body_paragraphs))
+            m.add("spans", sum(len(p.spans) for p in sfm_chapter.body_paragraphs))
+            target = odt_chapter
+            if self.slot_maps and odt_chapter is not None:
+                # Verify and fill the chapter's precompiled slots.
+                target = odt_chapter.slot_chapter
+            if verification is None:
+                # Check paragraph counts, markers/styles, and child counts in
+                # one pass, collecting every mismatch.
+                verification = verify_chapter(
+                    sfm_chapter, target, self.normalization_mode
+                )
+            elif target is not None:
+                # Preflight already verified the chapter; pair its paragraphs
+                # from the document that's being updated.
+                verification.bind(sfm_chapter, target)
+            verification.log()
+            if odt_chapter is None:
+                return verification
+            if count_odt_read:
+                m.add("bytes_read", odt_chapter.size)
 
             logging.info("Comparing with destination chapter.")
-            odt_chapter.update_text(sfm_chapter, self.normalization_mode)
-            # for i, odt_p in enumerate(odt_chapter.paragraphs):
-            #     logging.debug(f"Checking paragraph: {odt_p.intro}")
-            #     odt_p.update_text(sfm_chapter.paragraphs[i], self.normalization_mode)
-            odt_chapter.save(odt_new_file)
-            print(f'Saved to: "{odt_new_file}"')
+            odt_chapter.update_text(
+                sfm_chapter,
+                self.normalization_mode,
+                verification=verification,
+                progress=progress,
+            )
+            if outputs is not None:
+                data = odt_chapter.to_bytes()
+                outputs[odt_chapter.name] = data
+                m.add("bytes_written", len(data))
+            else:
+                # Ensure updated ODT folder exists.
+                new_dest_path.mkdir(parents=True, exist_ok=True)
+                # Make copy of original ODT into updated folder.
+                odt_new_file = new_dest_path / odt_chapter.file_path.name
+                odt_chapter.save(odt_new_file)
+                m.add_file_written(odt_new_file)
+            m.add("nodes_visited", odt_chapter.nodes_visited)
+            m.add("cache_hits", odt_chapter.cache_hits - cache_hits)
+            # Keep the report, but not the document's paragraphs.
+            verification.release()
+            return verification
+
+    def log_memory(self):
+        logging.info(
+            f"Peak RSS: {get_peak_rss()} bytes; documents loaded: {self.pool.loads}; open at most: {self.pool.peak_open}; unloaded: {self.pool.evictions}"
+        )
@@ -0,0 +1,135 @@
+from collections import Counter
+
+from lxml import etree
+
+TEXT_NS = "urn:oasis:names:tc:opendocument:xmlns:text:1.0"
+DRAW_NS = "urn:oasis:names:tc:opendocument:xmlns:drawing:1.0"
+PARAGRAPH_TAGS = (f"{{{TEXT_NS}}}h", f"{{{TEXT_NS}}}p")
+SPAN_TAGS = (f"{{{TEXT_NS}}}span",)
+STYLE_NAME = f"{{{TEXT_NS}}}style-name"
+PICTURE_TAGS = (f"{{{DRAW_NS}}}image",)
+SPACER = f"{{{TEXT_NS}}}s"
+SPACER_COUNT = f"{{{TEXT_NS}}}c"
+# Elements that stand for a single character of text.
+SINGLE_CHARACTER_TAGS = (f"{{{TEXT_NS}}}tab", f"{{{TEXT_NS}}}line-break")
+
+
+class TextAnnotation:
+    """Text properties of one element and its descendants (not counting the
+    element's own tail), computed from those of its children."""
+
+    def __init__(self):
+        # Characters of text, including those of nested paragraphs.
+        self.text_length = 0
+        # Characters of text outside of nested paragraphs.
+        self.own_text_length = 0
+        self.pictures = 0
+        # Nested paragraphs that have text.
+        self.text_paragraphs = 0
+
+    @property
+    def has_own_text(self):
+        return self.own_text_length > 0
+
+    @property
+    def has_text(self):
+        return self.text_length > 0
+
+    @property
+    def has_text_paragraph_descendant(self):
+        return self.text_paragraphs > 0
+
+    @property
+    def is_picture_only(self):
+        return self.text_length == 0 and self.pictures > 0
+
+    def add_child(self, child, is_paragraph, tail):
+        """Add the annotation of a child element and the length of its tail."""
+        self.text_length += child.text_length + tail
+        self.own_text_length += tail
+        self.pictures += child.pictures
+        self.text_paragraphs += child.text_paragraphs
+        if is_paragraph:
+            if child.has_text:
+                self.text_paragraphs += 1
+        else:
+            self.own_text_length += child.own_text_length
+
+
+class OdtTextScan:
+    """A single post-order walk over a document's body that finds its
+    paragraphs ("text:h" and "text:p" elements), in document order, and
+    annotates each one with the TextAnnotation of its subtree. It also counts
+    the (content) styles used by paragraphs and spans that have text. Each
+    element is visited once, so selecting paragraphs and discovering styles
+    doesn't need to re-read any element's descendants."""
+
+    def __init__(self, root):
+        # The body's lxml element.
+        self.root = root
+        self.paragraphs = list()
+        # Paragraph lxml element: TextAnnotation
+        self.annotations = dict()
+        # Style name: number of paragraphs and spans with text
+        self.style_counts = Counter()
+        # Number of elements visited.
+        self.nodes = 0
+        self._scan()
+
+    def _scan(self):
+        # Annotations of elements whose parent hasn't been reached yet.
+        pending = dict()
+        for event, element in etree.iterwalk(self.root, events=("start", "end")):
+            if not isinstance(element.tag, str):  # comments, etc.
+                continue
+            if event == "start":
+                if element.tag in PARAGRAPH_TAGS:
+                    self.paragraphs.append(element)
+                continue
+
+            self.nodes += 1
+            annotation = TextAnnotation()
+            if element.tag == SPACER:
+                length = int(element.get(SPACER_COUNT, 1))
+                annotation.text_length = annotation.own_text_length = length
+            elif element.tag in SINGLE_CHARACTER_TAGS:
+                annotation.text_length = annotation.own_text_length = 1
+            elif element.tag in PICTURE_TAGS:
+                annotation.pictures = 1
+            else:
+                length = len(element.text or "")
+                annotation.text_length = annotation.own_text_length = length
+            for child in element:
+                child_annotation = pending.pop(child, None)
+                if child_annotation is None:  # comments, etc.
+                    continue
+                annotation.add_child(
+                    child_annotation,
+                    child.tag in PARAGRAPH_TAGS,
+                    len(child.tail or ""),
+                )
+            pending[element] = annotation
+            if element.tag in PARAGRAPH_TAGS:
+                self.annotations[element] = annotation
+            if element.tag in PARAGRAPH_TAGS or element.tag in SPAN_TAGS:
+                style = element.get(STYLE_NAME)
+                if style is not None and annotation.has_text:
+                    self.style_counts[style] += 1
+
+    def copy(self, root):
+        """Return the scan of a deep copy of this scan's document body, given
+        the copy's root element, without walking or annotating it again."""
+        scan = OdtTextScan.__new__(OdtTextScan)
+        scan.root = root
+        scan.paragraphs = list(root.iter(*PARAGRAPH_TAGS))
+        scan.annotations = {
+            p: self.annotations[original]
+            for p, original in zip(scan.paragraphs, self.paragraphs)
+        }
+        scan.style_counts = Counter(self.style_counts)
+        scan.nodes = 0
+        return scan
+
+    def get(self, node):
+        """Return the TextAnnotation of the given paragraph node."""
+        return self.annotations.get(node._xml_element)
@@ -1,12 +1,32 @@
 import logging
 
+from .flat import PART_ROOTS
+from .tables import TableIndex
+
+
+def clone_document(document):
+    """Return a deep copy of the document, with any changes to its XML parts.
+    Document.clone copies the container's parts as they were read, so the
+    parsed XML parts are serialized into the copy, which parses them again
+    when they're used."""
+    clone = document.clone
+    for path in PART_ROOTS:
+        if path in document.container.parts:
+            clone.container.set_part(path, document.get_part(path).serialize())
+    return clone
+
 
 def get_node_doc_style(node, document):
     """Many nodes have a "Content" style defined in content.xml, but we're
     interested in "Document" styles defined in styles.xml. Content styles
     will have a parent style from Document styles."""
-    style = node.style
-    # Check if node's style is a Content style.
+    return get_doc_style(node.style, document)
+
+
+def get_doc_style(style, document):
+    """Return the Document style for the given style name: the parent style
+    if it's a Content style, otherwise the style itself."""
+    # Check if style is a Content style.
     content_style = None
     for family in ("paragraph", "text"):
         # Get style object, prioritizing paragraph style over text style.
@@ -14,55 +34,40 @@ def get_node_doc_style(node, document):
         if content_style:
             break
     if content_style:
-        # logging.info(f'Getting parent (document) style of "{node.style}"')
         doc_style = content_style.parent_style
         if doc_style:
             logging.info(
-                f'Parent (document) style of content style "{node.style}" is "{doc_style}"'
+                f'Parent (document) style of content style "{style}" is "{doc_style}"'
             )
             style = doc_style
         else:
-            logging.warning(f'Content style "{node.style}" has no parent style.')
+            logging.warning(f'Content style "{style}" has no parent style.')
     return style
 
 
 def get_node_row(node):
-    if node.parent.tag.startswith("table"):
+    if node_in_table(node):
         # Parent of node is Cell, whose parent is Row.
         return node.parent.parent
 
 
 def get_node_table(node):
-    if node.parent.tag.startswith("table"):
-        # Parent of node is Cell, whose parent is Row, whose parent is Table.
-        return get_node_row(node).parent
-
-
-def get_node_table_pos(node):
-    """Return (row, col) indexes for node's cell in given table."""
-
-    table = get_node_table(node)
-    row = get_node_row(node)
-    col_ct = len([c for c in table.children if c.tag == "table:table-column"])
-    table_children_elems = [c._xml_element for c in table.children]
-    row_idx = table_children_elems.index(row._xml_element) - col_ct
-    row_children_elems = [c._xml_element for c in row.children]
-    col_idx = row_children_elems.index(node.parent._xml_element)
-    return (row_idx, col_idx)
-
+    if node_in_table(node):
+        # Parent of node is Cell, whose parent is Row, whose parent is Table
+        # (or a group of rows within the Table).
+        table = get_node_row(node).parent
+        while table is not None and table.tag != "table:table":
+            table = table.parent
+        return table
 
-def node_has_paragraph_descendent_with_text(node):
-    qnames = ("text:h", "text:p")
 
-    def node_contains_paragraph_with_text(n):
-        for c in n.children:
-            # logging.debug(f"Checking node tag: {c.tag}")
-            if c.tag in qnames and (c.text or c.tail):
-                return True
-            else:
-                return node_contains_paragraph_with_text(c)
+def get_node_table_pos(node, index=None):
+    """Return (row, col) indexes for node's cell in given table. When looking up
+    many cells of the same table, pass its TableIndex to avoid rebuilding it."""
 
-    return node_contains_paragraph_with_text(node)
+    if index is None:
+        index = TableIndex(get_node_table(node)._xml_element)
+    return index.position(node.parent._xml_element)
 
 
 def node_in_table(node):
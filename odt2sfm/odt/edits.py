@@ -0,0 +1,191 @@
+import logging
+from difflib import SequenceMatcher
+
+from .annotations import SINGLE_CHARACTER_TAGS, SPACER, SPACER_COUNT, TEXT_NS
+
+LINE_BREAK = f"{{{TEXT_NS}}}line-break"
+# Kinds of edit: an element's text, its tail, or the inner text of a span
+# (its text and all of its descendants' texts and tails).
+EDIT_KINDS = ("text", "tail", "span")
+
+
+def get_fixed_text(element):
+    """Return the text that a spacer, tab, or line break element stands for,
+    or None if it's some other element."""
+    if element.tag == SPACER:
+        return " " * int(element.get(SPACER_COUNT, "1"))
+    elif element.tag in SINGLE_CHARACTER_TAGS:
+        return "\n" if element.tag == LINE_BREAK else "\t"
+    return None
+
+
+def get_inner_segments(element, segments=None, tail=False):
+    """Return the element's inner text as [element, attribute, text] segments
+    in document order, where attribute is "text" or "tail" for text that can
+    be rewritten, or None for the fixed text of a spacer, tab, or line break.
+    The element's own tail is included only if tail is True."""
+    if segments is None:
+        segments = list()
+    fixed = get_fixed_text(element)
+    if fixed is not None:
+        segments.append([element, None, fixed])
+    else:
+        segments.append([element, "text", element.text or ""])
+        for child in element:
+            if isinstance(child.tag, str):
+                get_inner_segments(child, segments, tail=True)
+    if tail:
+        segments.append([element, "tail", element.tail or ""])
+    return segments
+
+
+def get_opcodes(old, new, boundaries):
+    """Return SequenceMatcher opcodes that turn the old text into the new one.
+    Most edits change one run of text; if it's within one segment, the
+    opcodes are taken from the common prefix and suffix instead."""
+    end = min(len(old), len(new))
+    prefix = 0
+    while prefix < end and old[prefix] == new[prefix]:
+        prefix += 1
+    suffix = 0
+    while suffix < end - prefix and old[-suffix - 1] == new[-suffix - 1]:
+        suffix += 1
+    old_end = len(old) - suffix
+    new_end = len(new) - suffix
+    if any(prefix < b < old_end for b in boundaries):
+        return SequenceMatcher(None, old, new, autojunk=False).get_opcodes()
+    if prefix == old_end:
+        tag = "insert"
+    elif prefix == new_end:
+        tag = "delete"
+    else:
+        tag = "replace"
+    opcodes = [("equal", 0, prefix, 0, prefix), (tag, prefix, old_end, prefix, new_end)]
+    opcodes.append(("equal", old_end, len(old), new_end, len(new)))
+    return [op for op in opcodes if op[1] != op[2] or op[3] != op[4]]
+
+
+def get_new_boundaries(old, new, boundaries, fixed):
+    """Return where each of the boundaries between segments of the old text
+    fall in the new text, or None if a fixed segment's text isn't kept. A
+    boundary next to a fixed segment is taken from the unchanged text around
+    it. Any other boundary moves with the unchanged text after it; text
+    inserted at a boundary goes to the segment before it, and text replacing
+    a boundary to the segment after it."""
+    opcodes = get_opcodes(old, new, boundaries)
+
+    def map_char(pos):
+        # Position in the new text of the unchanged character at pos.
+        for tag, i1, i2, j1, _ in opcodes:
+            if i1 <= pos < i2:
+                return j1 + pos - i1 if tag == "equal" else None
+        return None
+
+    def map_position(pos):
+        for tag, i1, i2, j1, j2 in opcodes:
+            if i1 <= pos < i2 or (pos == i2 == len(old)):
+                return j1 + pos - i1 if tag == "equal" else j1
+        return len(new)
+
+    new_boundaries = list()
+    for i, pos in enumerate(boundaries):
+        # The boundary comes after segment i and before segment i + 1.
+        candidates = set()
+        if fixed[i]:
+            end = map_char(pos - 1)
+            candidates.add(None if end is None else end + 1)
+        if fixed[i + 1]:
+            candidates.add(map_char(pos))
+        if not candidates:
+            candidates.add(map_position(pos))
+        if len(candidates) != 1 or None in candidates:
+            return None
+        new_boundaries.append(candidates.pop())
+    # Keep the boundaries in order.
+    for i in range(1, len(new_boundaries)):
+        if new_boundaries[i] < new_boundaries[i - 1]:
+            if fixed[i] or fixed[i + 1]:
+                return None
+            new_boundaries[i] = new_boundaries[i - 1]
+    return new_boundaries
+
+
+def write_inner_text(element, value):
+    """Set the element's inner text to the value, writing each changed part
+    of it to the text or tail that held it, and keeping spacers, tabs, line
+    breaks, and nested spans in place. If the value no longer has the text of
+    one of the spacers, tabs, or line breaks, they are removed and the value
+    is written as the element's text. Return the number of texts written."""
+    segments = get_inner_segments(element)
+    texts = [s[2] for s in segments]
+    old = "".join(texts)
+    if old == value:
+        return 0
+    boundaries = list()
+    pos = 0
+    for text in texts[:-1]:
+        pos += len(text)
+        boundaries.append(pos)
+    fixed = [s[1] is None for s in segments]
+    new_boundaries = get_new_boundaries(old, value, boundaries, fixed)
+    if new_boundaries is None:
+        logging.warning(
+            f'Flattening span "{old}": its spacers, tabs, or line breaks changed'
+        )
+        for child in list(element):
+            element.remove(child)
+        element.text = value
+        return 1
+    writes = 0
+    starts = [0] + new_boundaries
+    ends = new_boundaries + [len(value)]
+    for (node, attribute, text), start, end in zip(segments, starts, ends):
+        if attribute is None or value[start:end] == text:
+            continue
+        setattr(node, attribute, value[start:end])
+        writes += 1
+    return writes
+
+
+class TextEdit:
+    """A new value for the text of one lxml element, its tail, or its inner
+    text (for a span)."""
+
+    def __init__(self, element, kind, value):
+        if kind not in EDIT_KINDS:
+            raise ValueError(f"Invalid edit kind: {kind}")
+        self.element = element
+        self.kind = kind
+        self.value = value
+
+    def apply(self):
+        """Write the value; return the number of texts written."""
+        if self.kind == "span":
+            return write_inner_text(self.element, self.value)
+        setattr(self.element, self.kind, self.value)
+        return 1
+
+
+class TextEdits:
+    """The text edits of a chapter's paragraphs, collected while they are
+    compared with their SFM paragraphs and then written in one pass directly
+    to the document's lxml elements, without going through odfdo's Element
+    wrappers."""
+
+    def __init__(self):
+        self.edits = list()
+        # Number of texts written by apply().
+        self.writes = 0
+
+    def __len__(self):
+        return len(self.edits)
+
+    def add(self, element, kind, value):
+        self.edits.append(TextEdit(element, kind, value))
+
+    def apply(self):
+        """Write all of the edits; return the number of texts written."""
+        for edit in self.edits:
+            self.writes += edit.apply()
+        self.edits = list()
+        return self.writes
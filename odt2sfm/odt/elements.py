@@ -7,13 +7,21 @@ from ..base import (
     SFM_TEXT_SEP,
     do_paratext_replacements,
     normalize_text,
-    verify_paragraph_children_count,
+    text_fingerprint,
 )
-from ..sfm.base import SFM_SPAN_TYPES_NO_END_MARKER, get_sfm_type
-from .base import get_node_doc_style
+from ..sfm.base import get_span_end_marker
+from .annotations import SPACER, SPAN_TAGS, TEXT_NS
+from .edits import TextEdits
+
+# Child elements whose text is part of a span's text ("text:s", "text:span",
+# "text:tab").
+INNER_TEXT_TAGS = (SPACER, *SPAN_TAGS, f"{{{TEXT_NS}}}tab")
 
 
 class OdtElement:
+    # How the element's text is written by a TextEdit.
+    edit_kind = "text"
+
     def __init__(self, node, chapter=None):
         self.node = node
         self.chapter = None
@@ -72,6 +80,10 @@ class OdtElement:
     def text_recursive(self):
         return self.node.text_recursive
 
+    @property
+    def xml_element(self):
+        return self.node._xml_element
+
     def _normalize(self, text, mode):
         """Normalize foreign text according to current document preferences."""
         return unicodedata.normalize(mode, text)
@@ -91,6 +103,10 @@ class OdtText(OdtElement):
         super().__init__(parent, **kwargs)
         self.is_tail = tail
 
+    @property
+    def edit_kind(self):
+        return "tail" if self.is_tail else "text"
+
     @property
     def tail(self):
         if self.is_tail:
@@ -135,17 +151,26 @@ class OdtSpan(OdtElement):
             raise ValueError(f"Invalid SFM marker: {value}")
         self._sfm_marker = value
 
+    @property
+    def edit_kind(self):
+        # Write inner text to the texts and tails it's made of.
+        return "span" if self.has_inner_text else "text"
+
+    @property
+    def has_inner_text(self):
+        """Return True if child nodes, such as tabs and spacers, are part of the
+        span's text."""
+        # FIXME: This seems a bit hacky, but it works well enough for now.
+        return any(c.tag in INNER_TEXT_TAGS for c in self.xml_element)
+
     @property
     def style(self):
         return self.node.style
 
     @property
     def text(self):
-        # .inner_text includes child nodes, such as tabs and spacers.
-        # FIXME: This seems a bit hacky, but it works well enough for now.
-        for tag in ("text:s", "text:span", "text:tab"):
-            if tag in [c.tag for c in self.node.children]:
-                return self.node.inner_text
+        if self.has_inner_text:
+            return self.node.inner_text
         return self.node.text
 
     @text.setter
@@ -171,10 +196,10 @@ class OdtSpan(OdtElement):
         text = do_paratext_replacements(text)
         text = normalize_text(normalization_mode, text)
         sfm_data += f"{sfm} {text}"
-        sfm_type = get_sfm_type(sfm)
-        if sfm_type not in SFM_SPAN_TYPES_NO_END_MARKER:
+        end_marker = get_span_end_marker(sfm)
+        if end_marker:
             # Add ending marker.
-            sfm_data += f"{sfm}*"
+            sfm_data += end_marker
         return sfm_data
 
 
@@ -186,6 +211,8 @@ class OdtParagraph(OdtElement):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._children = None
+        # Normalization mode: text_fingerprint of the exported SFM
+        self._fingerprints = dict()
         self._style = None
 
     @property
@@ -193,7 +220,7 @@ class OdtParagraph(OdtElement):
         if self._children is None:
             logging.info(f'Getting children for paragraph "{self}"')
             logging.debug(f"{self.node.children=}")
-            return self._get_children_from_node(self.node)
+            self._children = self._get_children_from_node(self.node)
         return self._children
 
     @property
@@ -207,7 +234,7 @@ class OdtParagraph(OdtElement):
     @property
     def style(self):
         if self._style is None:
-            self._style = get_node_doc_style(self.node, self.chapter.odt)
+            self._style = self.chapter.get_doc_style(self.node.style)
         return self._style
 
     def _get_children_from_node(self, node, accumulator=None, depth=0):
@@ -265,18 +292,24 @@ class OdtParagraph(OdtElement):
         logging.debug(f'Generating SFM output for "{self}"')
         out_text = list()
         sfm = self.sfm_marker
-        line = f"{sfm} "
+        # Parts of the line, joined once all children are added.
+        parts = [f"{sfm} "]
         prev_child = None
         for child in self.children:
-            # logging.debug(f"{line=}")
-            if isinstance(child, OdtText) and isinstance(prev_child, OdtText):
+            if isinstance(child, OdtText) and isinstance(
+                prev_child, (OdtText, OdtTableCell)
+            ):
                 # Add space-underscore when following another Text.
                 logging.debug(
                     f"OdtText following other OdtText: {prev_child.text=}; {child.text=}"
                 )
-                line += SFM_TEXT_SEP
-            line += child.to_sfm(normalization_mode)
+                parts.append(SFM_TEXT_SEP)
+            elif isinstance(child, OdtTableCell) and not parts[-1].endswith(" "):
+                # Separate the cell's marker from the previous cell's text.
+                parts.append(" ")
+            parts.append(child.to_sfm(normalization_mode))
             prev_child = child
+        line = "".join(parts)
 
         # Add SFM line.
         if len(line) > 0:
@@ -290,31 +323,64 @@ class OdtParagraph(OdtElement):
 
         return "\n".join(out_text)
 
-    def update_text(self, sfm_paragraph, normalization_mode):
-        """Starting with the paragraph node, recursively check for Text nodes
-        and update their data if needed."""
-        # Only proceed if overall paragraph text is different.
-        if self.text == normalize_text(normalization_mode, sfm_paragraph.text):
-            logging.debug(f"Skipping unchanged paragraph: {self.intro}")
-            return
-
-        extra_sfm_items = verify_paragraph_children_count(sfm_paragraph, self)
-        if extra_sfm_items < 0:
-            logging.error("Can't update text: not enough SFM paragraph child items.")
-            return
-
-        logging.debug(
-            f"P children: {[f'{c.__class__.__name__}:{c.text}' for c in self.children]}"
-        )
-        logging.debug(
-            f"XML children: {[f'{c.text=}; {c.tail=}' for c in self.node.children]}"
+    def fingerprint(self, normalization_mode):
+        """Return the text_fingerprint of the paragraph's SFM export, or None if
+        it can't be exported (e.g. a span style has no SFM marker)."""
+        if normalization_mode not in self._fingerprints:
+            try:
+                sfm = self.to_sfm(normalization_mode)
+            except ValueError:
+                fingerprint = None
+            else:
+                fingerprint = text_fingerprint(
+                    sfm, normalization_mode, whitespace="lines"
+                )
+            self._fingerprints[normalization_mode] = fingerprint
+        return self._fingerprints[normalization_mode]
+
+    def is_unchanged(self, sfm_paragraph, normalization_mode):
+        """Return True if every child already has its SFM child's text. If the
+        SFM paragraph is the same as this one's export, that's known from their
+        fingerprints without parsing the SFM paragraph's children."""
+        fingerprint = self.fingerprint(normalization_mode)
+        if fingerprint is not None and fingerprint == sfm_paragraph.fingerprint(
+            normalization_mode
+        ):
+            return True
+        sfm_children = sfm_paragraph.children
+        if len(sfm_children) != len(self.children):
+            return False
+        return all(
+            c.text == normalize_text(normalization_mode, s.text)
+            for c, s in zip(self.children, sfm_children)
         )
-        sfm_children = [c for c in sfm_paragraph.children]
+
+    def update_children(self, sfm_paragraph, normalization_mode, edits=None):
+        """Update the paragraph's child items from the SFM paragraph's children,
+        which verify_chapter has already checked are at least as many. Changes are
+        added to the given TextEdits, or else written at once."""
+        apply = edits is None
+        if apply:
+            edits = TextEdits()
+        # Don't wrap every XML child unless it will be logged.
+        log_children = logging.getLogger().isEnabledFor(logging.DEBUG)
+        if log_children:
+            logging.debug(
+                f"P children: {[f'{c.__class__.__name__}:{c.text}' for c in self.children]}"
+            )
+            logging.debug(
+                f"XML children: {[f'{c.text=}; {c.tail=}' for c in self.node.children]}"
+            )
+        sfm_children = sfm_paragraph.children
         for i, odt_item in enumerate(self.children):
             sfm_item = sfm_children[i]
             sfm_item_normalized_text = normalize_text(normalization_mode, sfm_item.text)
-            if odt_item.text == sfm_item_normalized_text:
-                logging.debug(f"Skipping unchanged paragraph child: {odt_item.intro}")
+            odt_item_text = odt_item.text
+            if odt_item_text == sfm_item_normalized_text:
+                if log_children:
+                    logging.debug(
+                        f"Skipping unchanged paragraph child: {odt_item.intro}"
+                    )
                 continue
             item = "Unknown"
             tail = ""
@@ -325,9 +391,36 @@ class OdtParagraph(OdtElement):
             elif isinstance(odt_item, OdtSpan):
                 item = "OdtSpan"
             logging.info(
-                f'Updating {item}{tail} "{odt_item.text}" to "{sfm_item_normalized_text}"'
+                f'Updating {item}{tail} "{odt_item_text}" to "{sfm_item_normalized_text}"'
             )
-            odt_item.text = sfm_item_normalized_text
+            edits.add(
+                odt_item.xml_element, odt_item.edit_kind, sfm_item_normalized_text
+            )
+        if apply:
+            edits.apply()
+
+
+class OdtTableCell(OdtElement):
+    """The start of a table cell: the text of the cell's paragraph that comes
+    before any span, introduced by the cell's SFM marker (e.g. "\\tc1")."""
+
+    def __init__(self, node, sfm_marker, **kwargs):
+        super().__init__(node, **kwargs)
+        self._sfm_marker = sfm_marker
+
+    @property
+    def text(self):
+        return self.node.text or ""
+
+    @text.setter
+    def text(self, value):
+        self.node.text = value
+
+    def to_sfm(self, normalization_mode):
+        text = self.text.replace("\n", "")
+        text = do_paratext_replacements(text)
+        text = normalize_text(normalization_mode, text)
+        return f"{self.sfm_marker} {text}"
 
 
 class OdtTableRow(OdtParagraph):
@@ -338,9 +431,9 @@ class OdtTableRow(OdtParagraph):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._children = list()
+        self._columns = set()
         self._parent_table = None
 
-    # TODO: Set correct SFM marker for paragraph.
     @property
     def children(self):
         return self._children
@@ -356,22 +449,27 @@ class OdtTableRow(OdtParagraph):
     def sfm_marker(self):
         return "\\tr"
 
-    def add_cell(self, node, column_idx):
+    def add_cell(self, node, column_idx, header=False):
         """Add the "paragraph" node's data to the table row. This can include
-        plain text and span data."""
+        plain text and span data. The first paragraph of each cell starts with
+        the cell's marker, e.g. "\\tc1" for column_idx 0, or "\\th1" in a
+        header row; any further paragraphs in the same cell continue it."""
         # Hijack OdtParagraph to generate child elements.
-        p = OdtParagraph(node, chapter=self.chapter)
-        # Create/update column-initial element.
-        e = OdtSpan(node, chapter=self.chapter)
-        e.sfm_marker = f"\\tc{column_idx}"
-        children = p.children
-        if len(children) == 0:
-            children.append(e)
-        elif isinstance(children[0], OdtText):
-            e.text = children[0].text
-            children[0] = e
-        else:
-            e.text = ""
-            children.insert(0, e)
+        children = OdtParagraph(node, chapter=self.chapter).children
+        if column_idx not in self._columns:
+            self._columns.add(column_idx)
+            # Create/update column-initial element.
+            sfm_marker = f"\\t{'h' if header else 'c'}{column_idx + 1}"
+            cell = OdtTableCell(node, sfm_marker, chapter=self.chapter)
+            if (
+                len(children) > 0
+                and isinstance(children[0], OdtText)
+                and not children[0].is_tail
+                and children[0].node._xml_element is node._xml_element
+            ):
+                # The cell element takes the place of the paragraph's text.
+                children[0] = cell
+            else:
+                children.insert(0, cell)
         self.children.extend(children)
         logging.debug(f"{self.children=}")
@@ -0,0 +1,253 @@
+import copy
+import logging
+import os
+
+import odfdo
+from lxml import etree
+from odfdo import Document
+from odfdo.container import Container
+
+OFFICE_NS = "urn:oasis:names:tc:opendocument:xmlns:office:1.0"
+STYLE_NS = "urn:oasis:names:tc:opendocument:xmlns:style:1.0"
+MANIFEST_NS = "urn:oasis:names:tc:opendocument:xmlns:manifest:1.0"
+MANIFEST = "META-INF/manifest.xml"
+FLAT_SUFFIX = ".fodt"
+# Suffixes of the ODT files that make up a book: zipped and flat.
+ODT_SUFFIXES = (".odt", FLAT_SUFFIX)
+MIMETYPE = "application/vnd.oasis.opendocument.text"
+# Root element of each XML part of a zipped document.
+PART_ROOTS = {
+    "content.xml": "document-content",
+    "styles.xml": "document-styles",
+    "meta.xml": "document-meta",
+    "settings.xml": "document-settings",
+}
+# Top-level elements of a flat document, in the order they are written, with
+# the parts they are read from.
+FLAT_ELEMENTS = (
+    ("meta", ("meta.xml",)),
+    ("settings", ("settings.xml",)),
+    ("scripts", ("content.xml",)),
+    ("font-face-decls", ("content.xml", "styles.xml")),
+    ("styles", ("styles.xml",)),
+    ("automatic-styles", ("content.xml", "styles.xml")),
+    ("master-styles", ("styles.xml",)),
+    ("body", ("content.xml",)),
+)
+# Parts of a zipped document that are embedded in a flat one, e.g. pictures.
+EMBEDDED_PREFIXES = ("Pictures/", "Object", "ObjectReplacements/")
+STYLE_NAME = f"{{{STYLE_NS}}}name"
+PAGE_LAYOUT = f"{{{STYLE_NS}}}page-layout"
+
+
+def office(name):
+    return f"{{{OFFICE_NS}}}{name}"
+
+
+def get_part_name(tag):
+    """Return the part of a zipped document that a flat document's top-level
+    element belongs to; shared elements are read into content.xml."""
+    for name, parts in FLAT_ELEMENTS:
+        if tag == office(name):
+            return parts[0]
+    return "content.xml"
+
+
+def merge_children(target, element):
+    """Move the element's children to the target element of the same tag,
+    skipping named ones (e.g. font faces) that the target already has."""
+    names = {c.get(STYLE_NAME) for c in target if c.get(STYLE_NAME) is not None}
+    for child in list(element):
+        name = child.get(STYLE_NAME)
+        if name is not None and name in names:
+            continue
+        target.append(child)
+
+
+def set_children(parent, children):
+    """Replace the parent's children, moving them one by one: assigning to a
+    slice of a large element is much slower in lxml."""
+    keep = set(children)
+    for child in list(parent):
+        if child not in keep:
+            parent.remove(child)
+    for child in children:
+        parent.append(child)
+
+
+def get_target(file_path):
+    """Return a path as a string, for lxml and odfdo, or a stream as it is."""
+    if isinstance(file_path, (str, os.PathLike)):
+        return str(file_path)
+    return file_path
+
+
+def get_master_style_names(master_styles):
+    """Return the names of the styles that the master styles refer to."""
+    names = set()
+    for element in master_styles.iter():
+        for key, value in element.attrib.items():
+            if key.startswith(f"{{{STYLE_NS}}}") and key.endswith("name"):
+                names.add(value)
+    return names
+
+
+def read_flat_document(file_path):
+    """Return an odfdo Document of the flat ODT file (a path or a binary
+    stream), parsed incrementally: each top-level element that isn't content
+    is moved into its part's tree as soon as it has been read, and the flat
+    document's root becomes the root of content.xml, so the document is
+    neither read into memory as bytes nor parsed twice, as it would be by
+    odfdo, and the body is never copied or moved to another tree."""
+    roots = dict()
+    root = None
+    # Only office elements are reported, e.g. not the body's paragraphs.
+    events = etree.iterparse(
+        get_target(file_path), events=("start", "end"), tag=f"{{{OFFICE_NS}}}*"
+    )
+    for event, element in events:
+        if root is None:
+            root = element
+            for part_name, tag in PART_ROOTS.items():
+                if part_name != "content.xml":
+                    roots[part_name] = etree.Element(
+                        office(tag), attrib=dict(root.attrib), nsmap=root.nsmap
+                    )
+                    roots[part_name].attrib.pop(office("mimetype"), None)
+            continue
+        if event == "start" or element.getparent() is not root:
+            continue
+        # A top-level element has been read: move it to its part.
+        part_name = get_part_name(element.tag)
+        if part_name == "content.xml":
+            continue
+        part_root = roots[part_name]
+        existing = part_root.find(element.tag)
+        if existing is not None:
+            merge_children(existing, element)
+            root.remove(element)
+        else:
+            part_root.append(element)
+    if root is None:
+        raise ValueError(f"Not a flat ODT file: {file_path}")
+    mimetype = root.attrib.pop(office("mimetype"), MIMETYPE)
+    root.tag = office(PART_ROOTS["content.xml"])
+    roots["content.xml"] = root
+    _split_styles(roots["content.xml"], roots["styles.xml"])
+    return _make_document(roots, mimetype)
+
+
+def _split_styles(content_root, styles_root):
+    """Give styles.xml the font faces, page layouts, and automatic styles
+    that its master styles need; the latter are also kept in content.xml."""
+    font_faces = content_root.find(office("font-face-decls"))
+    if font_faces is not None:
+        styles_root.insert(0, copy.deepcopy(font_faces))
+    automatic_styles = content_root.find(office("automatic-styles"))
+    master_styles = styles_root.find(office("master-styles"))
+    if automatic_styles is None or master_styles is None:
+        return
+    styles_automatic = etree.Element(office("automatic-styles"))
+    names = get_master_style_names(master_styles)
+    for style in list(automatic_styles):
+        if style.tag == PAGE_LAYOUT:
+            styles_automatic.append(style)
+        elif style.get(STYLE_NAME) in names:
+            styles_automatic.append(copy.deepcopy(style))
+    master_styles.addprevious(styles_automatic)
+
+
+def get_manifest(part_names, mimetype):
+    """Return the bytes of a manifest that lists the document's parts."""
+    entries = [
+        f'<manifest:file-entry manifest:full-path="/" manifest:media-type="{mimetype}"/>'
+    ]
+    entries.extend(
+        f'<manifest:file-entry manifest:full-path="{p}" manifest:media-type="text/xml"/>'
+        for p in part_names
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<manifest:manifest xmlns:manifest="{MANIFEST_NS}" manifest:version="1.2">'
+        f'{"".join(entries)}</manifest:manifest>'
+    ).encode()
+
+
+def set_part_tree(document, part_name, tree):
+    """Make the parsed tree the document's XML part. odfdo has no API for
+    this, so it's set on the part's private attribute, and checked: if this
+    version of odfdo doesn't use it, a RuntimeError is raised rather than
+    the part being silently read from the container."""
+    part = document.get_part(part_name)
+    attribute = "_XmlPart__tree"
+    supported = attribute in vars(part)
+    if supported:
+        setattr(part, attribute, tree)
+        supported = part._get_tree() is tree
+    if not supported:
+        raise RuntimeError(
+            f"Unsupported odfdo version {odfdo.__version__}: can't set the parsed {part_name}"
+        )
+
+
+def _make_document(roots, mimetype):
+    """Return a Document whose XML parts are the given parsed trees."""
+    container = Container()
+    container.set_part("mimetype", mimetype.encode())
+    for part_name in roots:
+        # Placeholders, replaced by the parsed parts when the document is saved.
+        container.set_part(part_name, b"")
+    container.set_part(MANIFEST, get_manifest(roots, mimetype))
+    document = Document(container)
+    for part_name, part_root in roots.items():
+        set_part_tree(document, part_name, etree.ElementTree(part_root))
+    return document
+
+
+def write_flat_document(document, file_path):
+    """Save the document as a flat ODT file (a path or a binary stream). The
+    root of content.xml becomes the flat document's root while it's written
+    out, and the other parts' top-level elements are moved into it and then
+    moved back, so no copy of the document is made, neither as a tree nor as
+    bytes. Documents with pictures or other files are saved by odfdo, which
+    embeds them."""
+    container = document.container
+    embedded = [p for p in container.parts if p.startswith(EMBEDDED_PREFIXES)]
+    if embedded:
+        logging.info(f"Saving flat ODT with embedded files: {embedded}")
+        document.save(get_target(file_path), packaging="xml", pretty=False)
+        return
+    roots = {
+        part_name: document.get_part(part_name)._get_tree().getroot()
+        for part_name in PART_ROOTS
+        if part_name in container.parts
+    }
+    flat_root = roots["content.xml"]
+    mimetype = container.get_part("mimetype")
+    # Each changed element's children, to put them back.
+    moved = [(e, list(e)) for e in roots.values()]
+    children = list()
+    for name, part_names in FLAT_ELEMENTS:
+        elements = [roots[p].find(office(name)) for p in part_names if p in roots]
+        elements = [e for e in elements if e is not None]
+        if not elements:
+            continue
+        # Shared elements are written once, with the children of the first
+        # (content.xml), and the others' children with new names.
+        shared = elements[0]
+        if len(elements) > 1:
+            moved.extend((e, list(e)) for e in elements)
+            merge_children(shared, elements[1])
+        children.append(shared)
+    try:
+        set_children(flat_root, children)
+        flat_root.tag = office("document")
+        flat_root.set(office("mimetype"), mimetype.decode() if mimetype else MIMETYPE)
+        etree.ElementTree(flat_root).write(
+            get_target(file_path), encoding="UTF-8", xml_declaration=True
+        )
+    finally:
+        flat_root.tag = office(PART_ROOTS["content.xml"])
+        flat_root.attrib.pop(office("mimetype"), None)
+        for parent, children in moved:
+            set_children(parent, children)
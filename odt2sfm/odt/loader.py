@@ -0,0 +1,150 @@
+import logging
+import threading
+from collections import Counter, OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+
+class OdtChapterLoader:
+    """Iterate over ODT chapters while the next few are read, decompressed
+    and parsed in background threads. At most `prefetch` chapters are loaded
+    ahead of the one being processed, which keeps memory use bounded. Chapters
+    are pinned in their document pool from when they are submitted until the
+    consumer is done with them, so a prefetched chapter isn't unloaded before
+    it's used; the prefetch window can go beyond the pool's limit."""
+
+    def __init__(self, chapters, prefetch=2):
+        self.chapters = chapters
+        self.prefetch = max(int(prefetch), 0)
+
+    def __iter__(self):
+        if self.prefetch == 0:
+            # Load each chapter lazily when it's used.
+            yield from self.chapters
+            return
+
+        chapters = iter(self.chapters)
+        pending = deque()
+
+        def release(chapter):
+            if chapter is not None and chapter.pool is not None:
+                chapter.pool.release(chapter)
+
+        with ThreadPoolExecutor(
+            max_workers=self.prefetch, thread_name_prefix="odt-loader"
+        ) as executor:
+
+            def submit_next():
+                for chapter in chapters:
+                    future = None
+                    if chapter is not None:
+                        logging.debug(f'Prefetching "{chapter}"')
+                        if chapter.pool is not None:
+                            chapter.pool.acquire(chapter)
+                        future = executor.submit(chapter.load)
+                    pending.append((chapter, future))
+                    return
+
+            for _ in range(self.prefetch):
+                submit_next()
+            try:
+                while pending:
+                    chapter, future = pending.popleft()
+                    try:
+                        if future is not None:
+                            future.result()  # re-raise any loading error
+                        submit_next()
+                        yield chapter
+                    finally:
+                        release(chapter)
+            finally:
+                # Don't wait on chapters nobody will use.
+                for chapter, future in pending:
+                    if future is not None:
+                        future.cancel()
+                    release(chapter)
+
+
+class OdtDocumentPool:
+    """Keep a bounded number of chapter documents loaded. When there are more
+    than `max_open` chapters loaded, or their estimated memory use exceeds
+    `max_memory` bytes, the least recently used chapters are unloaded. Only
+    chapters that aren't in use (pinned) and have no unsaved changes are
+    unloaded; they are simply re-read if needed again. A chapter can be
+    pinned more than once, e.g. by a loader and by its consumer, and stays
+    pinned until each of them has released it."""
+
+    def __init__(self, max_open=None, max_memory=None):
+        self.max_open = max_open
+        self.max_memory = max_memory
+        self.evictions = 0
+        # Number of documents loaded, including any that were loaded again.
+        self.loads = 0
+        self.peak_open = 0
+        self._lock = threading.RLock()
+        self._open = OrderedDict()  # chapter: estimated memory use
+        self._pinned = Counter()
+
+    @property
+    def memory(self):
+        return sum(self._open.values())
+
+    @property
+    def open_chapters(self):
+        return list(self._open)
+
+    def loaded(self, chapter):
+        """Register a chapter whose document has just been loaded."""
+        with self._lock:
+            self.loads += 1
+            self._open[chapter] = chapter.memory_estimate
+            self._open.move_to_end(chapter)
+            self.peak_open = max(self.peak_open, len(self._open))
+            # Never unload the document that's being returned to its caller.
+            self._evict(keep=chapter)
+
+    def unloaded(self, chapter):
+        with self._lock:
+            self._open.pop(chapter, None)
+
+    def acquire(self, chapter):
+        """Pin the chapter: keep it loaded until it's released."""
+        with self._lock:
+            self._pinned[chapter] += 1
+            if chapter in self._open:
+                self._open.move_to_end(chapter)
+
+    def release(self, chapter):
+        """Release a pin on the chapter, and unload chapters if over the limit."""
+        with self._lock:
+            self._pinned[chapter] -= 1
+            if self._pinned[chapter] <= 0:
+                del self._pinned[chapter]
+            self._evict()
+
+    @contextmanager
+    def pin(self, chapter):
+        """Keep the chapter loaded while it's being used."""
+        self.acquire(chapter)
+        try:
+            yield chapter
+        finally:
+            self.release(chapter)
+
+    def _is_full(self):
+        if self.max_open is not None and len(self._open) > self.max_open:
+            return True
+        if self.max_memory is not None and self.memory > self.max_memory:
+            return True
+        return False
+
+    def _evict(self, keep=None):
+        # Least recently used chapters come first.
+        for chapter in list(self._open):
+            if not self._is_full():
+                break
+            if chapter is keep or chapter in self._pinned or chapter.is_modified:
+                continue
+            logging.debug(f'Unloading "{chapter}" from document pool')
+            chapter.unload()
+            self.evictions += 1
@@ -0,0 +1,231 @@
+import json
+import logging
+from pathlib import Path
+
+from ..base import normalize_text, text_fingerprint
+from .edits import TextEdits
+from .elements import OdtSpan, OdtTableCell, OdtText
+
+SLOT_MAP_VERSION = 3
+FINGERPRINT_MODES = ("NFC", "NFD")
+SLOT_MAP_SUFFIX = ".slots.json"
+
+
+class Slot:
+    """One updatable piece of a template paragraph: the text or tail of an
+    XML element, given by its XPath in content.xml, which is filled from one
+    SFM paragraph child. A "span" slot is the element's inner text, which is
+    written to the texts and tails it's made of, like OdtSpan's."""
+
+    KINDS = ("text", "tail", "span")
+
+    def __init__(self, path, kind, text, marker=None):
+        if kind not in self.KINDS:
+            raise ValueError(f"Invalid slot kind: {kind}")
+        self.path = path
+        self.kind = kind
+        # The template's text, to skip writing unchanged text.
+        self.text = text
+        self.marker = marker
+
+    @classmethod
+    def from_child(cls, child, tree):
+        """Return the slot for an OdtParagraph child."""
+        path = tree.getpath(child.node._xml_element)
+        if isinstance(child, OdtText):
+            kind = "tail" if child.is_tail else "text"
+            return cls(path, kind, child.text)
+        elif isinstance(child, OdtSpan):
+            return cls(path, child.edit_kind, child.text, marker=child.sfm_marker)
+        elif isinstance(child, OdtTableCell):
+            return cls(path, "text", child.text, marker=child.sfm_marker)
+        raise ValueError(f"Unknown paragraph child: {child}")
+
+    def as_list(self):
+        return [self.path, self.kind, self.text, self.marker]
+
+
+class SlotParagraph:
+    """A template paragraph as recorded in its slot map, bound to one parsed
+    copy of the template. It can be verified and updated like an
+    OdtParagraph."""
+
+    def __init__(self, chapter, marker, style, text, slots, fingerprints=None):
+        self.chapter = chapter
+        self.sfm_marker = marker
+        self.style = style
+        self.text_recursive = text
+        self.children = slots
+        # Normalization mode: text_fingerprint of the template paragraph's export
+        self.fingerprints = fingerprints or dict()
+
+    @property
+    def intro(self):
+        """Returns initial characters of text element. Mostly used for logging."""
+        if len(self.text_recursive) > 23:
+            return f"{self.text_recursive[:20]}..."
+        return self.text_recursive
+
+    def is_unchanged(self, sfm_paragraph, normalization_mode):
+        """Return True if every slot already has its SFM child's text, which is
+        known without parsing the SFM paragraph's children if it's the same as
+        the template paragraph's export."""
+        fingerprint = self.fingerprints.get(normalization_mode)
+        if fingerprint is not None and fingerprint == sfm_paragraph.fingerprint(
+            normalization_mode
+        ):
+            return True
+        sfm_children = sfm_paragraph.children
+        if len(sfm_children) != len(self.children):
+            return False
+        return all(
+            slot.text == normalize_text(normalization_mode, c.text)
+            for slot, c in zip(self.children, sfm_children)
+        )
+
+    def update_children(self, sfm_paragraph, normalization_mode, edits=None):
+        """Fill the paragraph's slots from the SFM paragraph's children, which
+        have already been verified to be at least as many. Changes are added
+        to the given TextEdits, or else written at once."""
+        apply = edits is None
+        if apply:
+            edits = TextEdits()
+        for slot, sfm_item in zip(self.children, sfm_paragraph.children):
+            value = normalize_text(normalization_mode, sfm_item.text)
+            if slot.text == value:
+                continue
+            logging.info(f'Updating slot {slot.path} "{slot.text}" to "{value}"')
+            edits.add(self.chapter.get_element(slot.path), slot.kind, value)
+        if apply:
+            edits.apply()
+
+    def __str__(self):
+        return self.intro
+
+
+class SlotMap:
+    """The translatable paragraphs of a template lesson, each with the slots
+    that its SFM paragraph's children fill, in order. A slot map is compiled
+    once from the parsed template and saved next to it; it's reused until the
+    template file or its SFM markers change. Importing then only needs to
+    fill slots, not re-derive them from the document."""
+
+    def __init__(self, key, paragraphs):
+        self.key = key
+        # True if compiled in this run rather than loaded from its file.
+        self.compiled = False
+        # [{"marker": ..., "style": ..., "text": ..., "slots": [Slot, ...],
+        #   "fingerprints": {mode: ...}}]
+        self.paragraphs = paragraphs
+
+    @staticmethod
+    def file_path(chapter):
+        return chapter.file_path.with_name(f"{chapter.file_path.stem}{SLOT_MAP_SUFFIX}")
+
+    @staticmethod
+    def get_key(chapter):
+        """Return what the slot map depends on: the template file's size and
+        modification time, and the chapter's style-to-marker mapping."""
+        stat = chapter.file_path.stat()
+        sfm_ref = json.dumps(sorted(chapter.sfm_ref.items()), ensure_ascii=False)
+        return {
+            "version": SLOT_MAP_VERSION,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "sfm_ref": text_fingerprint(sfm_ref, None, whitespace=None),
+        }
+
+    @classmethod
+    def compile(cls, chapter):
+        """Build the slot map of the (unmodified) template chapter."""
+        if chapter.is_modified:
+            raise ValueError(f"Can't compile slot map of modified {chapter.name}")
+        logging.info(f'Compiling slot map for "{chapter.name}"')
+        tree = chapter.odt.body._xml_element.getroottree()
+        paragraphs = list()
+        for p in chapter.paragraphs:
+            paragraphs.append(
+                {
+                    "marker": p.sfm_marker,
+                    "style": p.style,
+                    "text": p.text_recursive,
+                    "slots": [Slot.from_child(c, tree) for c in p.children],
+                    "fingerprints": {m: p.fingerprint(m) for m in FINGERPRINT_MODES},
+                }
+            )
+        slot_map = cls(cls.get_key(chapter), paragraphs)
+        slot_map.compiled = True
+        return slot_map
+
+    @classmethod
+    def load(cls, file_path):
+        """Return the slot map saved in the given file, or None if there isn't
+        a readable one."""
+        file_path = Path(file_path)
+        if not file_path.is_file():
+            return None
+        try:
+            data = json.loads(file_path.read_text(encoding="utf-8"))
+            paragraphs = list()
+            for p in data["paragraphs"]:
+                p["slots"] = [Slot(*s) for s in p["slots"]]
+                paragraphs.append(p)
+            return cls(data["key"], paragraphs)
+        except (KeyError, TypeError, ValueError) as e:
+            logging.warning(f"Ignoring invalid slot map {file_path}: {e}")
+            return None
+
+    @classmethod
+    def for_chapter(cls, chapter):
+        """Return the chapter's saved slot map if it's still valid; otherwise
+        compile it and save it next to the template."""
+        file_path = cls.file_path(chapter)
+        slot_map = cls.load(file_path)
+        if slot_map is not None and slot_map.key == cls.get_key(chapter):
+            logging.info(f"Using slot map: {file_path}")
+            return slot_map
+        slot_map = cls.compile(chapter)
+        slot_map.save(file_path)
+        return slot_map
+
+    def save(self, file_path):
+        logging.info(f"Saving slot map to: {file_path}")
+        data = {
+            "key": self.key,
+            "paragraphs": [
+                dict(p, slots=[s.as_list() for s in p["slots"]])
+                for p in self.paragraphs
+            ],
+        }
+        Path(file_path).write_text(
+            json.dumps(data, ensure_ascii=False), encoding="utf-8"
+        )
+
+
+class SlotChapter:
+    """A chapter's slot map bound to a parsed copy of its template document,
+    so that it can be verified and updated like an OdtChapter."""
+
+    def __init__(self, slot_map, document, number=None):
+        self.number = number
+        self.slot_map = slot_map
+        self.tree = document.body._xml_element.getroottree()
+        root = self.tree.getroot()
+        self.namespaces = {k: v for k, v in root.nsmap.items() if k}
+        self.paragraphs = [
+            SlotParagraph(
+                self,
+                p["marker"],
+                p["style"],
+                p["text"],
+                p["slots"],
+                fingerprints=p.get("fingerprints"),
+            )
+            for p in slot_map.paragraphs
+        ]
+
+    def get_element(self, path):
+        elements = self.tree.xpath(path, namespaces=self.namespaces)
+        if len(elements) != 1:
+            raise ValueError(f"Slot path doesn't match the document: {path}")
+        return elements[0]
@@ -0,0 +1,70 @@
+TABLE_NS = "urn:oasis:names:tc:opendocument:xmlns:table:1.0"
+TABLE = f"{{{TABLE_NS}}}table"
+TABLE_ROW = f"{{{TABLE_NS}}}table-row"
+TABLE_HEADER_ROWS = f"{{{TABLE_NS}}}table-header-rows"
+TABLE_ROW_GROUPS = (
+    TABLE_HEADER_ROWS,
+    f"{{{TABLE_NS}}}table-rows",
+    f"{{{TABLE_NS}}}table-row-group",
+)
+TABLE_CELLS = (f"{{{TABLE_NS}}}table-cell", f"{{{TABLE_NS}}}covered-table-cell")
+COLUMNS_REPEATED = f"{{{TABLE_NS}}}number-columns-repeated"
+ROWS_REPEATED = f"{{{TABLE_NS}}}number-rows-repeated"
+
+
+def get_cell_table(cell):
+    """Return the XML table element that contains the given XML cell element,
+    skipping any header-rows or row-group elements in between."""
+    element = cell.getparent()
+    while element is not None and element.tag != TABLE:
+        element = element.getparent()
+    return element
+
+
+class TableIndex:
+    """The (row, column) coordinates of every cell in one table, computed in a
+    single pass over the table's rows. Rows in header-rows and row groups are
+    counted in document order; repeated rows and columns, and covered
+    (merged) cells, each take up their own positions. Nested tables are not
+    included; they have their own index."""
+
+    def __init__(self, table):
+        # The table's lxml element.
+        self.table = table
+        # XML row element: row index
+        self.rows = dict()
+        # XML cell element: (row index, column index)
+        self.cells = dict()
+        self.header_rows = set()
+        self.row_count = 0
+        self._index_rows(table, header=False)
+
+    def _index_rows(self, element, header):
+        for child in element:
+            if child.tag == TABLE_ROW:
+                self._index_row(child, header)
+            elif child.tag in TABLE_ROW_GROUPS:
+                self._index_rows(child, header or child.tag == TABLE_HEADER_ROWS)
+
+    def _index_row(self, row, header):
+        row_idx = self.row_count
+        self.rows[row] = row_idx
+        if header:
+            self.header_rows.add(row_idx)
+        col_idx = 0
+        for cell in row:
+            if cell.tag not in TABLE_CELLS:
+                continue
+            self.cells[cell] = (row_idx, col_idx)
+            col_idx += int(cell.get(COLUMNS_REPEATED, 1))
+        self.row_count += int(row.get(ROWS_REPEATED, 1))
+
+    def is_header(self, cell):
+        return self.position(cell)[0] in self.header_rows
+
+    def position(self, cell):
+        """Return (row, col) indexes of the given XML cell element."""
+        try:
+            return self.cells[cell]
+        except KeyError:
+            raise ValueError(f"Cell is not in table: {cell}")
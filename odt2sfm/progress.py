@@ -0,0 +1,103 @@
+import threading
+import time
+
+
+class ConversionCancelled(Exception):
+    """Raised between chapters when a conversion has been cancelled."""
+
+
+class Progress:
+    """The progress of a conversion, in chapters and in the current chapter's
+    paragraphs, reported to an optional callback, which is called with this
+    object. The ETA is estimated from the throughput so far. A conversion can
+    be cancelled from any thread; it stops before its next chapter."""
+
+    def __init__(self, callback=None):
+        self.callback = callback
+        self.chapters_total = 0
+        self.chapters_done = 0
+        # The chapter being converted, and its paragraphs.
+        self.chapter = None
+        self.paragraphs_total = 0
+        self.paragraphs_done = 0
+        self.started = None
+        self._cancelled = threading.Event()
+        self._lock = threading.Lock()
+
+    @property
+    def elapsed(self):
+        if self.started is None:
+            return 0.0
+        return time.perf_counter() - self.started
+
+    @property
+    def fraction(self):
+        """Return the fraction of the work done, counting the current chapter's
+        paragraphs as part of a chapter."""
+        if not self.chapters_total:
+            return 0.0
+        done = self.chapters_done
+        if self.chapter is not None and self.paragraphs_total:
+            done += self.paragraphs_done / self.paragraphs_total
+        return min(done / self.chapters_total, 1.0)
+
+    @property
+    def eta(self):
+        """Return the estimated number of seconds left, or None until some
+        work has been done."""
+        fraction = self.fraction
+        if fraction == 0:
+            return None
+        return self.elapsed * (1 - fraction) / fraction
+
+    @property
+    def is_cancelled(self):
+        return self._cancelled.is_set()
+
+    def cancel(self):
+        """Ask the conversion to stop before its next chapter."""
+        self._cancelled.set()
+
+    def check(self):
+        """Raise ConversionCancelled if the conversion has been cancelled."""
+        if self.is_cancelled:
+            raise ConversionCancelled("Conversion was cancelled.")
+
+    def start(self, chapters_total):
+        self.started = time.perf_counter()
+        self.chapters_total = chapters_total
+        self.chapters_done = 0
+        self._report()
+
+    def start_chapter(self, number, paragraphs_total=0):
+        """Start the next chapter, unless the conversion has been cancelled."""
+        self.check()
+        with self._lock:
+            self.chapter = number
+            self.paragraphs_total = paragraphs_total
+            self.paragraphs_done = 0
+        self._report()
+
+    def paragraph_done(self):
+        with self._lock:
+            self.paragraphs_done += 1
+        self._report()
+
+    def chapter_done(self):
+        with self._lock:
+            self.chapters_done += 1
+            self.chapter = None
+        self._report()
+
+    def _report(self):
+        if self.callback is not None:
+            self.callback(self)
+
+    def __str__(self):
+        text = f"{self.chapters_done}/{self.chapters_total} chapters"
+        if self.chapter is not None:
+            text += f"; chapter {self.chapter}: {self.paragraphs_done}/{self.paragraphs_total} paragraphs"
+        eta = self.eta
+        if eta is not None:
+            text += f"; ETA {eta:.1f} s"
+        return text
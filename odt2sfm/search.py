@@ -0,0 +1,262 @@
+import json
+import logging
+import re
+from contextlib import nullcontext
+from pathlib import Path
+
+from .base import normalize_text, parse_chapter_numbers, text_fingerprint, text_numbers
+from .odt.loader import OdtChapterLoader
+
+RE_WORD = re.compile(r"\w+")
+SEARCH_INDEX_VERSION = 1
+
+
+def tokenize(text, normalization_form="NFC"):
+    """Return the words of the text, normalized and case-folded the same way
+    for indexing and for queries."""
+    return RE_WORD.findall(normalize_text(normalization_form, text).casefold())
+
+
+def get_paragraph_items(paragraph, verse=None):
+    """Return (verse, text) items for the children of an SFM or ODT paragraph,
+    and the verse in effect at the paragraph's end. Verse numbers are taken
+    from "\\v" spans."""
+    items = list()
+    for child in paragraph.children:
+        marker = getattr(child, "marker", None) or getattr(child, "sfm_marker", None)
+        if marker == "\\v":
+            verse = child.text.strip()
+            continue
+        if child.text:
+            items.append((verse, child.text))
+    return items, verse
+
+
+def get_verse_key(verse):
+    """Return a key that sorts verses by number, e.g. "2" before "10", with
+    text before any verse first."""
+    if verse is None:
+        return (0, (), "")
+    return (1, tuple(int(n) for n in text_numbers(verse)), verse)
+
+
+class SearchHit:
+    """A paragraph (or verse within it) that contains every word searched for."""
+
+    def __init__(self, source, chapter, paragraph, verse, marker, text):
+        self.source = source
+        self.chapter = chapter
+        self.paragraph = paragraph
+        self.verse = verse
+        self.marker = marker
+        self.text = text
+
+    @property
+    def reference(self):
+        ref = f"{self.source} {self.chapter}"
+        if self.verse is not None:
+            ref += f":{self.verse}"
+        return f"{ref} (¶{self.paragraph})"
+
+    def __str__(self):
+        return f"{self.reference}: {self.marker} {self.text}"
+
+
+class SearchIndex:
+    """An inverted index of the words in SFM and ODT books, keyed to their
+    positions: source (book name), chapter number, paragraph index, and
+    verse. Chapters are indexed, and re-indexed when they change, one at a
+    time, so that an index saved to disk can be brought up to date without
+    reading unchanged chapters again."""
+
+    def __init__(self, normalization_form="NFC"):
+        self.normalization_form = normalization_form
+        # (source, chapter number): {"fingerprint": ..., "paragraphs": [[marker, text], ...]}
+        self.chapters = dict()
+        # word: {(source, chapter number): {(paragraph index, verse), ...}}
+        self.postings = dict()
+        # (source, chapter number): set of words, to remove a chapter's postings.
+        self._chapter_words = dict()
+
+    def __len__(self):
+        return len(self.postings)
+
+    def is_current(self, source, number, fingerprint):
+        chapter = self.chapters.get((source, number))
+        return chapter is not None and chapter["fingerprint"] == fingerprint
+
+    def add_chapter(self, source, number, fingerprint, paragraphs):
+        """Index one chapter, replacing any earlier version of it. Paragraphs
+        are given as (marker, [(verse, text), ...])."""
+        key = (source, number)
+        self.remove_chapter(source, number)
+        words = set()
+        stored = list()
+        for p_idx, (marker, items) in enumerate(paragraphs):
+            for verse, text in items:
+                for word in tokenize(text, self.normalization_form):
+                    chapters = self.postings.setdefault(word, dict())
+                    chapters.setdefault(key, set()).add((p_idx, verse))
+                    words.add(word)
+            stored.append([marker, " ".join(t for _, t in items)])
+        self.chapters[key] = {"fingerprint": fingerprint, "paragraphs": stored}
+        self._chapter_words[key] = words
+
+    def remove_chapter(self, source, number):
+        key = (source, number)
+        for word in self._chapter_words.pop(key, set()):
+            chapters = self.postings[word]
+            chapters.pop(key, None)
+            if not chapters:
+                del self.postings[word]
+        self.chapters.pop(key, None)
+
+    def remove_missing_chapters(self, source, present, numbers=None):
+        """Remove the source's indexed chapters that aren't in the present
+        chapter numbers, among the given numbers (all if None). Return the
+        number of chapters removed."""
+        missing = [
+            n
+            for s, n in self.chapters
+            if s == source and n not in present and (numbers is None or n in numbers)
+        ]
+        for number in missing:
+            self.remove_chapter(source, number)
+        if missing:
+            logging.info(f'Removed {len(missing)} missing chapters of "{source}"')
+        return len(missing)
+
+    def add_sfm_book(self, sfm_book, chapters="all"):
+        """Index the SFM book's chapters that have changed since they were
+        last indexed, and remove those that are no longer in it. Return the
+        number of chapters (re-)indexed."""
+        updated = 0
+        numbers = parse_chapter_numbers(chapters)
+        self.remove_missing_chapters(
+            sfm_book.name, {n for n, _, _ in sfm_book.chapter_index}, numbers
+        )
+        for number, start, end in sfm_book.chapter_index:
+            if numbers is not None and number not in numbers:
+                continue
+            raw = sfm_book.decode(start, end)
+            fingerprint = text_fingerprint(raw, None, whitespace=None)
+            if self.is_current(sfm_book.name, number, fingerprint):
+                continue
+            chapter = sfm_book.get_chapters([number])[0]
+            paragraphs = list()
+            verse = None
+            for p in chapter.body_paragraphs:
+                items, verse = get_paragraph_items(p, verse)
+                paragraphs.append((p.marker, items))
+            self.add_chapter(sfm_book.name, number, fingerprint, paragraphs)
+            updated += 1
+        logging.info(f'Indexed {updated} changed chapters of "{sfm_book.name}"')
+        return updated
+
+    def add_odt_book(self, odt_book, chapters="all"):
+        """Index the ODT book's chapters whose files have changed since they
+        were last indexed, and remove those that no longer have a file.
+        Unchanged files aren't opened. Return the number of chapters
+        (re-)indexed."""
+        numbers = parse_chapter_numbers(chapters)
+        self.remove_missing_chapters(odt_book.name, odt_book.chapter_paths, numbers)
+        changed = list()
+        for number, chapter in odt_book.get_chapters(numbers).items():
+            stat = chapter.file_path.stat()
+            fingerprint = f"{stat.st_size}:{stat.st_mtime_ns}"
+            if not self.is_current(odt_book.name, number, fingerprint):
+                changed.append((chapter, fingerprint))
+        loader = OdtChapterLoader([c for c, _ in changed], prefetch=odt_book.prefetch)
+        for (_, fingerprint), chapter in zip(changed, loader):
+            pinned = odt_book.pool.pin(chapter) if odt_book.pool else nullcontext()
+            with pinned:
+                paragraphs = list()
+                verse = None
+                for p in chapter.paragraphs:
+                    items, verse = get_paragraph_items(p, verse)
+                    paragraphs.append((p.sfm_marker, items))
+            self.add_chapter(odt_book.name, chapter.number, fingerprint, paragraphs)
+        logging.info(f'Indexed {len(changed)} changed chapters of "{odt_book.name}"')
+        return len(changed)
+
+    def search(self, query, source=None):
+        """Return SearchHits for the paragraphs (and verses) that contain every
+        word of the query, in order of source, chapter, and position."""
+        words = tokenize(query, self.normalization_form)
+        if not words:
+            return list()
+        postings = list()
+        for word in set(words):
+            chapters = self.postings.get(word)
+            if not chapters:
+                return list()
+            postings.append(chapters)
+        # Start with the rarest word.
+        postings.sort(key=len)
+        hits = list()
+        for key, positions in postings[0].items():
+            if source is not None and key[0] != source:
+                continue
+            positions = set(positions)
+            for chapters in postings[1:]:
+                others = chapters.get(key)
+                if others is None:
+                    positions = None
+                    break
+                positions = self._intersect(positions, others)
+                if not positions:
+                    break
+            if not positions:
+                continue
+            paragraphs = self.chapters[key]["paragraphs"]
+            for p_idx, verse in positions:
+                marker, text = paragraphs[p_idx]
+                hits.append(SearchHit(key[0], key[1], p_idx, verse, marker, text))
+        hits.sort(
+            key=lambda h: (h.source, h.chapter, h.paragraph, get_verse_key(h.verse))
+        )
+        return hits
+
+    @staticmethod
+    def _intersect(positions, others):
+        """Keep positions in the same paragraph as one of the others; the
+        words may be in different verses of the paragraph."""
+        paragraphs = {p for p, _ in others}
+        return {(p, v) for p, v in positions if p in paragraphs}
+
+    def save(self, file_path):
+        """Save the index as JSON."""
+        chapters = list()
+        for (source, number), chapter in self.chapters.items():
+            chapters.append(dict(chapter, source=source, number=number))
+        postings = {
+            word: [[s, n, sorted(pos, key=str)] for (s, n), pos in chapters_.items()]
+            for word, chapters_ in self.postings.items()
+        }
+        data = {
+            "version": SEARCH_INDEX_VERSION,
+            "normalization_form": self.normalization_form,
+            "chapters": chapters,
+            "postings": postings,
+        }
+        Path(file_path).write_text(json.dumps(data, ensure_ascii=False), "utf-8")
+        logging.info(f"Saved search index to: {file_path}")
+
+    @classmethod
+    def load(cls, file_path):
+        """Return the index saved in the given file."""
+        data = json.loads(Path(file_path).read_text("utf-8"))
+        if data.get("version") != SEARCH_INDEX_VERSION:
+            raise ValueError(f"Unsupported search index version in {file_path}")
+        index = cls(normalization_form=data["normalization_form"])
+        for chapter in data["chapters"]:
+            key = (chapter.pop("source"), chapter.pop("number"))
+            index.chapters[key] = chapter
+            index._chapter_words[key] = set()
+        for word, chapters in data["postings"].items():
+            index.postings[word] = dict()
+            for source, number, positions in chapters:
+                key = (source, number)
+                index.postings[word][key] = {tuple(p) for p in positions}
+                index._chapter_words[key].add(word)
+        return index
@@ -1,6 +1,9 @@
+import mmap
 import re
 from pathlib import Path
 
+from ..base import SFM_ONLY_MARKERS
+from .base import get_sfm_encoding, is_ascii_compatible
 from .elements import SfmParagraph
 
 
@@ -8,13 +11,25 @@ class SfmChapter:
     """A complete SFM Chapter, with one or more paragraphs and zero or more verses."""
 
     def __init__(self, raw_sfm=None, parent=None):
+        self._body_paragraphs = None
         self._number = None
         self._odt_styles = None
+        self._paragraphs = None
         self.parent = parent
         self._sfm_raw = None
         if raw_sfm is not None:
             self.sfm_raw = raw_sfm
 
+    @property
+    def body_paragraphs(self):
+        """Paragraphs that correspond to ODT paragraphs, i.e. excluding
+        file-level markers like "\\id" and "\\usfm"."""
+        if self._body_paragraphs is None:
+            self._body_paragraphs = [
+                p for p in self.paragraphs if p.marker not in SFM_ONLY_MARKERS
+            ]
+        return self._body_paragraphs
+
     @property
     def intro(self):
         """Returns initial characters of text element; used in logging."""
@@ -45,18 +60,23 @@ class SfmChapter:
         """A multiline text with a specific, defined style. It may also contain
         "spans" or "verses", which might have their own, character-level styles."""
 
-        paragraphs = []
-        for line in self.sfm_raw.splitlines():
-            if len(line) == 0:
-                continue
-            elif line.startswith("\\c"):
-                continue
-            elif line.startswith("\\v"):
-                # Add to previous line's paragraph.
-                p = paragraphs.pop()
-                line = f"{p.sfm_raw}\n{line}"
-            paragraphs.append(SfmParagraph(line, parent=self))
-        return paragraphs
+        if self._paragraphs is None:
+            # Lines of each paragraph, joined once they're all collected.
+            paragraph_lines = []
+            for line in self.sfm_raw.splitlines():
+                if len(line) == 0:
+                    continue
+                elif line.startswith("\\c"):
+                    continue
+                elif line.startswith("\\v") and paragraph_lines:
+                    # Add to previous line's paragraph.
+                    paragraph_lines[-1].append(line)
+                    continue
+                paragraph_lines.append([line])
+            self._paragraphs = [
+                SfmParagraph("\n".join(lines), parent=self) for lines in paragraph_lines
+            ]
+        return self._paragraphs
 
     @property
     def odt_styles(self):
@@ -83,6 +103,8 @@ class SfmChapter:
     @sfm_raw.setter
     def sfm_raw(self, value):
         self._sfm_raw = value
+        self._body_paragraphs = None
+        self._paragraphs = None
 
     @property
     def verses(self):
@@ -104,10 +126,22 @@ class SfmChapter:
 class SfmBook:
     """A complete SFM file with one or more Chapters.
     The data is read from the source file. Any changes are written to a new
-    destination file."""
+    destination file. The file is memory-mapped rather than read, and each
+    chapter's text is only decoded when the chapter is used. The encoding is
+    given by the file's byte order mark, if any, else by `encoding` (UTF-8 by
+    default)."""
 
-    def __init__(self, file_path=None, odt_dir_path=None, normalization_mode=None):
+    RE_CHAPTER = re.compile(r"\\c ([0-9]+)?")
+    RE_CHAPTER_BYTES = re.compile(rb"\\c ([0-9]+)?")
+
+    def __init__(
+        self, file_path=None, odt_dir_path=None, normalization_mode=None, encoding=None
+    ):
+        self._chapter_index = None
         self._chapters = None
+        self._data = None
+        self._data_offset = 0
+        self.encoding = encoding
         self.file_path = None
         if file_path is not None:
             self.file_path = Path(file_path)
@@ -120,13 +154,62 @@ class SfmBook:
         self.parent = None
         self._sfm_raw = None
 
+    @classmethod
+    def from_text(cls, text, name="", **kwargs):
+        """Return a book of the given SFM text, held in memory."""
+        book = cls(**kwargs)
+        book._data = cls._newlines(text)
+        book._name = name
+        return book
+
     def __str__(self):
         return self.name
 
+    @property
+    def data(self):
+        """Return the SFM file's data: a read-only memory map of its bytes, or
+        its decoded text if its encoding can't be searched as bytes."""
+        if self._data is None:
+            with self.file_path.open("rb") as f:
+                head = f.read(4)
+                self.encoding, self._data_offset = get_sfm_encoding(head, self.encoding)
+                if not is_ascii_compatible(self.encoding):
+                    f.seek(0)
+                    self._data = self._newlines(f.read().decode(self.encoding))
+                    self._data_offset = 0
+                elif len(head) == 0:  # empty files can't be mapped
+                    self._data = b""
+                else:
+                    self._data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        return self._data
+
+    def close(self):
+        """Release the memory-mapped file. Chapters already read are kept."""
+        if self.file_path is None:
+            return
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._data = None
+        self._chapter_index = None
+
+    def decode(self, start, end):
+        """Return the SFM text between the given data offsets."""
+        data = self.data[start:end]
+        if isinstance(data, bytes):
+            data = self._newlines(data.decode(self.encoding))
+        return data
+
+    @staticmethod
+    def _newlines(text):
+        # Like text files read in Python, use only "\n" as the newline.
+        return text.replace("\r\n", "\n").replace("\r", "\n")
+
     @property
     def id_text(self):
         if self._id_text is None:
-            m = re.search(r"\\id (.*)\n", self.sfm_raw)
+            # The "\id" line is in the text before the first chapter.
+            _, start, end = self.chapter_index[0]
+            m = re.search(r"\\id (.*)\n", self.decode(start, end))
             if m:
                 self._id_text = m[1]
         return self._id_text
@@ -143,21 +226,48 @@ class SfmBook:
     @property
     def sfm_raw(self):
         if self._sfm_raw is None:
-            self._sfm_raw = self.file_path.read_text()
+            data = self.data  # also finds the offset of the text
+            self._sfm_raw = self.decode(self._data_offset, len(data))
         return self._sfm_raw
 
+    @property
+    def chapter_index(self):
+        """Return (number, start, end) offsets of each chapter in the SFM data,
+        found without decoding, splitting or parsing it. The text before the
+        first "\\c" marker is chapter 0."""
+        if self._chapter_index is None:
+            data = self.data
+            regex = self.RE_CHAPTER if isinstance(data, str) else self.RE_CHAPTER_BYTES
+            index = list()
+            number = 0
+            start = self._data_offset
+            for m in regex.finditer(data, start):
+                index.append((number, start, m.start()))
+                number = int(m[1]) if m[1] is not None else None
+                start = m.start()
+            index.append((number, start, len(data)))
+            self._chapter_index = index
+        return self._chapter_index
+
     @property
     def chapters(self):
         if self._chapters is None:
-            chapters = []
-            init = True
-            for c in re.split(r"\\c ", self.sfm_raw):
-                if init:
-                    sfm_raw = c.rstrip(" ")
-                    init = False
-                else:
-                    sfm_raw = f"\\c {c.rstrip(' ')}"
-                # TODO: Do we need to preserve chapter numbers for some reason?
-                chapters.append(SfmChapter(sfm_raw, parent=self))
-            self._chapters = chapters.copy()
+            self._chapters = [
+                SfmChapter(self.decode(start, end).rstrip(" "), parent=self)
+                for _, start, end in self.chapter_index
+            ]
         return self._chapters
+
+    def get_chapters(self, numbers=None):
+        """Return chapters with the given numbers, or all chapters if None.
+        Only the selected chapters' slices of the SFM text are parsed."""
+        if numbers is None:
+            return self.chapters
+        numbers = set(numbers)
+        if self._chapters is not None:
+            return [c for c in self._chapters if c.number in numbers]
+        return [
+            SfmChapter(self.decode(start, end).rstrip(" "), parent=self)
+            for number, start, end in self.chapter_index
+            if number in numbers
+        ]
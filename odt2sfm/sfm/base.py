@@ -1,19 +1,79 @@
-import re
-
-RE_SFM_TYPE = re.compile(r"(?<=\\)[a-z]+(?=0-9)*")
-SFM_SPAN_TYPES_NO_END_MARKER = (
-    # see: https://github.com/ubsicap/usfm/blob/master/sty/usfm.sty
-    "v",  # verse
-    "th",  # table column heading
-    "tc",  # table column text
-    "thc",  # table column heading centered
-    "tcc",  # table column text centered
-    "thr",  # table column heading right
-    "tcr",  # table column text right
+import codecs
+
+from .stylesheet import get_stylesheet
+
+# Byte order marks, longest first, and the encodings they imply.
+SFM_BOMS = (
+    (codecs.BOM_UTF32_LE, "utf-32"),
+    (codecs.BOM_UTF32_BE, "utf-32"),
+    (codecs.BOM_UTF8, "utf-8"),
+    (codecs.BOM_UTF16_LE, "utf-16"),
+    (codecs.BOM_UTF16_BE, "utf-16"),
 )
+SFM_DEFAULT_ENCODING = "utf-8"
+
+
+def get_sfm_marker(sfm):
+    """Return the stylesheet entry for the given SFM marker, or None if the
+    stylesheet doesn't define it."""
+    return get_stylesheet().get(sfm)
 
 
 def get_sfm_type(sfm):
-    m = RE_SFM_TYPE.search(sfm)
-    if m:
-        return m[0]
+    """Return the marker's type, e.g. "li" for "\\li1"."""
+    marker = get_sfm_marker(sfm)
+    if marker:
+        return marker.base
+
+
+def get_span_end_marker(sfm):
+    """Return the end marker that closes a span opened by the given SFM marker,
+    or None for spans that have no end marker (e.g. verses and table cells)."""
+    marker = get_sfm_marker(sfm)
+    if marker:
+        return marker.span_end_marker
+    # Unknown markers are closed the usual way.
+    return f"{sfm}*"
+
+
+def is_table_cell_marker(sfm):
+    """Return True for table cell markers (e.g. "\\tc1", "\\th2"): character
+    markers that, unlike verses, start a span that runs up to the next cell."""
+    marker = get_sfm_marker(sfm)
+    if marker is None or marker.name == "v":
+        return False
+    return marker.is_character and marker.span_end_marker is None
+
+
+def get_sfm_encoding(head, encoding=None):
+    """Return (encoding, offset) for SFM data that starts with the given bytes:
+    the encoding given by a byte order mark (BOM), else the given encoding, else
+    UTF-8; and the offset of the text after any UTF-8 BOM. UTF-16 and UTF-32
+    BOMs are kept, since those codecs read them."""
+    for bom, bom_encoding in SFM_BOMS:
+        if head.startswith(bom):
+            if encoding is not None and codecs.lookup(encoding).name not in (
+                codecs.lookup(bom_encoding).name,
+                "utf-8-sig",
+            ):
+                raise ValueError(
+                    f"Encoding {encoding} conflicts with byte order mark for {bom_encoding}"
+                )
+            if bom_encoding == "utf-8":
+                return bom_encoding, len(bom)
+            return bom_encoding, 0
+    if encoding is None:
+        encoding = SFM_DEFAULT_ENCODING
+    elif codecs.lookup(encoding).name == "utf-8-sig":
+        encoding = "utf-8"
+    return encoding, 0
+
+
+def is_ascii_compatible(encoding):
+    """Return True if SFM markers and numbers are encoded as single ASCII bytes
+    in the given encoding, so the encoded data can be searched for them."""
+    sample = "\\c 0123456789 \\v\n"
+    try:
+        return sample.encode(encoding) == sample.encode("ascii")
+    except UnicodeError:
+        return False
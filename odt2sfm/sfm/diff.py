@@ -0,0 +1,155 @@
+import json
+
+from ..base import text_fingerprint
+from . import SfmChapter
+from .base import get_sfm_marker
+
+CHANGE_KINDS = ("added", "removed", "changed")
+
+
+def get_chapter_units(chapter):
+    """Return {key: text} of the chapter's diffable units, in order. Each verse
+    is a unit keyed "v<number>"; it includes the markers of verse-text
+    paragraphs (e.g. "\\p", "\\q1") that begin within it, so that re-breaking a
+    verse's paragraphs counts as a change. Other paragraphs (e.g. headings),
+    and text before a chapter's first verse, are units of their own, keyed by
+    marker, the verse they follow, and their place among such units after
+    that verse, e.g. "\\s@v3#1". Spans are included with their markers (e.g.
+    "\\bd word\\bd*"), so that a change of formatting alone is a change."""
+    units = dict()
+    verse = None
+    # The unit that verse text is added to.
+    key = None
+    others = 0
+    for p in chapter.body_paragraphs:
+        marker = get_sfm_marker(p.marker)
+        is_verse_text = marker is not None and marker.is_verse_text
+        if key is None or not is_verse_text:
+            others += 1
+            key = f"{p.marker}@v{verse or 0}#{others}"
+        parts = [p.marker]
+        for child in p.children:
+            if getattr(child, "marker", None) == "\\v":
+                if parts != [p.marker]:
+                    _add_unit_text(units, key, parts)
+                    parts = list()
+                # Otherwise the paragraph's marker goes with the new verse.
+                verse = child.text.strip()
+                key = f"v{verse}"
+                others = 0
+            elif child.NODE_TYPE == "span":
+                parts.append(child.sfm_raw.strip())
+            else:
+                parts.append(child.text)
+        if parts:
+            _add_unit_text(units, key, parts)
+        if not is_verse_text:
+            key = None
+    return units
+
+
+def _add_unit_text(units, key, parts):
+    text = " ".join(parts)
+    units[key] = f"{units[key]} {text}" if key in units else text
+
+
+class SfmChange:
+    """One verse or paragraph that was added, removed, or changed."""
+
+    def __init__(self, chapter, key, kind, old_text=None, new_text=None):
+        if kind not in CHANGE_KINDS:
+            raise ValueError(f"Invalid change kind: {kind}")
+        self.chapter = chapter
+        self.key = key
+        self.kind = kind
+        self.old_text = old_text
+        self.new_text = new_text
+
+    def as_dict(self):
+        return {
+            "chapter": self.chapter,
+            "key": self.key,
+            "kind": self.kind,
+            "old": self.old_text,
+            "new": self.new_text,
+        }
+
+    def __str__(self):
+        if self.kind == "added":
+            detail = f'+ "{self.new_text}"'
+        elif self.kind == "removed":
+            detail = f'- "{self.old_text}"'
+        else:
+            detail = f'"{self.old_text}" -> "{self.new_text}"'
+        return f"{self.chapter}:{self.key} {self.kind}: {detail}"
+
+
+class SfmBookDiff:
+    """The verses and paragraphs that differ between two versions of an SFM
+    book, e.g. the last export and the translator's edited file. Chapters
+    whose text is identical are skipped without being parsed; the others are
+    compared by the fingerprints of their units, so the comparison takes time
+    proportional to the size of the books."""
+
+    def __init__(self, old_book, new_book, normalization_form="NFC"):
+        self.old_book = old_book
+        self.new_book = new_book
+        self.normalization_form = normalization_form
+        self._changes = None
+
+    @property
+    def changes(self):
+        if self._changes is None:
+            self._changes = self._get_changes()
+        return self._changes
+
+    @property
+    def changed_chapters(self):
+        return sorted({c.chapter for c in self.changes})
+
+    def _get_changes(self):
+        old_index = {n: (s, e) for n, s, e in self.old_book.chapter_index}
+        new_index = {n: (s, e) for n, s, e in self.new_book.chapter_index}
+        changes = list()
+        for number in sorted(set(old_index) | set(new_index), key=lambda n: n or 0):
+            old_text = new_text = ""
+            if number in old_index:
+                old_text = self.old_book.decode(*old_index[number])
+            if number in new_index:
+                new_text = self.new_book.decode(*new_index[number])
+            if old_text == new_text:
+                continue
+            changes.extend(self._compare_chapters(number, old_text, new_text))
+        return changes
+
+    def _compare_chapters(self, number, old_text, new_text):
+        old_units = get_chapter_units(SfmChapter(old_text)) if old_text else dict()
+        new_units = get_chapter_units(SfmChapter(new_text)) if new_text else dict()
+        changes = list()
+        for key, text in new_units.items():
+            old = old_units.get(key)
+            if old is None:
+                changes.append(SfmChange(number, key, "added", new_text=text))
+            elif text_fingerprint(old, self.normalization_form) != text_fingerprint(
+                text, self.normalization_form
+            ):
+                changes.append(SfmChange(number, key, "changed", old, text))
+        for key, text in old_units.items():
+            if key not in new_units:
+                changes.append(SfmChange(number, key, "removed", old_text=text))
+        return changes
+
+    def to_json(self):
+        return json.dumps(
+            {
+                "old": str(self.old_book.file_path),
+                "new": str(self.new_book.file_path),
+                "changed_chapters": self.changed_chapters,
+                "changes": [c.as_dict() for c in self.changes],
+            },
+            ensure_ascii=False,
+            indent=2,
+        )
+
+    def __str__(self):
+        return "\n".join(str(c) for c in self.changes)
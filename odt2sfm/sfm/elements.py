@@ -1,6 +1,12 @@
 import re
 
-from ..base import SFM_TEXT_SEP, normalize_text, undo_paratext_replacements
+from ..base import (
+    SFM_TEXT_SEP,
+    normalize_text,
+    text_fingerprint,
+    undo_paratext_replacements,
+)
+from .base import get_span_end_marker, is_table_cell_marker
 
 
 class SfmElement:
@@ -11,6 +17,9 @@ class SfmElement:
     RE_SFM = re.compile(r"(\\[a-z]+[0-9]*[ *])")
 
     def __init__(self, raw_text, odt_style=None, parent=None):
+        self._children = None
+        # Normalization form: text_fingerprint of the SFM lines
+        self._fingerprints = dict()
         self._marker = None
         self._marker_separator = None
         self._odt_style = odt_style
@@ -24,6 +33,11 @@ class SfmElement:
     def children(self):
         """Mimic ODT doc behavior by dividing paragraph into SfmText and SfmSpan
         Elements."""
+        if self._children is None:
+            self._children = self._get_children()
+        return self._children
+
+    def _get_children(self):
         children = []
         # Divide SFM on SFM markers.
         parts = re.split(
@@ -32,16 +46,23 @@ class SfmElement:
         )
         span_marker = None
         verse_marker = None
+        cell_marker = None
         prev_part = None
-        for part in parts:
+        for i, part in enumerate(parts):
             part = part.rstrip("\n")  # remove newlines from all splits
             child = None
             if len(part) == 0:  # ignore parts with no content
                 child = None
             elif part.startswith("\\"):  # paragraph/span/chapter marker
                 part = part.rstrip(" ")  # remove spaces from SFM markers
+                if cell_marker and not span_marker:
+                    # The previous table cell has no text of its own.
+                    children.append(SfmSpan(f"{cell_marker} ", parent=self))
+                    cell_marker = None
                 if part == "\\v" and not verse_marker:
                     verse_marker = True
+                elif not span_marker and is_table_cell_marker(part):
+                    cell_marker = part
                 elif not span_marker:  # capture opening span SFM marker
                     span_marker = part
                     # print(f"{span_marker=}")
@@ -58,22 +79,36 @@ class SfmElement:
                 verse_marker = None
             elif span_marker:
                 child = None
-            elif part != "":  # ignore empty part
-                child = SfmText(part, parent=self)
+            else:
+                if i + 1 < len(parts) and is_table_cell_marker(parts[i + 1].rstrip()):
+                    # Remove the space that separates the text from the next cell.
+                    part = part.removesuffix(" ")
+                if cell_marker:  # handle table cell text
+                    # The cell holds the text up to any text separator.
+                    cell_text, sep, part = part.partition(SFM_TEXT_SEP)
+                    children.append(SfmSpan(f"{cell_marker} {cell_text}", parent=self))
+                    cell_marker = None
+                    if sep:
+                        child = SfmText(part, parent=self)
+                elif part != "":  # ignore empty part
+                    child = SfmText(part, parent=self)
             prev_part = part
             if child:
                 children.append(child)
+        if cell_marker:
+            # The last table cell has no text.
+            children.append(SfmSpan(f"{cell_marker} ", parent=self))
 
         # Split text into separate items at each double-space.
-        ct = len(children)
-        for i, child in enumerate(children.copy()[::-1]):
-            idx = ct - 1 - i
+        split_children = list()
+        for child in children:
             if isinstance(child, SfmText):
                 texts = child.text.split(SFM_TEXT_SEP)
                 if len(texts) > 1:
-                    children.pop(idx)
-                    for text in texts[::-1]:
-                        children.insert(idx, SfmText(text))
+                    split_children.extend(SfmText(text) for text in texts)
+                    continue
+            split_children.append(child)
+        children = split_children
 
         return children
 
@@ -121,6 +156,8 @@ class SfmElement:
         if not value.startswith("\\"):
             raise ValueError(f'SFM text does not begin with a backslash: "{value}"')
         self._sfm_raw = value
+        self._children = None
+        self._fingerprints = dict()
 
     @property
     def spans(self):
@@ -174,23 +211,22 @@ class SfmSpan(SfmElement):
     it's a verse number reference."""
 
     NODE_TYPE = "span"
-    RE_SFM_END = re.compile(r"\\[a-z]+\*$")
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
         self._end_marker = None
-        if self.end_marker and self.marker != self.end_marker.rstrip("*"):
-            raise ValueError(f"Unmatched markers: {self.marker} & {self.end_marker}")
+        # Verify that the span is closed by its marker's end marker.
+        _ = self.end_marker
 
     @property
     def end_marker(self):
         if self._end_marker is None:
-            if self.marker == "\\v":  # verses are spans with no end markers
+            end_marker = get_span_end_marker(self.marker)
+            if end_marker is None:  # verses are spans with no end markers
                 return self._end_marker
-            match = self.RE_SFM_END.search(self.sfm_raw)
-            if match is None:
-                raise ValueError(f"No intial SFM marker: {self.sfm_raw}")
-            self._end_marker = match[0].rstrip()
+            if not self.sfm_raw.endswith(end_marker):
+                raise ValueError(f"Unmatched markers: {self.marker} & {self.sfm_raw}")
+            self._end_marker = end_marker
         return self._end_marker
 
     @property
@@ -202,7 +238,7 @@ class SfmSpan(SfmElement):
             if self.end_marker and self.end_marker.rstrip("*") == self.marker:
                 # Remove "closing" marker.
                 text = text.removesuffix(self.end_marker)
-            else:  # verse span
+            elif self.marker == "\\v":  # verse span
                 # Remove end space.
                 text = text.rstrip(" ")
             self._text = text
@@ -214,17 +250,39 @@ class SfmParagraph(SfmElement):
     more verses. They can contain zero or more spans."""
 
     NODE_TYPE = "paragraph"
+    RE_ANY_SFM = re.compile(r"\\\+?[a-z]+[0-9]*(?:\*| ?)")
+
+    @property
+    def plain_text(self):
+        """Return the paragraph's text without its markers, taken from its raw
+        SFM without parsing its children. It has the same words as `text`,
+        but its spacing may differ."""
+        text = self.sfm_raw.removeprefix(f"{self.marker}{self._marker_separator}")
+        text = self.RE_ANY_SFM.sub("", text).replace(SFM_TEXT_SEP, " ")
+        return self._sanitize(text)
+
+    def fingerprint(self, normalization_form):
+        """Return the text_fingerprint of the paragraph's raw SFM lines, which
+        doesn't need its children. Two paragraphs with the same SFM text have
+        the same children, so an ODT paragraph whose exported SFM has the same
+        fingerprint doesn't need to be updated from this one."""
+        if normalization_form not in self._fingerprints:
+            self._fingerprints[normalization_form] = text_fingerprint(
+                self.sfm_raw, normalization_form, whitespace="lines"
+            )
+        return self._fingerprints[normalization_form]
 
     @property
     def text(self):
         if self._text is None:
-            text = ""
-            for i, c in enumerate(self.children):
+            children = self.children
+            parts = list()
+            for i, c in enumerate(children):
                 if hasattr(c, "end_marker") and c.end_marker is not None:
-                    text += f"{c.text}"
-                elif i == len(self.children) - 1:  # no space after last child
-                    text += f"{c.text}"
+                    parts.append(c.text)
+                elif i == len(children) - 1:  # no space after last child
+                    parts.append(c.text)
                 else:
-                    text += f"{c.text} "
-            self._text = text
+                    parts.append(f"{c.text} ")
+            self._text = "".join(parts)
         return self._text
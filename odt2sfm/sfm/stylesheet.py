@@ -0,0 +1,145 @@
+import re
+from functools import lru_cache
+from pathlib import Path
+
+USFM_STY_PATH = Path(__file__).parent / "usfm.sty"
+RE_NUMBERED_MARKER = re.compile(r"^([a-z]+)([0-9]+)$")
+# Highest level generated for numbered markers (e.g. "\li1"..."\li9", "\tc9").
+MAX_MARKER_LEVEL = 9
+
+
+class SfmMarker:
+    """Properties of one SFM marker, as defined in a USFM stylesheet."""
+
+    def __init__(
+        self,
+        name,
+        style_type=None,
+        end_marker=None,
+        text_properties=None,
+        base=None,
+        text_type=None,
+    ):
+        self.name = name
+        self.style_type = style_type
+        self.end_marker = end_marker
+        self.text_properties = text_properties or tuple()
+        self.base = base if base is not None else name
+        self.text_type = text_type
+
+    @property
+    def is_character(self):
+        return self.style_type == "character"
+
+    @property
+    def is_note(self):
+        return self.style_type == "note"
+
+    @property
+    def is_paragraph(self):
+        return self.style_type == "paragraph"
+
+    @property
+    def is_verse_text(self):
+        return self.text_type == "versetext"
+
+    @property
+    def span_end_marker(self):
+        """Return the end marker that closes this marker when used as a span, or
+        None if the span has no end marker (e.g. verses and table cells)."""
+        if self.end_marker:
+            return f"\\{self.end_marker}"
+        elif self.is_character:
+            return None
+        # Non-character markers used as spans are closed the usual way.
+        return f"\\{self.name}*"
+
+    def variant(self, name):
+        """Return a copy of this marker under a different (numbered) name."""
+        end_marker = None
+        if self.end_marker:
+            end_marker = f"{name}*"
+        return SfmMarker(
+            name,
+            style_type=self.style_type,
+            end_marker=end_marker,
+            text_properties=self.text_properties,
+            base=self.base,
+            text_type=self.text_type,
+        )
+
+    def __repr__(self):
+        return f"<SfmMarker \\{self.name} ({self.style_type})>"
+
+
+class SfmStylesheet:
+    """A table of SFM marker properties read once from a USFM stylesheet
+    (".sty") file. Numbered variants are precomputed, so every lookup is a
+    single dict access."""
+
+    def __init__(self, file_path=USFM_STY_PATH):
+        self.file_path = Path(file_path)
+        self._markers = None
+
+    @property
+    def markers(self):
+        if self._markers is None:
+            markers = self._read_markers()
+            self._add_numbered_variants(markers)
+            self._markers = markers
+        return self._markers
+
+    def get(self, marker):
+        """Return the SfmMarker for e.g. "\\li1", "li1", "\\+bd" or "\\bd*"."""
+        if marker is None:
+            return None
+        return self.markers.get(marker.lstrip("\\+").rstrip("*"))
+
+    def _read_markers(self):
+        markers = dict()
+        entry = None
+        for line in self.file_path.read_text(encoding="utf-8").splitlines():
+            line = line.split("#", maxsplit=1)[0].strip()
+            if not line.startswith("\\"):
+                continue
+            key, _, value = line.partition(" ")
+            key = key[1:].lower()
+            value = value.strip()
+            if key == "marker":
+                entry = SfmMarker(value)
+                match = RE_NUMBERED_MARKER.match(value)
+                if match:
+                    entry.base = match[1]
+                markers[value] = entry
+            elif entry is None:
+                continue
+            elif key == "endmarker":
+                entry.end_marker = value
+            elif key == "styletype":
+                entry.style_type = value.lower()
+            elif key == "texttype":
+                entry.text_type = value.lower()
+            elif key == "textproperties":
+                entry.text_properties = tuple(value.lower().split())
+        return markers
+
+    @staticmethod
+    def _add_numbered_variants(markers):
+        """Fill in missing levels of numbered markers (e.g. "\\tc6") from the
+        highest level that the stylesheet defines."""
+        highest = dict()
+        for name, marker in markers.items():
+            match = RE_NUMBERED_MARKER.match(name)
+            if match:
+                level = int(match[2])
+                if level > highest.get(match[1], (0, None))[0]:
+                    highest[match[1]] = (level, marker)
+        for base, (level, marker) in highest.items():
+            for i in range(level + 1, MAX_MARKER_LEVEL + 1):
+                markers.setdefault(f"{base}{i}", marker.variant(f"{base}{i}"))
+
+
+@lru_cache(maxsize=None)
+def get_stylesheet(file_path=USFM_STY_PATH):
+    """Return the stylesheet for the given file, reading it only once."""
+    return SfmStylesheet(file_path)
@@ -0,0 +1,218 @@
+import logging
+from collections import Counter
+
+from .alignment import align_paragraphs
+
+
+class PreflightError(ValueError):
+    """Raised before any ODT file is updated when verifying the chapters to
+    update found errors in some of them."""
+
+    def __init__(self, verifications):
+        # The verifications of the chapters that have errors.
+        self.verifications = verifications
+        chapters = ", ".join(str(v.number) for v in verifications)
+        super().__init__(f"Errors found in ch. {chapters}; no ODT files were updated.")
+
+
+class Mismatch:
+    """One difference found between an SFM chapter and its ODT chapter.
+    Errors prevent a paragraph (or chapter) from being updated; warnings are
+    informational."""
+
+    def __init__(self, kind, message, sfm_index=None, odt_index=None, error=True):
+        self.kind = kind
+        self.message = message
+        self.sfm_index = sfm_index
+        self.odt_index = odt_index
+        self.error = error
+
+    def as_dict(self):
+        return {
+            "kind": self.kind,
+            "message": self.message,
+            "sfm_index": self.sfm_index,
+            "odt_index": self.odt_index,
+            "error": self.error,
+        }
+
+    def __str__(self):
+        return f"{self.kind}: {self.message}"
+
+
+class ChapterVerification:
+    """The result of verifying one SFM chapter against its ODT chapter: every
+    mismatch found, plus the paired paragraphs that are ready to be updated."""
+
+    def __init__(self, number, alignment=None):
+        self.number = number
+        self.alignment = alignment
+        self.mismatches = list()
+        # (sfm_paragraph, odt_paragraph) pairs whose text needs to be updated,
+        # and their (sfm_index, odt_index) in the chapters' paragraphs.
+        self.pairs = list()
+        self.indexes = list()
+        self.unchanged = 0
+        self._updates = None
+
+    @property
+    def errors(self):
+        return [m for m in self.mismatches if m.error]
+
+    @property
+    def warnings(self):
+        return [m for m in self.mismatches if not m.error]
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    @property
+    def updates(self):
+        if self._updates is not None:
+            return self._updates
+        return len(self.pairs)
+
+    def add(self, *args, **kwargs):
+        self.mismatches.append(Mismatch(*args, **kwargs))
+
+    def as_dict(self):
+        return {
+            "chapter": self.number,
+            "updates": self.updates,
+            "unchanged": self.unchanged,
+            "mismatches": [m.as_dict() for m in self.mismatches],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Return a verification's report from its as_dict(), e.g. as sent by
+        another process."""
+        verification = cls(data["chapter"])
+        verification.unchanged = data["unchanged"]
+        verification._updates = data["updates"]
+        for m in data["mismatches"]:
+            verification.add(
+                m["kind"],
+                m["message"],
+                sfm_index=m["sfm_index"],
+                odt_index=m["odt_index"],
+                error=m["error"],
+            )
+        return verification
+
+    def release(self):
+        """Drop references to the chapters' paragraphs (and so to their
+        documents), keeping only the report and the paragraph indexes."""
+        self._updates = self.updates
+        self.alignment = None
+        self.pairs = list()
+
+    def bind(self, sfm_chapter, odt_chapter):
+        """Pair the paragraphs to update again, from the given chapters, e.g.
+        after the verification was released or for a copy of the ODT chapter
+        it was made with."""
+        sfm_paragraphs = sfm_chapter.body_paragraphs
+        odt_paragraphs = odt_chapter.paragraphs
+        self.pairs = [(sfm_paragraphs[s], odt_paragraphs[o]) for s, o in self.indexes]
+        self._updates = None
+
+    def log(self):
+        for m in self.mismatches:
+            if m.error:
+                logging.error(f"ch. {self.number}: {m}")
+            else:
+                logging.warning(f"ch. {self.number}: {m}")
+
+
+def verify_chapter(sfm_chapter, odt_chapter, normalization_mode):
+    """Walk the aligned SFM and ODT paragraphs of a chapter once, checking
+    paragraph counts, markers/styles, and child counts. Every mismatch is
+    collected rather than raised."""
+
+    if odt_chapter is None:
+        verification = ChapterVerification(sfm_chapter.number)
+        verification.add("chapter", f"No ODT lesson for ch. {sfm_chapter.number}")
+        return verification
+
+    sfm_paragraphs = sfm_chapter.body_paragraphs
+    odt_paragraphs = odt_chapter.paragraphs
+    alignment = align_paragraphs(sfm_paragraphs, odt_paragraphs)
+    verification = ChapterVerification(sfm_chapter.number, alignment=alignment)
+
+    len_sfm = len(sfm_paragraphs)
+    len_odt = len(odt_paragraphs)
+    if len_sfm != len_odt:
+        verification.add(
+            "count",
+            f"Paragraph counts differ; SFM: {len_sfm}; ODT: {len_odt}",
+            error=False,
+        )
+    for i in alignment.unmatched_sfm:
+        p = sfm_paragraphs[i]
+        verification.add(
+            "unaligned",
+            f"SFM paragraph has no ODT match: {p.marker} {p.intro}",
+            sfm_index=i,
+            error=False,
+        )
+    for i in alignment.unmatched_odt:
+        p = odt_paragraphs[i]
+        verification.add(
+            "unaligned",
+            f"ODT paragraph has no SFM match: [{p.style}] {p.intro}",
+            odt_index=i,
+            error=False,
+        )
+
+    for s, o in alignment.pairs:
+        sfm_p = sfm_paragraphs[s]
+        odt_p = odt_paragraphs[o]
+        marker = alignment.odt_markers[o]
+        if sfm_p.marker != marker:
+            verification.add(
+                "marker",
+                f'SFM marker ({sfm_p.marker}) does not correspond to ODT style ({odt_p.style}) for text "{odt_p.intro}"; expected: {marker}',
+                sfm_index=s,
+                odt_index=o,
+            )
+            continue
+        if odt_p.is_unchanged(sfm_p, normalization_mode):
+            verification.unchanged += 1
+            continue
+        len_sfm_children = len(sfm_p.children)
+        len_odt_children = len(odt_p.children)
+        if len_sfm_children < len_odt_children:
+            verification.add(
+                "children",
+                f"Not enough SFM paragraph child items ({len_sfm_children}) for ODT ({len_odt_children}): {odt_p.intro}|{sfm_p.intro}",
+                sfm_index=s,
+                odt_index=o,
+            )
+            continue
+        elif len_sfm_children > len_odt_children:
+            verification.add(
+                "children",
+                f"Extra SFM paragraph child items ({len_sfm_children}) for ODT ({len_odt_children}): {odt_p.intro}|{sfm_p.intro}",
+                sfm_index=s,
+                odt_index=o,
+                error=False,
+            )
+        verification.pairs.append((sfm_p, odt_p))
+        verification.indexes.append((s, o))
+    return verification
+
+
+def verify_span_styles(odt_chapter, verification):
+    """Add an error for each span style used in the ODT chapter's paragraphs
+    that has no SFM marker in its styles-reference file."""
+    missing = Counter()
+    for p in odt_chapter.paragraphs:
+        for span in p.spans:
+            if span.sfm_marker is None:
+                missing[span.style] += 1
+    for style, count in missing.items():
+        verification.add(
+            "style",
+            f'Span style "{style}" (used {count} times) has no SFM marker in {odt_chapter.styles_reference_name}',
+        )
@@ -0,0 +1,445 @@
+import json
+import logging
+import os
+import shutil
+import socket
+import threading
+import time
+import uuid
+from pathlib import Path
+
+from .base import normalize_text, parse_chapter_numbers, partial_output_folder
+from .metrics import ChapterMetrics, Metrics
+from .odt import OdtChapter
+from .progress import Progress
+from .sfm import SfmChapter
+from .verification import (
+    ChapterVerification,
+    PreflightError,
+    verify_chapter,
+    verify_span_styles,
+)
+
+# Folders of a queue: jobs waiting for a worker, jobs being done, and the
+# results of finished jobs.
+PENDING = "pending"
+CLAIMED = "claimed"
+RESULTS = "results"
+# File that tells idle workers that no more jobs will be added.
+CLOSED = "closed"
+JOB_KINDS = ("export", "import")
+# Seconds between a worker's refreshes of its claim while it does a job.
+HEARTBEAT_INTERVAL = 10.0
+
+
+def write_atomic(file_path, text):
+    """Write the text to a hidden temporary file next to file_path, then
+    rename it, so that nobody ever reads a partial file."""
+    file_path = Path(file_path)
+    tmp_path = file_path.with_name(f".{file_path.name}.{os.getpid()}.tmp")
+    tmp_path.write_text(text, encoding="utf-8")
+    os.replace(tmp_path, file_path)
+
+
+def get_worker_id():
+    return f"{socket.gethostname()}-{os.getpid()}"
+
+
+class WorkQueue:
+    """A queue of per-chapter conversion jobs in a folder on a filesystem that
+    is shared by a coordinator and its workers, e.g. over NFS. Each job is a
+    JSON file in pending/. A worker claims a job by renaming it to claimed/,
+    which only one worker can do, then writes its result to results/ and
+    removes its claim. Files are always written under a temporary name and
+    renamed, so a file that can be seen is complete."""
+
+    def __init__(self, path):
+        self.path = Path(path)
+        for name in (PENDING, CLAIMED, RESULTS):
+            (self.path / name).mkdir(parents=True, exist_ok=True)
+
+    def __str__(self):
+        return str(self.path)
+
+    @property
+    def pending_path(self):
+        return self.path / PENDING
+
+    @property
+    def claimed_path(self):
+        return self.path / CLAIMED
+
+    @property
+    def results_path(self):
+        return self.path / RESULTS
+
+    @property
+    def is_closed(self):
+        return (self.path / CLOSED).exists()
+
+    def open(self):
+        """Keep idle workers waiting for jobs."""
+        (self.path / CLOSED).unlink(missing_ok=True)
+
+    def close(self):
+        """Let idle workers stop once there are no pending jobs."""
+        (self.path / CLOSED).touch()
+
+    @staticmethod
+    def get_job_id(file_path):
+        # Job files are named "<job id>.json", and claims
+        # "<job id>.<worker id>.json".
+        return Path(file_path).name.split(".", 1)[0]
+
+    def put(self, job):
+        if job.get("kind") not in JOB_KINDS:
+            raise ValueError(f"Invalid job kind: {job.get('kind')}")
+        write_atomic(self.pending_path / f"{job['id']}.json", json.dumps(job))
+
+    def claim(self, worker_id):
+        """Claim the next pending job; return (claim_path, job), or None if
+        there are no pending jobs."""
+        for job_path in sorted(self.pending_path.glob("[!.]*.json")):
+            claim_path = self.claimed_path / f"{job_path.stem}.{worker_id}.json"
+            try:
+                os.rename(job_path, claim_path)
+            except FileNotFoundError:
+                # Another worker claimed it first.
+                continue
+            # A claim's age is counted from when it was made, or last
+            # refreshed by its worker.
+            os.utime(claim_path)
+            return claim_path, json.loads(claim_path.read_text(encoding="utf-8"))
+        return None
+
+    def complete(self, claim_path, result):
+        """Save a claimed job's result and release the claim."""
+        job_id = self.get_job_id(claim_path)
+        write_atomic(self.results_path / f"{job_id}.json", json.dumps(result))
+        Path(claim_path).unlink(missing_ok=True)
+
+    def get_result(self, job_id):
+        """Return the job's result, or None if it isn't done yet."""
+        result_path = self.results_path / f"{job_id}.json"
+        if not result_path.is_file():
+            return None
+        return json.loads(result_path.read_text(encoding="utf-8"))
+
+    def refresh(self, claim_path):
+        """Show that the claimed job is still being done. Return False if the
+        claim is gone, e.g. because the job was requeued."""
+        try:
+            os.utime(claim_path)
+        except FileNotFoundError:
+            return False
+        return True
+
+    def requeue_stale(self, max_age):
+        """Put jobs whose claims haven't been made or refreshed for max_age
+        seconds back in the queue, e.g. because their worker died. Return the
+        number of jobs requeued."""
+        count = 0
+        now = time.time()
+        for claim_path in self.claimed_path.glob("[!.]*.json"):
+            try:
+                if now - claim_path.stat().st_mtime < max_age:
+                    continue
+                job_id = self.get_job_id(claim_path)
+                os.rename(claim_path, self.pending_path / f"{job_id}.json")
+            except FileNotFoundError:
+                # The job was just completed.
+                continue
+            logging.warning(f"Requeued stale job: {claim_path.name}")
+            count += 1
+        return count
+
+    def remove(self, job_ids):
+        """Remove the jobs, whether pending or done, and their output files."""
+        job_ids = set(job_ids)
+        for folder in (self.pending_path, self.results_path):
+            for file_path in folder.iterdir():
+                if self.get_job_id(file_path) in job_ids:
+                    file_path.unlink(missing_ok=True)
+
+
+class QueueWorker:
+    """Do jobs from a WorkQueue until the queue is closed and has no pending
+    jobs, or until no job has been found for idle_timeout seconds. Exports
+    return the chapter's SFM text; imports write the updated ODT file to the
+    queue's results folder, unless verifying the chapter found errors. While
+    a job is being done, its claim is refreshed every heartbeat_interval
+    seconds, so that a slow job isn't given to another worker."""
+
+    def __init__(
+        self,
+        queue,
+        worker_id=None,
+        poll_interval=1.0,
+        idle_timeout=None,
+        heartbeat_interval=HEARTBEAT_INTERVAL,
+    ):
+        self.queue = queue
+        self.worker_id = worker_id or get_worker_id()
+        self.poll_interval = poll_interval
+        self.idle_timeout = idle_timeout
+        self.heartbeat_interval = heartbeat_interval
+        self.jobs_done = 0
+
+    def run(self):
+        """Return the number of jobs done."""
+        logging.info(f"Worker {self.worker_id} waiting for jobs in {self.queue}")
+        idle_since = time.perf_counter()
+        while True:
+            claimed = self.queue.claim(self.worker_id)
+            if claimed is not None:
+                self.process(*claimed)
+                idle_since = time.perf_counter()
+                continue
+            if self.queue.is_closed:
+                break
+            idle = time.perf_counter() - idle_since
+            if self.idle_timeout is not None and idle >= self.idle_timeout:
+                break
+            time.sleep(self.poll_interval)
+        logging.info(f"Worker {self.worker_id} stopping after {self.jobs_done} jobs")
+        return self.jobs_done
+
+    def process(self, claim_path, job):
+        logging.info(f"Worker {self.worker_id} doing job {job['id']}: {job['kind']}")
+        done = threading.Event()
+        heartbeat = threading.Thread(
+            target=self.heartbeat, args=(claim_path, done), daemon=True
+        )
+        heartbeat.start()
+        try:
+            if job["kind"] == "export":
+                result = self.export(job)
+            else:
+                result = self.update(job)
+        except Exception as e:
+            logging.exception(f"Job {job['id']} failed")
+            result = {"error": f"{type(e).__name__}: {e}"}
+        finally:
+            done.set()
+            heartbeat.join()
+        result.update(id=job["id"], worker=self.worker_id)
+        self.queue.complete(claim_path, result)
+        self.jobs_done += 1
+
+    def heartbeat(self, claim_path, done):
+        """Refresh the claim until the job is done or the claim is gone."""
+        while not done.wait(self.heartbeat_interval):
+            if not self.queue.refresh(claim_path):
+                logging.warning(f"Claim of {claim_path.name} was lost")
+                return
+
+    def export(self, job):
+        chapter = OdtChapter(job["odt_path"])
+        metrics = Metrics()
+        with metrics.chapter(chapter.number) as m:
+            sfm = chapter.to_sfm(job["mode"])
+            m.add("bytes_read", chapter.size)
+            m.add("nodes_visited", chapter.nodes_visited)
+            m.add("paragraphs", len(chapter.paragraphs))
+            m.add("spans", sum(len(p.spans) for p in chapter.paragraphs))
+            m.add("cache_hits", chapter.cache_hits)
+        return {"sfm": sfm, "metrics": m.as_dict()}
+
+    def update(self, job):
+        chapter = OdtChapter(job["odt_path"])
+        sfm_chapter = SfmChapter(job["sfm"])
+        mode = job["mode"]
+        output = None
+        metrics = Metrics()
+        with metrics.chapter(sfm_chapter.number, job.get("target")) as m:
+            m.add("bytes_read", chapter.size + len(job["sfm"].encode("utf-8")))
+            try:
+                verification = verify_chapter(sfm_chapter, chapter, mode)
+                verify_span_styles(chapter, verification)
+            except ValueError as e:
+                # E.g. there's no styles-reference file.
+                verification = ChapterVerification(sfm_chapter.number)
+                verification.add("styles", str(e))
+            if verification.ok:
+                chapter.update_text(sfm_chapter, mode, verification=verification)
+                suffix = chapter.file_path.suffix
+                output = f"{job['id']}{suffix}"
+                # Saved under a hidden name, then renamed, like other results;
+                # the suffix gives the format it's saved in.
+                tmp_path = (
+                    self.queue.results_path / f".{job['id']}.{os.getpid()}{suffix}"
+                )
+                chapter.save(tmp_path)
+                os.replace(tmp_path, self.queue.results_path / output)
+                m.add_file_written(self.queue.results_path / output)
+                m.add("nodes_visited", chapter.nodes_visited)
+            verification.release()
+        return {
+            "verification": verification.as_dict(),
+            "output": output,
+            "metrics": m.as_dict(),
+        }
+
+
+class QueueCoordinator:
+    """Split an export or import into one job per chapter in a WorkQueue, wait
+    for workers to do them, and assemble their results: the SFM text, or the
+    folder of updated ODT files. Paths in jobs are absolute, so the book and
+    the queue must be at the same paths on every worker's machine. Jobs
+    whose claims haven't been refreshed for claim_timeout seconds, which
+    should be a few times the workers' heartbeat interval, are given to other
+    workers. Waiting for jobs fails after timeout seconds, e.g. if no worker
+    is running."""
+
+    def __init__(
+        self,
+        queue,
+        poll_interval=1.0,
+        timeout=None,
+        claim_timeout=None,
+        metrics=None,
+        progress=None,
+    ):
+        self.queue = queue
+        self.poll_interval = poll_interval
+        self.timeout = timeout
+        self.claim_timeout = claim_timeout
+        self.metrics = metrics if metrics is not None else Metrics()
+        self.progress = progress if progress is not None else Progress()
+        # Prefix of this run's job IDs, so that runs can share a queue.
+        self.run_id = uuid.uuid4().hex[:8]
+
+    def submit(self, jobs):
+        """Put the jobs in the queue; return their IDs, in the same order."""
+        job_ids = list()
+        for i, job in enumerate(jobs):
+            job["id"] = f"{self.run_id}-{i:04d}"
+            self.queue.put(job)
+            job_ids.append(job["id"])
+        logging.info(f"Submitted {len(job_ids)} jobs to {self.queue}")
+        return job_ids
+
+    def wait(self, job_ids):
+        """Return {job_id: result} once every job is done. Raise TimeoutError
+        if they take more than timeout seconds, ConversionCancelled if the
+        progress is cancelled, or ValueError if a job failed."""
+        results = dict()
+        started = time.perf_counter()
+        self.progress.start(len(job_ids))
+        try:
+            while len(results) < len(job_ids):
+                self.progress.check()
+                for job_id in job_ids:
+                    if job_id not in results:
+                        result = self.queue.get_result(job_id)
+                        if result is not None:
+                            results[job_id] = result
+                            self.progress.chapter_done()
+                if len(results) == len(job_ids):
+                    break
+                if self.claim_timeout is not None:
+                    self.queue.requeue_stale(self.claim_timeout)
+                elapsed = time.perf_counter() - started
+                if self.timeout is not None and elapsed >= self.timeout:
+                    raise TimeoutError(
+                        f"{len(job_ids) - len(results)} jobs not done after {elapsed:.0f} s"
+                    )
+                time.sleep(self.poll_interval)
+        except BaseException:
+            # Don't leave jobs for workers that nobody will collect.
+            self.queue.remove(job_ids)
+            raise
+        failed = [r for r in results.values() if "error" in r]
+        if failed:
+            self.queue.remove(job_ids)
+            errors = "; ".join(
+                f"{r['id']} ({r['worker']}): {r['error']}" for r in failed
+            )
+            raise ValueError(f"{len(failed)} jobs failed: {errors}")
+        for result in results.values():
+            self.metrics.add_chapter(ChapterMetrics.from_dict(result["metrics"]))
+        return results
+
+    def to_sfm_targets(self, odt_book, targets, chapters="all"):
+        """Return the SFM text of the book for each SfmExportTarget, like
+        OdtBook.to_sfm_targets, from chapters exported by workers."""
+        numbers = parse_chapter_numbers(chapters)
+        if numbers is None:
+            numbers = list(odt_book.chapter_paths)
+        numbers = [n for n in numbers if n in odt_book.chapter_paths]
+        # Handle TOC chapter (if included), then remaining chapters.
+        if 0 in numbers:
+            numbers.remove(0)
+            numbers.insert(0, 0)
+        chapters = odt_book.get_chapters(numbers)
+        out_texts = odt_book.sfm_headers(targets, [chapters[n] for n in numbers])
+        jobs = [
+            {
+                "kind": "export",
+                "odt_path": str(odt_book.chapter_paths[n].resolve()),
+                "mode": None,
+            }
+            for n in numbers
+        ]
+        job_ids = self.submit(jobs)
+        results = self.wait(job_ids)
+        for job_id in job_ids:
+            sfm = results[job_id]["sfm"]
+            for target, out_text in zip(targets, out_texts):
+                out_text.extend(
+                    normalize_text(target.normalization_mode, sfm).splitlines()
+                )
+        self.queue.remove(job_ids)
+        return [odt_book.join_sfm_lines(out_text) for out_text in out_texts]
+
+    def update_text(self, odt_book, sfm_book, new_dest_path, chapters="all"):
+        """Update the book's ODT files from the SFM book's text, like
+        OdtBook.update_text, with chapters updated by workers. If any chapter
+        has errors, a PreflightError is raised and no ODT files are saved in
+        the new destination folder. Return the verifications."""
+        mode = odt_book.normalization_mode
+        if mode is None:
+            raise ValueError("Character normalization mode not specified.")
+        new_dest_path = Path(new_dest_path)
+        sfm_chapters = sfm_book.get_chapters(parse_chapter_numbers(chapters))
+        verifications = dict()
+        jobs = list()
+        for sfm_chapter in sfm_chapters:
+            odt_path = odt_book.chapter_paths.get(sfm_chapter.number)
+            if odt_path is None:
+                verifications[sfm_chapter.number] = verify_chapter(
+                    sfm_chapter, None, mode
+                )
+                continue
+            jobs.append(
+                {
+                    "kind": "import",
+                    "odt_path": str(odt_path.resolve()),
+                    "sfm": sfm_chapter.sfm_raw,
+                    "mode": mode,
+                    "target": new_dest_path.name,
+                }
+            )
+        job_ids = self.submit(jobs)
+        results = self.wait(job_ids)
+        outputs = dict()
+        for job, job_id in zip(jobs, job_ids):
+            result = results[job_id]
+            verification = ChapterVerification.from_dict(result["verification"])
+            verifications[verification.number] = verification
+            if result["output"] is not None:
+                outputs[Path(job["odt_path"]).name] = result["output"]
+        verifications = [verifications[c.number] for c in sfm_chapters]
+        failed = [v for v in verifications if not v.ok]
+        try:
+            if failed:
+                for verification in failed:
+                    verification.log()
+                raise PreflightError(failed)
+            with partial_output_folder(new_dest_path) as partial_path:
+                partial_path.mkdir(parents=True, exist_ok=True)
+                for name, output in outputs.items():
+                    shutil.move(self.queue.results_path / output, partial_path / name)
+        finally:
+            self.queue.remove(job_ids)
+        return verifications
@@ -0,0 +1,246 @@
+import argparse
+import contextlib
+import copy
+import io
+import logging
+import multiprocessing
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+
+from odfdo import Document
+
+from odt2sfm.base import get_peak_rss, normalize_text
+from odt2sfm.odt import OdtBook, OdtChapter
+from odt2sfm.sfm import SfmBook, SfmChapter
+from odt2sfm.verification import verify_chapter
+
+DATA = Path(__file__).parents[1] / "tests" / "data"
+# Styles used by the test chapter that aren't in its styles-reference file.
+EXTRA_STYLES = "T2  \\it\n"
+
+
+def make_book(dir_path, lessons):
+    """Create a book folder with a TOC and the given number of lessons, all
+    copied from the test chapter."""
+    book = Path(dir_path) / "01LUK"
+    book.mkdir()
+    styles = (DATA / "styles-reference.txt").read_text() + EXTRA_STYLES
+    (book / "styles-reference.txt").write_text(styles)
+    shutil.copy(DATA / "chapter.odt", book / "Luke-Q1-TOC.odt")
+    for i in range(1, lessons + 1):
+        shutil.copy(DATA / "chapter.odt", book / f"Luke-Q1-L{i:02d}.odt")
+    return book
+
+
+def run_memory(lessons, max_open, max_memory, prefetch):
+    """Export and re-import a book; return wall time, CPU time, peak RSS."""
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        book_path = make_book(tmp, lessons)
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        book = OdtBook(
+            book_path,
+            filename="01LUK",
+            normalization_mode="NFC",
+            prefetch=prefetch,
+            max_open=max_open,
+            max_memory=max_memory,
+        )
+        sfm_path = Path(tmp) / "01LUK.sfm"
+        sfm_path.write_text(book.to_sfm())
+        with contextlib.redirect_stdout(io.StringIO()):
+            book.update_text(SfmBook(sfm_path), Path(tmp) / "01LUK_updated")
+        return (
+            time.perf_counter() - wall,
+            time.process_time() - cpu,
+            get_peak_rss(),
+            book.pool.peak_open,
+        )
+
+
+def make_long_chapter(dir_path, copies, extra_styles=""):
+    """Create a lesson whose body repeats the test chapter's body."""
+    doc = Document(DATA / "chapter.odt")
+    body = doc.body._xml_element
+    content = list(body)
+    for _ in range(copies - 1):
+        body.extend(copy.deepcopy(e) for e in content)
+    styles = (DATA / "styles-reference.txt").read_text() + extra_styles
+    (Path(dir_path) / "styles-reference.txt").write_text(styles)
+    path = Path(dir_path) / "Luke-Q1-L01.odt"
+    doc.save(path)
+    return path
+
+
+def run_styles(copies):
+    """Time the text scan, style discovery, and paragraph selection of one
+    long lesson."""
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        chapter = OdtChapter(make_long_chapter(tmp, copies))
+        chapter.load()
+        times = list()
+        for step in ("text_scan", "style_histogram", "styles", "paragraphs"):
+            start = time.perf_counter()
+            getattr(chapter, step)
+            times.append(time.perf_counter() - start)
+        return times, len(chapter.text_scan.paragraphs), chapter.unmapped_styles
+
+
+def update_with_setters(chapter, verification):
+    """Update the chapter's paragraphs the way it was done before edits were
+    batched: each changed child is written through odfdo's setters."""
+    for sfm_p, odt_p in verification.pairs:
+        for odt_item, sfm_item in zip(odt_p.children, sfm_p.children):
+            value = normalize_text("NFC", sfm_item.text)
+            text = odt_item.text
+            if text != value:
+                logging.info(f'Updating "{text}" to "{value}"')
+                odt_item.text = value
+
+
+def run_update(copies, batched, repeat=5):
+    """Time updating one long lesson from an edited export of it, after it
+    has been verified; return the best time and the number of paragraphs
+    updated."""
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_long_chapter(tmp, copies, extra_styles=EXTRA_STYLES)
+        chapter = OdtChapter(path)
+        sfm = chapter.to_sfm("NFC").replace("verse", "Verse").replace("tabs", "Tabs")
+        times = list()
+        for _ in range(repeat):
+            chapter = OdtChapter(path)
+            verification = verify_chapter(SfmChapter(sfm), chapter, "NFC")
+            start = time.perf_counter()
+            if batched:
+                chapter.update_text(None, "NFC", verification=verification)
+            else:
+                update_with_setters(chapter, verification)
+            times.append(time.perf_counter() - start)
+        return min(times), len(verification.pairs)
+
+
+def run_formats(copies, suffix, repeat=3):
+    """Time loading and saving one long lesson as a zipped or flat ODT file;
+    return the best times, the file size, and peak RSS."""
+    logging.getLogger().setLevel(logging.ERROR)
+    with tempfile.TemporaryDirectory() as tmp:
+        path = make_long_chapter(tmp, copies)
+        if suffix != path.suffix:
+            OdtChapter(path).save(path.with_suffix(suffix))
+            path = path.with_suffix(suffix)
+        loads = list()
+        saves = list()
+        for i in range(repeat):
+            start = time.perf_counter()
+            chapter = OdtChapter(path).load()
+            loads.append(time.perf_counter() - start)
+            start = time.perf_counter()
+            chapter.save(Path(tmp) / f"saved-{i}{suffix}")
+            saves.append(time.perf_counter() - start)
+        return min(loads), min(saves), path.stat().st_size, get_peak_rss()
+
+
+def in_new_process(func, *args):
+    """Run func in a fresh interpreter, so that peak RSS isn't shared."""
+    ctx = multiprocessing.get_context("spawn")
+    with ctx.Pool(1) as pool:
+        return pool.apply(func, args)
+
+
+def memory(args):
+    print("lessons  max-open  wall(s)  cpu(s)  peak-RSS(MiB)  open-at-most")
+    for lessons in args.lessons:
+        for max_open in args.max_open:
+            max_open = max_open if max_open > 0 else None
+            wall, cpu, rss, peak_open = in_new_process(
+                run_memory, lessons, max_open, args.max_memory, args.prefetch
+            )
+            rss = f"{rss / 2**20:.1f}" if rss else "n/a"
+            print(
+                f"{lessons:7d}  {str(max_open):>8}  {wall:7.2f}  {cpu:6.2f}  {rss:>13}  {peak_open:12d}"
+            )
+
+
+def styles(args):
+    print("copies  paragraphs  scan(s)  histogram(s)  styles(s)  select(s)")
+    for copies in args.copies:
+        times, paragraphs, unmapped = in_new_process(run_styles, copies)
+        times = "  ".join(f"{t:{w}.3f}" for t, w in zip(times, (7, 12, 9, 9)))
+        print(f"{copies:6d}  {paragraphs:10d}  {times}")
+    print(f"Unmapped styles: {unmapped}")
+
+
+def update(args):
+    print("copies  paragraphs  setters(s)  batched(s)")
+    for copies in args.copies:
+        setters, paragraphs = in_new_process(run_update, copies, False)
+        batched, _ = in_new_process(run_update, copies, True)
+        print(f"{copies:6d}  {paragraphs:10d}  {setters:10.3f}  {batched:10.3f}")
+
+
+def formats(args):
+    print("copies  format  load(s)  save(s)  size(KiB)  peak-RSS(MiB)")
+    for copies in args.copies:
+        for suffix in (".odt", ".fodt"):
+            load, save, size, rss = in_new_process(run_formats, copies, suffix)
+            rss = f"{rss / 2**20:.1f}" if rss else "n/a"
+            print(
+                f"{copies:6d}  {suffix:>6}  {load:7.3f}  {save:7.3f}  {size / 2**10:9.1f}  {rss:>13}"
+            )
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="benchmark")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    p = commands.add_parser(
+        "memory", help="peak RSS of export + import for books of different sizes"
+    )
+    p.add_argument("--lessons", type=int, nargs="+", default=[13, 52])
+    p.add_argument(
+        "--max-open",
+        type=int,
+        nargs="+",
+        default=[4, 0],
+        help="max. open documents; 0 for no limit",
+    )
+    p.add_argument("--max-memory", type=int, default=None, help="bytes")
+    p.add_argument("--prefetch", type=int, default=2)
+    p.set_defaults(func=memory)
+
+    p = commands.add_parser(
+        "styles", help="style discovery and paragraph selection in long lessons"
+    )
+    p.add_argument("--copies", type=int, nargs="+", default=[1, 10, 100])
+    p.set_defaults(func=styles)
+
+    p = commands.add_parser(
+        "update", help="updating a long lesson's texts: odfdo setters vs. batched"
+    )
+    p.add_argument("--copies", type=int, nargs="+", default=[1, 10, 100])
+    p.set_defaults(func=update)
+
+    p = commands.add_parser(
+        "formats", help="loading and saving a long lesson: zipped vs. flat ODT"
+    )
+    p.add_argument("--copies", type=int, nargs="+", default=[1, 10, 100])
+    p.set_defaults(func=formats)
+
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -6,28 +6,187 @@ from pathlib import Path
 
 sys.path.insert(0, str(Path(__file__).parents[1]))
 
-from odt2sfm.conversions import OdtToSfm, SfmToOdt
+from odt2sfm.base import NORMALIZATION_MODES, validate_timestamp_source
+from odt2sfm.conversions import OdtToSfm, SfmBooksToOdt, SfmToOdt
+from odt2sfm.odt import SfmExportTarget
+from odt2sfm.verification import PreflightError
+from odt2sfm.workqueue import HEARTBEAT_INTERVAL, QueueWorker, WorkQueue
 
 
 def parse_args():
     prog = "odt2sfm"
     parser = argparse.ArgumentParser(prog=prog)
+    parser.add_argument(
+        "-c",
+        "--chapters",
+        default="all",
+        help='convert only these chapters, e.g. "3,4" or "1-5,7"; 0 is the TOC [all]',
+    )
+    parser.add_argument(
+        "--changed-since",
+        type=Path,
+        metavar="SFM",
+        help="import only the chapters that differ from this earlier version of the SFM file",
+    )
+    parser.add_argument(
+        "--claim-timeout",
+        type=float,
+        metavar="SEC",
+        help=f"with --queue, give a chapter to another worker if its worker hasn't shown it's still working on it for SEC seconds; workers show this every {HEARTBEAT_INTERVAL:g} seconds, so use at least {3 * HEARTBEAT_INTERVAL:g}",
+    )
     parser.add_argument(
         "--debug",
         action="store_true",
         default=False,
         help="use debug output in log file",
     )
+    parser.add_argument(
+        "--encoding",
+        help="encoding of SFM source files that have no byte order mark [utf-8]",
+    )
     parser.add_argument(
         "-m",
         "--normalization-mode",
-        choices=["NFC", "NFD"],
+        choices=NORMALIZATION_MODES,
         default="NFC",
         help="set character normalization mode for destination file(s)",
     )
-    parser.add_argument("source_path", type=Path, help="source file/dir")
-    parser.add_argument("destination_path", type=Path, help="destination file/dir")
-    return parser.parse_args()
+    parser.add_argument(
+        "--max-memory",
+        type=int,
+        metavar="MB",
+        help="unload saved or exported ODT files beyond this estimated memory use",
+    )
+    parser.add_argument(
+        "--max-open",
+        type=int,
+        default=8,
+        metavar="N",
+        help="keep at most N ODT files open; 0 for no limit [8]",
+    )
+    parser.add_argument(
+        "--metrics",
+        type=Path,
+        metavar="FILE",
+        help="write run and chapter metrics to FILE: a Prometheus textfile if it ends in .prom, otherwise appended JSON lines",
+    )
+    parser.add_argument(
+        "--prefetch",
+        type=int,
+        default=2,
+        metavar="N",
+        help="load up to N ODT files in the background ahead of the current one [2]",
+    )
+    parser.add_argument(
+        "--preflight-workers",
+        type=int,
+        default=4,
+        metavar="N",
+        help="before importing, check every chapter, N at a time, and update none if any has errors; 0 to skip the check [4]",
+    )
+    parser.add_argument(
+        "--progress",
+        action="store_true",
+        help="show chapter and paragraph progress, with an estimated time left",
+    )
+    parser.add_argument(
+        "--queue",
+        type=Path,
+        metavar="DIR",
+        help="convert chapters as jobs in DIR, a folder shared with workers (see --worker), e.g. on other machines; book and queue paths must be the same on all of them",
+    )
+    parser.add_argument(
+        "--queue-timeout",
+        type=float,
+        metavar="SEC",
+        help="with --queue, fail if the chapters aren't all converted after SEC seconds, e.g. because no worker is running [wait indefinitely]",
+    )
+    parser.add_argument(
+        "--slot-maps",
+        action="store_true",
+        help="import by filling slot maps saved next to the ODT files (*.slots.json), compiling them when the files change",
+    )
+    parser.add_argument(
+        "--also-export",
+        type=parse_export_target,
+        action="append",
+        default=[],
+        metavar="SFM[:MODE[:ID]]",
+        help="when exporting, also write this SFM file, in normalization mode MODE [NFC] and with book ID ID [the destination's], from the same reading of the ODT files; can be repeated",
+    )
+    parser.add_argument(
+        "--worker",
+        action="store_true",
+        help="do jobs from the --queue folder instead of converting given paths, until the queue is closed or --idle-timeout",
+    )
+    parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        metavar="SEC",
+        help="with --worker, stop after SEC seconds without a job",
+    )
+    parser.add_argument(
+        "--timestamp",
+        type=parse_timestamp_source,
+        metavar="WHEN",
+        help="make exports reproducible, with a hash of the ODT files in the header and the date of WHEN: 'mtime' for the newest ODT file, 'epoch' for $SOURCE_DATE_EPOCH (the default when it's set), or a fixed YYYY-MM-DD date [today]",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        metavar="N",
+        help="when importing several SFM files, update up to N copies at a time [1]",
+    )
+    parser.add_argument(
+        "source_path",
+        type=Path,
+        nargs="*",
+        help="source file/dir; give several SFM files (e.g. one per language) to update a copy of the ODT files for each",
+    )
+    parser.add_argument(
+        "destination_path", type=Path, nargs="?", help="destination file/dir"
+    )
+    args = parser.parse_args()
+    if args.destination_path is None and len(args.source_path) > 1:
+        # Both optional positionals are taken as sources.
+        args.destination_path = args.source_path.pop()
+    if args.worker:
+        if args.queue is None:
+            parser.error("--worker requires --queue")
+    elif not args.source_path or args.destination_path is None:
+        parser.error("a source and a destination path are required")
+    return args
+
+
+def parse_export_target(value):
+    path, _, rest = value.partition(":")
+    mode, _, book_id = rest.partition(":")
+    try:
+        return SfmExportTarget(
+            mode or "NFC", book_id=book_id or None, destination=Path(path)
+        )
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def parse_timestamp_source(value):
+    try:
+        return validate_timestamp_source(value)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+
+def show_progress(progress):
+    print(f"\r{progress}\033[K", end="", file=sys.stderr, flush=True)
+    if progress.chapters_done == progress.chapters_total:
+        print(file=sys.stderr)
+
+
+def run_worker(args):
+    worker = QueueWorker(WorkQueue(args.queue), idle_timeout=args.idle_timeout)
+    jobs_done = worker.run()
+    print(f"Worker {worker.worker_id} did {jobs_done} jobs")
 
 
 def main():
@@ -41,16 +200,25 @@ def main():
     logger = logging.getLogger()
     logger.setLevel(loglevel)
 
+    if args.worker:
+        run_worker(args)
+        return
+
     # Evaluate path args.
-    if args.source_path.suffix.lower() == ".sfm":
+    source_paths = args.source_path
+    if len(source_paths) > 1:
+        if not all(p.suffix.lower() == ".sfm" for p in source_paths):
+            raise ValueError("Only SFM files can be given as multiple sources.")
+        conv = SfmBooksToOdt
+    elif source_paths[0].suffix.lower() == ".sfm":
         conv = SfmToOdt
-    elif args.source_path.is_dir():
-        logger_filepath = args.source_path / "odt2sfm-export.log"
+    elif source_paths[0].is_dir():
+        logger_filepath = source_paths[0] / "odt2sfm-export.log"
         conv = OdtToSfm
     else:
-        raise ValueError(f"Invalid source: {args.source_path}")
+        raise ValueError(f"Invalid source: {source_paths[0]}")
 
-    if conv is SfmToOdt:
+    if conv in (SfmToOdt, SfmBooksToOdt):
         if not args.destination_path.is_dir():
             raise ValueError(
                 f"{conv} conversion requires a destination dir containing ODT files."
@@ -66,12 +234,44 @@ def main():
     logging.info(f"Script start time: {datetime.now()}")
 
     # Run converion.
-    c = conv(
-        source=args.source_path,
+    kwargs = dict(
         destination=args.destination_path,
+        chapters=args.chapters,
         normalization_mode=args.normalization_mode,
+        prefetch=args.prefetch,
+        max_open=args.max_open or None,
+        max_memory=args.max_memory * 2**20 if args.max_memory else None,
+        metrics_path=args.metrics,
     )
-    c.run()
+    if args.progress:
+        kwargs["progress_callback"] = show_progress
+    if conv in (SfmToOdt, SfmBooksToOdt):
+        kwargs["slot_maps"] = args.slot_maps
+        kwargs["encoding"] = args.encoding
+        kwargs["preflight_workers"] = args.preflight_workers
+    if conv is SfmToOdt:
+        kwargs["changed_since"] = args.changed_since
+    if conv is OdtToSfm:
+        kwargs["targets"] = args.also_export
+        kwargs["timestamp_source"] = args.timestamp
+    if args.queue is not None:
+        if conv is SfmBooksToOdt:
+            raise ValueError("Several SFM files can't be imported with --queue.")
+        kwargs["queue"] = args.queue
+        kwargs["claim_timeout"] = args.claim_timeout
+        kwargs["queue_timeout"] = args.queue_timeout
+    if conv is SfmBooksToOdt:
+        c = conv(sources=source_paths, max_workers=args.workers, **kwargs)
+    else:
+        c = conv(source=source_paths[0], **kwargs)
+    try:
+        c.run()
+    except PreflightError as e:
+        for verification in e.verifications:
+            for mismatch in verification.errors:
+                print(f"ch. {verification.number}: {mismatch}", file=sys.stderr)
+        print(e, file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,35 @@
+import argparse
+import sys
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+
+from odt2sfm.sfm import SfmBook
+from odt2sfm.sfm.diff import SfmBookDiff
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="odt2sfm-diff")
+    parser.add_argument("--encoding", help="encoding of SFM files without a BOM")
+    parser.add_argument("--json", action="store_true", help="print the changes as JSON")
+    parser.add_argument("old_path", type=Path, help="earlier SFM file")
+    parser.add_argument("new_path", type=Path, help="edited SFM file")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    diff = SfmBookDiff(
+        SfmBook(args.old_path, encoding=args.encoding),
+        SfmBook(args.new_path, encoding=args.encoding),
+    )
+    if args.json:
+        print(diff.to_json())
+    elif diff.changes:
+        print(diff)
+    else:
+        print("No changes.")
+
+
+if __name__ == "__main__":
+    main()
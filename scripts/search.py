@@ -0,0 +1,68 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).parents[1]))
+
+from odt2sfm.odt import OdtBook
+from odt2sfm.search import SearchIndex
+from odt2sfm.sfm import SfmBook
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(prog="odt2sfm-search")
+    parser.add_argument("index_path", type=Path, help="search index file (JSON)")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    update = subparsers.add_parser(
+        "update", help="add or update the index's chapters from SFM files/ODT dirs"
+    )
+    update.add_argument(
+        "-c",
+        "--chapters",
+        default="all",
+        help='index only these chapters, e.g. "3,4" or "1-5,7" [all]',
+    )
+    update.add_argument(
+        "-m",
+        "--normalization-mode",
+        choices=["NFC", "NFD"],
+        default="NFC",
+        help="character normalization mode of a new index [NFC]",
+    )
+    update.add_argument("source_path", type=Path, nargs="+", help="SFM file/ODT dir")
+    query = subparsers.add_parser("query", help="find paragraphs with all words")
+    query.add_argument("--source", help="only search this book (file or dir name)")
+    query.add_argument("words", nargs="+", help="words to search for")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "update":
+        if args.index_path.is_file():
+            index = SearchIndex.load(args.index_path)
+        else:
+            index = SearchIndex(normalization_form=args.normalization_mode)
+        for source_path in args.source_path:
+            if source_path.suffix.lower() == ".sfm":
+                updated = index.add_sfm_book(SfmBook(source_path), args.chapters)
+            elif source_path.is_dir():
+                book = OdtBook(source_path, normalization_mode=index.normalization_form)
+                updated = index.add_odt_book(book, args.chapters)
+            else:
+                raise ValueError(f"Invalid source: {source_path}")
+            print(f"{source_path}: {updated} chapters indexed")
+        index.save(args.index_path)
+    else:
+        index = SearchIndex.load(args.index_path)
+        start = time.perf_counter()
+        hits = index.search(" ".join(args.words), source=args.source)
+        elapsed = time.perf_counter() - start
+        for hit in hits:
+            print(hit)
+        print(f"{len(hits)} results in {elapsed * 1000:.3f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
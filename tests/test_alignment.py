@@ -0,0 +1,57 @@
+import unittest
+from pathlib import Path
+
+from odt2sfm.alignment import align_paragraphs
+from odt2sfm.odt import OdtChapter
+from odt2sfm.sfm import SfmBook
+
+DATA = Path(__file__).parent / "data"
+ODT_PATH = DATA / "chapter.odt"
+SFM_PATH = DATA / "book.sfm"
+SFM_REF = {
+    "Title": "\\mt",
+    "Heading_20_1": "\\s",
+    "Heading_20_2": "\\s2",
+    "Text_20_body": "\\p",
+    "Quotations": "\\q",
+    "T1": "\\bd",
+    "T2": "\\it",
+}
+
+
+class TestParagraphAlignment(unittest.TestCase):
+    def setUp(self):
+        self.odt_chapter = OdtChapter(ODT_PATH)
+        self.odt_chapter.sfm_ref = SFM_REF
+        self.odt_ps = self.odt_chapter.paragraphs
+        self.sfm_ps = SfmBook(SFM_PATH).chapters[3].paragraphs
+
+    def align(self, sfm_ps):
+        return align_paragraphs(sfm_ps, self.odt_ps)
+
+    def test_align_identical(self):
+        alignment = self.align(self.sfm_ps)
+        self.assertEqual(alignment.pairs, [(i, i) for i in range(8)])
+        self.assertTrue(alignment.is_complete)
+        self.assertEqual(alignment.report(), [])
+
+    def test_align_dropped_sfm_paragraph(self):
+        alignment = self.align(self.sfm_ps[:2] + self.sfm_ps[3:])
+        self.assertEqual(alignment.unmatched_odt, [2])
+        self.assertEqual(alignment.unmatched_sfm, [])
+        self.assertEqual(len(alignment.matched), 7)
+        self.assertFalse(alignment.is_complete)
+
+    def test_align_added_sfm_paragraph(self):
+        extra = self.sfm_ps[5]  # "\q" paragraph
+        alignment = self.align(self.sfm_ps[:2] + [extra] + self.sfm_ps[2:])
+        self.assertEqual(alignment.unmatched_sfm, [2])
+        self.assertEqual(alignment.unmatched_odt, [])
+        self.assertEqual(len(alignment.report()), 1)
+
+    def test_align_changed_marker(self):
+        sfm_ps = list(self.sfm_ps)
+        sfm_ps[3].marker = "\\m"
+        alignment = self.align(sfm_ps)
+        self.assertEqual(alignment.mismatched, [(3, 3)])
+        self.assertEqual(len(alignment.matched), 7)
@@ -0,0 +1,32 @@
+import unittest
+
+from odt2sfm.base import parse_chapter_numbers, text_fingerprint
+
+
+class TestBase(unittest.TestCase):
+    def test_parse_chapter_numbers(self):
+        self.assertIsNone(parse_chapter_numbers("all"))
+        self.assertEqual(parse_chapter_numbers("3,4"), [3, 4])
+        self.assertEqual(parse_chapter_numbers("5,1-3, 2"), [1, 2, 3, 5])
+        self.assertEqual(parse_chapter_numbers([4, 0]), [0, 4])
+        with self.assertRaises(ValueError):
+            parse_chapter_numbers("1-x")
+
+    def test_text_fingerprint(self):
+        self.assertEqual(
+            text_fingerprint("Some  text~here", casefold=True, placeholders=True),
+            text_fingerprint("some text\u00a0here", casefold=True, placeholders=True),
+        )
+        self.assertNotEqual(
+            text_fingerprint("Some text"), text_fingerprint("some text")
+        )
+        # For lines, only line ends and blank lines are ignored.
+        self.assertEqual(
+            text_fingerprint("\\p a  b \n\n", whitespace="lines"),
+            text_fingerprint("\\p a  b", whitespace="lines"),
+        )
+        self.assertNotEqual(
+            text_fingerprint("\\p a  b", whitespace="lines"),
+            text_fingerprint("\\p a b", whitespace="lines"),
+        )
+        self.assertNotEqual(text_fingerprint("some text"), text_fingerprint("sometext"))
@@ -1,13 +1,17 @@
+import io
+import logging
 import unittest
 from pathlib import Path
 
-from odt2sfm.conversions import SfmToOdt
+from odt2sfm.conversions import OdtBytesToSfm, SfmToOdt, SfmToOdtBytes
 from odt2sfm.odt import OdtChapter
 from odt2sfm.sfm import SfmBook
 
 DATA = Path(__file__).parent / "data"
 ODT_PATH = DATA / "chapter.odt"
 SFM_PATH = DATA / "book.sfm"
+LOGGER = logging.getLogger()
+LOGLEVEL_INIT = LOGGER.level
 
 
 @unittest.skip("No valid tests defined.")
@@ -19,3 +23,59 @@ class TestSfmToOdt(unittest.TestCase):
 
     def test_compare_styles(self):
         self.conv.compare_paragraphs((self.odt_chapter, self.sfm_book.chapters[3]))
+
+
+class TestInMemoryConversions(unittest.TestCase):
+    def setUp(self):
+        data = ODT_PATH.read_bytes()
+        self.lessons = {"Luke-Q1-TOC.odt": data, "Luke-Q1-L01.odt": io.BytesIO(data)}
+        self.styles_reference = (DATA / "styles-reference.txt").read_text()
+        self.styles_reference += "T2  \\it\n"
+        LOGGER.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        LOGGER.setLevel(LOGLEVEL_INIT)
+
+    def export(self, lessons, **kwargs):
+        return OdtBytesToSfm(
+            lessons=lessons,
+            styles_reference=self.styles_reference,
+            filename="01LUK",
+            **kwargs,
+        ).run()
+
+    def test_round_trip(self):
+        sfm = self.export(self.lessons)
+        self.assertTrue(sfm.startswith("\\id LUK"))
+        self.assertIn("\\c 1\n", sfm)
+        conv = SfmToOdtBytes(
+            sfm=sfm.replace("A 2nd Section Header", "A New Header"),
+            lessons=self.lessons,
+            styles_reference=self.styles_reference,
+        )
+        outputs = conv.run()
+        self.assertEqual(sorted(outputs), sorted(self.lessons))
+        self.assertTrue(all(v.ok for v in conv.verifications))
+        self.assertEqual(
+            self.export(outputs), sfm.replace("A 2nd Section Header", "A New Header")
+        )
+
+    def test_flat_lessons(self):
+        chapter = OdtChapter(ODT_PATH)
+        lessons = {"Luke-Q1-L01.fodt": chapter.to_bytes(flat=True)}
+        self.assertTrue(lessons["Luke-Q1-L01.fodt"].startswith(b"<?xml"))
+        self.assertEqual(
+            self.export(lessons),
+            self.export({"Luke-Q1-L01.odt": ODT_PATH.read_bytes()}),
+        )
+
+    def test_reproducible_export(self):
+        sfm = self.export(self.lessons, timestamp_source="2024-01-02")
+        self.assertIn(" on 2024-01-02\n\\rem Content hash: blake2b:", sfm)
+        self.assertEqual(sfm, self.export(self.lessons, timestamp_source="2024-01-02"))
+        with self.assertRaises(ValueError):
+            self.export(self.lessons, timestamp_source="mtime")
+
+    def test_no_lessons(self):
+        with self.assertRaises(ValueError):
+            OdtBytesToSfm(lessons={}, styles_reference="", filename="01LUK")
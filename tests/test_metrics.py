@@ -0,0 +1,52 @@
+import json
+import tempfile
+import unittest
+from pathlib import Path
+
+from odt2sfm.metrics import Metrics
+
+
+class TestMetrics(unittest.TestCase):
+    def setUp(self):
+        self.metrics = Metrics(conversion="OdtToSfm")
+        with self.metrics.run():
+            for number in (1, 2):
+                with self.metrics.chapter(number) as m:
+                    m.add("paragraphs", 10 * number)
+                    m.add("bytes_read", 100)
+            self.metrics.add("bytes_written", 50)
+
+    def test_totals(self):
+        totals = self.metrics.totals
+        self.assertEqual(totals["paragraphs"], 30)
+        self.assertEqual(totals["bytes_read"], 200)
+        self.assertEqual(totals["bytes_written"], 50)
+        self.assertGreater(self.metrics.wall_seconds, 0)
+
+    def test_prometheus(self):
+        text = self.metrics.to_prometheus()
+        self.assertIn('odt2sfm_paragraphs{conversion="OdtToSfm"} 30\n', text)
+        self.assertIn(
+            'odt2sfm_chapter_paragraphs{conversion="OdtToSfm",chapter="2"} 20\n', text
+        )
+        self.assertIn("# TYPE odt2sfm_chapter_wall_seconds gauge\n", text)
+
+    def test_write(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            prom_path = Path(tmp) / "odt2sfm.prom"
+            self.metrics.write(prom_path)
+            self.metrics.write(prom_path)
+            self.assertEqual(prom_path.read_text().count("odt2sfm_paragraphs{"), 1)
+            self.assertEqual(list(Path(tmp).iterdir()), [prom_path])
+
+            jsonl_path = Path(tmp) / "metrics.jsonl"
+            self.metrics.write(jsonl_path)
+            self.metrics.write(jsonl_path)
+            records = [json.loads(line) for line in jsonl_path.read_text().splitlines()]
+            self.assertEqual(len(records), 6)
+            self.assertEqual(records[0]["record"], "run")
+            self.assertEqual(records[2]["chapter"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
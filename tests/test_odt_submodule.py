@@ -1,12 +1,34 @@
 import logging
+import os
+import shutil
+import tempfile
+import unicodedata
 import unittest
 from pathlib import Path
+from unittest import mock
 
-from odt2sfm.odt import OdtChapter
-from odt2sfm.odt.base import get_node_table, get_node_table_pos
-from odt2sfm.odt.elements import OdtParagraph, OdtSpan
+from lxml import etree
+from odfdo import Document, Element
 
-CHAPTER_PATH = Path(__file__).parent / "data" / "chapter.odt"
+from odt2sfm.odt import OdtBook, OdtChapter, SfmExportTarget
+from odt2sfm.odt.annotations import TEXT_NS, OdtTextScan
+from odt2sfm.odt.base import clone_document, get_node_table, get_node_table_pos
+from odt2sfm.odt.edits import TextEdits, write_inner_text
+from odt2sfm.odt.flat import (
+    read_flat_document,
+    set_part_tree,
+    write_flat_document,
+)
+from odt2sfm.odt.elements import OdtParagraph, OdtSpan, OdtTableRow
+from odt2sfm.odt.loader import OdtChapterLoader, OdtDocumentPool
+from odt2sfm.odt.slots import SlotMap
+from odt2sfm.progress import ConversionCancelled, Progress
+from odt2sfm.sfm import SfmBook
+from odt2sfm.sfm.elements import SfmParagraph
+from odt2sfm.verification import PreflightError, verify_chapter
+
+DATA = Path(__file__).parent / "data"
+CHAPTER_PATH = DATA / "chapter.odt"
 LOGGER = logging.getLogger()
 LOGLEVEL_INIT = LOGGER.level
 
@@ -22,6 +44,420 @@ class TestOdtChapter(unittest.TestCase):
             21,
         )
 
+    def test_chapter_style_histogram(self):
+        self.chapter.sfm_ref = {"Text_20_body": "\\p", "T1": "\\bd"}
+        self.assertEqual(self.chapter.style_histogram["Table_20_Contents"], 9)
+        self.assertEqual(self.chapter.styles, {"Text_20_body": "\\p", "T1": "\\bd"})
+        unmapped = self.chapter.unmapped_styles
+        self.assertNotIn("T1", unmapped)
+        self.assertEqual(next(iter(unmapped)), "Table_20_Contents")
+
+
+class TestOdtTextScan(unittest.TestCase):
+    def setUp(self):
+        body = Element.from_tag(
+            "<office:text>"
+            '<text:p>Intro<text:s text:c="2"/><text:tab/></text:p>'
+            '<text:p><draw:frame><draw:image xlink:href="Pictures/1.png"/></draw:frame></text:p>'
+            "<text:p><draw:frame><draw:text-box><text:p>Inner</text:p></draw:text-box></draw:frame></text:p>"
+            "<text:p/>"
+            "</office:text>"
+        )
+        self.scan = OdtTextScan(body._xml_element)
+        self.annotations = [self.scan.annotations[p] for p in self.scan.paragraphs]
+
+    def test_paragraphs_in_document_order(self):
+        self.assertEqual(len(self.scan.paragraphs), 5)
+        self.assertEqual(self.scan.paragraphs[3].text, "Inner")
+
+    def test_annotations(self):
+        intro, picture, frame, inner, empty = self.annotations
+        self.assertEqual(intro.text_length, 8)
+        self.assertTrue(picture.is_picture_only)
+        self.assertFalse(frame.has_own_text)
+        self.assertTrue(frame.has_text_paragraph_descendant)
+        self.assertTrue(inner.has_own_text)
+        self.assertFalse(empty.has_text)
+
+
+class TestOdtBook(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.book_path = Path(self.tmp.name) / "01LUK"
+        self.book_path.mkdir()
+        shutil.copy(DATA / "styles-reference.txt", self.book_path)
+        with (self.book_path / "styles-reference.txt").open("a") as f:
+            f.write("T2  \\it\n")
+        shutil.copy(CHAPTER_PATH, self.book_path / "Luke-Q1-TOC.odt")
+        for i in range(1, 4):
+            shutil.copy(CHAPTER_PATH, self.book_path / f"Luke-Q1-L{i:02d}.odt")
+        self.book = OdtBook(self.book_path, filename="01LUK", normalization_mode="NFC")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chapter_paths(self):
+        self.assertEqual(sorted(self.book.chapter_paths), [0, 1, 2, 3])
+        self.assertEqual(self.book._chapters, dict())
+
+    def test_to_sfm_chapters_subset(self):
+        sfm = self.book.to_sfm(chapters="2-3")
+        self.assertEqual(list(self.book._chapters), [2, 3])
+        self.assertIn("\\c 2\n", sfm)
+        self.assertNotIn("\\c 1\n", sfm)
+        # The TOC is only exported if requested.
+        self.assertEqual(sfm.count("\\mt "), 2)
+
+    def test_to_sfm_targets(self):
+        # Give one lesson text that differs in NFC and NFD.
+        path = self.book_path / "Luke-Q1-L02.odt"
+        doc = Document(path)
+        paragraph = doc.body.get_paragraph(content="1st verse")
+        for element in paragraph._xml_element.iter():
+            if element.tail and "1st verse" in element.tail:
+                element.tail = element.tail.replace("1st verse", "1st vers\u00e9")
+        doc.save(path)
+        targets = [
+            SfmExportTarget("NFC"),
+            SfmExportTarget("NFD", book_id="ACT"),
+        ]
+        nfc, nfd = self.book.to_sfm_targets(targets, chapters="1-2")
+        self.assertEqual(nfc, self.book.to_sfm(chapters="1-2"))
+        self.assertIn("vers\u00e9", nfc)
+        self.assertTrue(nfd.startswith("\\id ACT "))
+        self.assertEqual(
+            nfd, unicodedata.normalize("NFD", nfc).replace("\\id LUK", "\\id ACT")
+        )
+        # Each chapter is exported once for both targets.
+        numbers = [m.number for m in self.book.metrics.chapters]
+        self.assertEqual(numbers, [1, 2, 1, 2])
+        with self.assertRaises(ValueError):
+            SfmExportTarget("NFKC")
+
+    def test_chapter_metrics_cache_hits(self):
+        # Each export's metrics count only its own cache hits.
+        self.book.to_sfm(chapters="1")
+        self.book.to_sfm(chapters="1")
+        hits = [m.counts["cache_hits"] for m in self.book.metrics.chapters]
+        self.assertGreater(hits[0], 0)
+        self.assertEqual(sum(hits), self.book.chapters[1].cache_hits)
+
+    def test_reproducible_export(self):
+        book = OdtBook(
+            self.book_path,
+            filename="01LUK",
+            normalization_mode="NFC",
+            timestamp_source="2024-01-02",
+        )
+        sfm = book.to_sfm(chapters="1-2")
+        self.assertIn(" on 2024-01-02\n\\rem Content hash: blake2b:", sfm)
+        self.assertEqual(sfm, book.to_sfm(chapters="1-2"))
+        # The hash changes with the ODT files, and the timestamp doesn't.
+        path = self.book_path / "Luke-Q1-L02.odt"
+        doc = Document(path)
+        doc.body.get_paragraph(content="1st verse").append(" more")
+        doc.save(path)
+        book = OdtBook(
+            self.book_path,
+            filename="01LUK",
+            normalization_mode="NFC",
+            timestamp_source="2024-01-02",
+        )
+        new_sfm = book.to_sfm(chapters="1-2")
+        self.assertEqual(sfm.splitlines()[1], new_sfm.splitlines()[1])
+        self.assertNotEqual(sfm.splitlines()[2], new_sfm.splitlines()[2])
+        # The timestamp comes from the newest ODT file.
+        os.utime(self.book_path / "Luke-Q1-L01.odt", (0, 86400 * 365))
+        os.utime(self.book_path / "Luke-Q1-L02.odt", (0, 86400))
+        book.timestamp_source = "mtime"
+        chapters = book.get_chapters([1, 2]).values()
+        self.assertEqual(book.timestamp(chapters), "1971-01-01")
+        # Or from SOURCE_DATE_EPOCH, which is used by default when it's set.
+        book.timestamp_source = None
+        with mock.patch.dict(os.environ, {"SOURCE_DATE_EPOCH": "86400"}):
+            self.assertTrue(book.is_reproducible)
+            self.assertEqual(book.timestamp(), "1970-01-02")
+        with mock.patch.dict(os.environ):
+            os.environ.pop("SOURCE_DATE_EPOCH", None)
+            self.assertFalse(book.is_reproducible)
+        with self.assertRaises(ValueError):
+            OdtBook(self.book_path, timestamp_source="yesterday")
+
+    def test_update_texts_one_copy_per_target(self):
+        sfm = self.book.to_sfm(chapters="2-3")
+        targets = dict()
+        for lang, title in (("eng", "A 2nd Section Header"), ("fra", "Un 2e titre")):
+            sfm_path = Path(self.tmp.name) / f"01LUK{lang}.sfm"
+            sfm_path.write_text(sfm.replace("A 2nd Section Header", title))
+            targets[Path(self.tmp.name) / lang] = SfmBook(sfm_path)
+        results = self.book.update_texts(targets, max_workers=2)
+        self.assertTrue(all(v.ok for vs in results.values() for v in vs))
+        for lang, title in (("eng", "A 2nd Section Header"), ("fra", "Un 2e titre")):
+            chapter = OdtChapter(Path(self.tmp.name) / lang / "Luke-Q1-L03.odt")
+            chapter.sfm_ref = self.book.chapters[3].sfm_ref
+            self.assertEqual(chapter.paragraphs[4].text_recursive, title)
+        # The templates themselves are left unchanged.
+        self.assertFalse(self.book.chapters[3].is_modified)
+        self.assertEqual(
+            self.book.chapters[3].paragraphs[4].text_recursive, "A 2nd Section Header"
+        )
+
+    def test_update_text_progress(self):
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(self.book.to_sfm(chapters="1-3"))
+        events = list()
+        progress = Progress(
+            callback=lambda p: events.append((p.chapters_done, p.paragraphs_done))
+        )
+        dest_path = Path(self.tmp.name) / "updated"
+        self.book.update_text(SfmBook(sfm_path), dest_path, progress=progress)
+        self.assertEqual(progress.chapters_total, 4)  # with the TOC
+        self.assertEqual(events[-1][0], 4)
+        self.assertEqual(progress.fraction, 1.0)
+        self.assertEqual(len(list(dest_path.iterdir())), 4)
+        self.assertFalse(dest_path.with_name("updated.partial").exists())
+
+    def test_update_text_cancelled(self):
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(self.book.to_sfm(chapters="1-3"))
+
+        def cancel_after_first_chapter(progress):
+            if progress.chapters_done == 2:
+                progress.cancel()
+
+        progress = Progress(callback=cancel_after_first_chapter)
+        dest_path = Path(self.tmp.name) / "updated"
+        with self.assertRaises(ConversionCancelled):
+            self.book.update_text(SfmBook(sfm_path), dest_path, progress=progress)
+        self.assertEqual(progress.chapters_done, 2)
+        # No half-written output folder is left behind.
+        self.assertFalse(dest_path.exists())
+        self.assertFalse(dest_path.with_name("updated.partial").exists())
+
+    def test_update_text_preflight(self):
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(self.book.to_sfm(chapters="1-3"))
+        # Chapter 3 gets its own styles-reference file, which lacks a span style.
+        shutil.copy(
+            DATA / "styles-reference.txt",
+            self.book_path / "Luke-Q1-L03.styles-reference.txt",
+        )
+        book = OdtBook(self.book_path, normalization_mode="NFC")
+        dest_path = Path(self.tmp.name) / "updated"
+        LOGGER.setLevel(logging.CRITICAL)
+        try:
+            with self.assertRaises(PreflightError) as cm:
+                book.update_text(SfmBook(sfm_path), dest_path)
+        finally:
+            LOGGER.setLevel(LOGLEVEL_INIT)
+        self.assertEqual([v.number for v in cm.exception.verifications], [3])
+        self.assertEqual(
+            [m.kind for m in cm.exception.verifications[0].errors], ["style"]
+        )
+        # Nothing was updated or saved.
+        self.assertFalse(any(c.is_modified for c in book.chapters.values()))
+        self.assertFalse(dest_path.exists())
+        self.assertFalse(dest_path.with_name("updated.partial").exists())
+
+    def test_update_text_verifies_once(self):
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(
+            self.book.to_sfm(chapters="1-3").replace(
+                "A 2nd Section Header", "Un 2e titre"
+            )
+        )
+        for preflight_workers in (2, 0):
+            # A single open document, so chapters are unloaded between their
+            # preflight and their update.
+            book = OdtBook(
+                self.book_path,
+                normalization_mode="NFC",
+                max_open=1,
+                preflight_workers=preflight_workers,
+            )
+            dest_path = Path(self.tmp.name) / f"updated_{preflight_workers}"
+            with mock.patch(
+                "odt2sfm.odt.verify_chapter", wraps=verify_chapter
+            ) as verify:
+                verifications = book.update_text(SfmBook(sfm_path), dest_path)
+            self.assertEqual(verify.call_count, 4)  # with the TOC
+            self.assertTrue(all(v.ok for v in verifications))
+            self.assertEqual(verifications[-1].updates, 1)
+            chapter = OdtChapter(dest_path / "Luke-Q1-L03.odt")
+            chapter.sfm_ref = self.book.chapters[3].sfm_ref
+            self.assertEqual(chapter.paragraphs[4].text_recursive, "Un 2e titre")
+
+    def test_update_text_with_slot_maps(self):
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(
+            self.book.to_sfm(chapters="3")
+            .replace("A 2nd Section Header", "Un 2e titre")
+            .replace("bolded", "gras")
+        )
+        outputs = list()
+        for slot_maps in (False, True, True):
+            book = OdtBook(
+                self.book_path, normalization_mode="NFC", slot_maps=slot_maps
+            )
+            dest = Path(self.tmp.name) / f"updated_{len(outputs)}"
+            verifications = book.update_text(SfmBook(sfm_path), dest)
+            self.assertTrue(all(v.ok for v in verifications))
+            content = Document(dest / "Luke-Q1-L03.odt").content
+            outputs.append(content.serialize().decode())
+        self.assertIn("Un 2e titre", outputs[0])
+        self.assertEqual(outputs[0], outputs[1])
+        self.assertEqual(outputs[1], outputs[2])
+        slot_map = SlotMap.load(self.book_path / "Luke-Q1-L03.slots.json")
+        self.assertEqual(slot_map.key, SlotMap.get_key(book.chapters[3]))
+        self.assertEqual(
+            len(slot_map.paragraphs), len(self.book.chapters[3].paragraphs)
+        )
+
+
+class TestFlatOdt(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.book_path = Path(self.tmp.name) / "01LUK"
+        self.book_path.mkdir()
+        shutil.copy(DATA / "styles-reference.txt", self.book_path)
+        with (self.book_path / "styles-reference.txt").open("a") as f:
+            f.write("T2  \\it\n")
+        for name in ("TOC", "L01", "L02"):
+            path = self.book_path / f"Luke-Q1-{name}.fodt"
+            OdtChapter(CHAPTER_PATH).save(path)
+        LOGGER.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        LOGGER.setLevel(LOGLEVEL_INIT)
+        self.tmp.cleanup()
+
+    def test_flat_round_trip(self):
+        path = self.book_path / "Luke-Q1-L01.fodt"
+        doc = read_flat_document(path)
+        self.assertEqual(len(doc.body.get_paragraphs()), 18)
+        self.assertIsNotNone(doc.get_style("paragraph", "Text_20_body"))
+        # The page layout used by the master page is kept in styles.xml.
+        self.assertIsNotNone(doc.get_style("page-layout", "Mpm1"))
+        # odfdo can read the file, and the document can be saved zipped.
+        self.assertEqual(len(Document(path).body.get_paragraphs()), 18)
+        zipped = self.book_path / "Luke-Q1-L03.odt"
+        doc.save(zipped)
+        self.assertEqual(
+            OdtChapter(zipped).to_sfm("NFC").replace("\\c 3", "\\c 1"),
+            OdtChapter(path).to_sfm("NFC"),
+        )
+
+    def test_write_flat_leaves_document_unchanged(self):
+        doc = Document(CHAPTER_PATH)
+        parts = ("content.xml", "styles.xml", "meta.xml", "settings.xml")
+        before = [etree.tostring(doc.get_part(p)._get_tree()) for p in parts]
+        write_flat_document(doc, Path(self.tmp.name) / "chapter.fodt")
+        after = [etree.tostring(doc.get_part(p)._get_tree()) for p in parts]
+        self.assertEqual(before, after)
+
+    def test_set_part_tree_unsupported(self):
+        doc = Document(CHAPTER_PATH)
+        # As if odfdo no longer kept the parsed tree in this attribute.
+        vars(doc.get_part("meta.xml")).pop("_XmlPart__tree")
+        with self.assertRaises(RuntimeError):
+            set_part_tree(doc, "meta.xml", etree.ElementTree(etree.Element("x")))
+
+    def test_clone_document(self):
+        # Clones have the parsed document's changes, also for flat documents,
+        # whose container parts are never read.
+        for path in (CHAPTER_PATH, self.book_path / "Luke-Q1-L01.fodt"):
+            chapter = OdtChapter(path)
+            paragraph = chapter.odt.body.get_paragraph(content="1st verse")
+            paragraph.append(" changed")
+            clone = clone_document(chapter.odt)
+            self.assertIsNotNone(clone.body.get_paragraph(content="changed"))
+            self.assertIsNotNone(clone.get_style("paragraph", "Text_20_body"))
+            # The clone is independent of the document.
+            clone.body.get_paragraph(content="changed").append(" again")
+            self.assertIsNone(chapter.odt.body.get_paragraph(content="again"))
+
+    def test_flat_book_update(self):
+        book = OdtBook(self.book_path, filename="01LUK", normalization_mode="NFC")
+        self.assertEqual(sorted(book.chapter_paths), [0, 1, 2])
+        sfm = book.to_sfm()
+        self.assertEqual(sfm.count("\\c "), 2)
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(sfm.replace("A 2nd Section Header", "A New Header"))
+        book.update_text(SfmBook(sfm_path), Path(self.tmp.name) / "updated")
+        chapter = OdtChapter(Path(self.tmp.name) / "updated" / "Luke-Q1-L02.fodt")
+        chapter.sfm_ref = book.chapters[2].sfm_ref
+        self.assertEqual(chapter.paragraphs[4].text_recursive, "A New Header")
+
+
+class TestOdtChapterLoader(unittest.TestCase):
+    def setUp(self):
+        self.chapters = [OdtChapter(CHAPTER_PATH) for _ in range(5)]
+
+    def test_loader_order_and_loading(self):
+        chapters = [None, *self.chapters]
+        loaded = list()
+        for chapter in OdtChapterLoader(chapters, prefetch=2):
+            if chapter is not None:
+                self.assertIsNotNone(chapter._odt)
+                # No more than `prefetch` chapters are loaded ahead.
+                self.assertLessEqual(
+                    len([c for c in self.chapters if c._odt is not None]),
+                    len(loaded) + 1 + 2,
+                )
+            loaded.append(chapter)
+        self.assertEqual(loaded, chapters)
+
+    def test_loader_keeps_prefetched_chapters(self):
+        # Prefetched chapters aren't unloaded before they're used, even if
+        # the pool's limit is smaller than the prefetch window.
+        for max_open, prefetch in ((1, 2), (2, 4)):
+            pool = OdtDocumentPool(max_open=max_open)
+            chapters = [OdtChapter(CHAPTER_PATH, pool=pool) for _ in range(8)]
+            for chapter in OdtChapterLoader(chapters, prefetch=prefetch):
+                with pool.pin(chapter):
+                    self.assertGreater(len(chapter.paragraphs), 0)
+            self.assertEqual(pool.loads, len(chapters))
+            self.assertLessEqual(len(pool.open_chapters), max_open)
+
+    def test_loader_no_prefetch(self):
+        for chapter in OdtChapterLoader(self.chapters, prefetch=0):
+            self.assertIsNone(chapter._odt)
+
+
+class TestOdtDocumentPool(unittest.TestCase):
+    def setUp(self):
+        self.pool = OdtDocumentPool(max_open=2)
+        self.chapters = [OdtChapter(CHAPTER_PATH, pool=self.pool) for _ in range(4)]
+
+    def loaded(self):
+        return [c for c in self.chapters if c._odt is not None]
+
+    def test_pool_unloads_least_recently_used(self):
+        for chapter in self.chapters:
+            chapter.load()
+        self.assertEqual(self.loaded(), self.chapters[2:])
+        self.assertEqual(self.pool.evictions, 2)
+
+    def test_pool_keeps_pinned_and_modified(self):
+        self.chapters[0].load()
+        self.chapters[1].load()
+        self.chapters[1].is_modified = True
+        with self.pool.pin(self.chapters[0]):
+            self.chapters[2].load()
+            self.assertEqual(self.loaded(), self.chapters[:3])
+        self.assertEqual(self.loaded(), self.chapters[1:3])
+        # Once saved, the least recently used chapter can be unloaded.
+        self.chapters[1].is_modified = False
+        self.chapters[3].load()
+        self.assertEqual(self.loaded(), self.chapters[2:])
+
+    def test_pool_memory_budget(self):
+        pool = OdtDocumentPool(max_memory=self.chapters[0].memory_estimate)
+        chapters = [OdtChapter(CHAPTER_PATH, pool=pool) for _ in range(3)]
+        for chapter in chapters:
+            chapter.load()
+        self.assertEqual(pool.open_chapters, chapters[2:])
+
 
 class TestOdtElements(unittest.TestCase):
     def setUp(self):
@@ -51,6 +487,28 @@ class TestOdtElements(unittest.TestCase):
             "3 3rd verse, but now 2nd paragraph.", self.paragraph4.text_recursive
         )
 
+    def test_paragraph_is_unchanged(self):
+        paragraph = self.chapter.paragraphs[2]
+        sfm_paragraph = SfmParagraph(paragraph.to_sfm("NFC"))
+        self.assertTrue(paragraph.is_unchanged(sfm_paragraph, "NFC"))
+        # Matching fingerprints don't need the SFM paragraph's children.
+        self.assertIsNone(sfm_paragraph._children)
+        sfm_paragraph = SfmParagraph(paragraph.to_sfm("NFC").replace("verse", "line"))
+        self.assertFalse(paragraph.is_unchanged(sfm_paragraph, "NFC"))
+
+    def test_paragraph_update_keeps_tabs(self):
+        paragraph = self.chapter.paragraphs[2]
+        span = paragraph.spans[-1]
+        sfm_paragraph = SfmParagraph(paragraph.to_sfm("NFC").replace("tabs.", "tabs!"))
+        edits = TextEdits()
+        paragraph.update_children(sfm_paragraph, "NFC", edits=edits)
+        self.assertEqual(len(edits), 1)
+        # Nothing is written until the edits are applied.
+        self.assertEqual(span.text, "bold\twith\ttabs.")
+        self.assertEqual(edits.apply(), 1)
+        self.assertEqual(span.text, "bold\twith\ttabs!")
+        self.assertEqual([c.tag for c in span.node.children], ["text:tab", "text:tab"])
+
     def test_path(self):
         self.assertEqual(
             self.paragraph3.path,
@@ -65,6 +523,35 @@ class TestOdtElements(unittest.TestCase):
         self.assertEqual("bold\twith\ttabs.", self.span_tabs.text)
 
 
+class TestTextEdits(unittest.TestCase):
+    def span(self, xml):
+        return etree.fromstring(f'<text:span xmlns:text="{TEXT_NS}">{xml}</text:span>')
+
+    def inner_xml(self, span):
+        xml = etree.tostring(span, encoding="unicode")
+        return xml[xml.index(">") + 1 : xml.rindex("<")]
+
+    def test_write_inner_text_keeps_children(self):
+        span = self.span('a<text:s text:c="2"/>b<text:span>c</text:span>d')
+        self.assertEqual(write_inner_text(span, "A  b cD"), 3)
+        self.assertEqual(
+            self.inner_xml(span), 'A<text:s text:c="2"/>b <text:span>c</text:span>D'
+        )
+
+    def test_write_inner_text_unchanged(self):
+        span = self.span("a<text:tab/>b")
+        self.assertEqual(write_inner_text(span, "a\tb"), 0)
+
+    def test_write_inner_text_flattens_removed_tab(self):
+        LOGGER.setLevel(logging.ERROR)
+        try:
+            span = self.span("a<text:tab/>b")
+            self.assertEqual(write_inner_text(span, "a b"), 1)
+        finally:
+            LOGGER.setLevel(LOGLEVEL_INIT)
+        self.assertEqual(self.inner_xml(span), "a b")
+
+
 class TestOdtTable(unittest.TestCase):
     def setUp(self):
         self.chapter = OdtChapter(CHAPTER_PATH)
@@ -74,3 +561,39 @@ class TestOdtTable(unittest.TestCase):
         table = get_node_table(p)
         self.assertIsNotNone(table)
         self.assertEqual(get_node_table_pos(p), (0, 0))
+
+    def test_table_index(self):
+        cells = self.chapter.all_paragraphs[8:20]
+        index = self.chapter.get_table_index(cells[0]._xml_element.getparent())
+        positions = [get_node_table_pos(p, index=index) for p in cells]
+        self.assertEqual(positions, [(r, c) for r in range(4) for c in range(3)])
+        self.assertEqual(index.header_rows, {0})
+
+    def test_table_rows_to_sfm(self):
+        self.chapter.sfm_ref = {
+            "Table_20_Heading": "\\p",
+            "Table_20_Contents": "\\p",
+            "T1": "\\bd",
+        }
+        rows = [p for p in self.chapter.paragraphs if isinstance(p, OdtTableRow)]
+        self.assertEqual(len(rows), 4)
+        self.assertEqual(
+            rows[0].to_sfm("NFC"),
+            "\\tr \\th1 First column \\th2 Second column \\th3 Third column",
+        )
+        self.assertEqual(
+            rows[2].to_sfm("NFC"),
+            "\\tr \\tc1 Row 2 / \\bd bolded\\bd* column 1 \\tc2 Row 2 / column 2 \\tc3 Row 2 / column 3",
+        )
+
+    def test_table_row_update(self):
+        self.chapter.sfm_ref = {"Table_20_Contents": "\\p", "T1": "\\bd"}
+        row = self.chapter.paragraphs[-2]
+        sfm_row = SfmParagraph(
+            row.to_sfm("NFC").replace("bolded", "gras").replace("column 2", "col. 2")
+        )
+        row.update_children(sfm_row, "NFC")
+        self.assertEqual(
+            [c.text_recursive.strip() for c in row.node.children],
+            ["Row 2 / gras column 1", "Row 2 / col. 2", "Row 2 / column 3"],
+        )
@@ -0,0 +1,154 @@
+import copy
+import logging
+import shutil
+import tempfile
+import time
+import tracemalloc
+import unittest
+from pathlib import Path
+
+from odfdo import Document
+
+from odt2sfm.base import SFM_TEXT_SEP
+from odt2sfm.odt import OdtChapter
+from odt2sfm.sfm import SfmBook, SfmChapter
+from odt2sfm.sfm.elements import SfmParagraph
+
+DATA = Path(__file__).parent / "data"
+LOGGER = logging.getLogger()
+LOGLEVEL_INIT = LOGGER.level
+# Inputs grow by this factor; linear code should take about as much longer.
+GROWTH = 4
+# Allowed slack over linear growth; quadratic code grows by GROWTH**2.
+TIME_TOLERANCE = 2
+MEMORY_TOLERANCE = 1.5
+
+
+def get_time(func, size, repeat=3):
+    """Return the best of several timings of func(size)."""
+    times = list()
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(size)
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def get_peak_memory(func, size):
+    tracemalloc.start()
+    try:
+        func(size)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def verse_lines(count):
+    return "\n".join(f"\\v {i} Text of verse {i}." for i in range(1, count + 1))
+
+
+def parse_long_paragraph(verses):
+    """A paragraph whose verses are each on their own line."""
+    chapter = SfmChapter(f"\\c 1\n\\p\n{verse_lines(verses)}\n")
+    paragraph = chapter.paragraphs[0]
+    return paragraph.text
+
+
+def parse_split_texts(texts):
+    """A paragraph with many texts separated by space-underscores."""
+    paragraph = SfmParagraph(
+        "\\p " + SFM_TEXT_SEP.join(f"text {i}" for i in range(texts))
+    )
+    return paragraph.children
+
+
+def parse_long_chapter(paragraphs):
+    """A chapter with many short paragraphs, with a verse in each."""
+    raw = "\n".join(f"\\p \\v {i} Text of verse {i}." for i in range(1, paragraphs + 1))
+    chapter = SfmChapter(f"\\c 1\n{raw}\n")
+    return [p.children for p in chapter.paragraphs]
+
+
+class ScalingTestCase(unittest.TestCase):
+    def assertLinear(self, func, size):
+        """Check that func(GROWTH * size) takes at most about GROWTH times as
+        long, and as much memory, as func(size)."""
+        func(size)  # warm up caches, e.g. the stylesheet and regexes
+        small = get_time(func, size)
+        large = get_time(func, size * GROWTH)
+        self.assertLess(
+            large / small,
+            GROWTH * TIME_TOLERANCE,
+            f"{func.__name__} time grew from {small:.4f}s to {large:.4f}s",
+        )
+        small = get_peak_memory(func, size)
+        large = get_peak_memory(func, size * GROWTH)
+        self.assertLess(
+            large / small,
+            GROWTH * MEMORY_TOLERANCE,
+            f"{func.__name__} memory grew from {small} to {large} bytes",
+        )
+
+
+class TestSfmScaling(ScalingTestCase):
+    def test_long_paragraph(self):
+        self.assertLinear(parse_long_paragraph, 2500)
+
+    def test_split_texts(self):
+        self.assertLinear(parse_split_texts, 5000)
+
+    def test_long_chapter(self):
+        self.assertLinear(parse_long_chapter, 2500)
+
+    def test_many_chapters(self):
+        with tempfile.TemporaryDirectory() as tmp:
+
+            def index_chapters(count):
+                path = Path(tmp) / f"{count}.sfm"
+                path.write_text(
+                    "\\id LUK\n"
+                    + "".join(f"\\c {i}\n\\p {verse_lines(3)}\n" for i in range(count))
+                )
+                book = SfmBook(path)
+                try:
+                    return book.get_chapters([count // 2])
+                finally:
+                    book.close()
+
+            self.assertLinear(index_chapters, 2000)
+
+
+class TestOdtScaling(ScalingTestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        styles_path = Path(self.tmp.name) / "styles-reference.txt"
+        shutil.copy(DATA / "styles-reference.txt", styles_path)
+        with styles_path.open("a") as f:
+            f.write("T2  \\it\n")
+        LOGGER.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        LOGGER.setLevel(LOGLEVEL_INIT)
+        self.tmp.cleanup()
+
+    def make_chapter(self, copies):
+        """Save a lesson whose body repeats the test chapter's body."""
+        path = Path(self.tmp.name) / f"Luke-Q1-L{copies:02d}.odt"
+        if not path.is_file():
+            doc = Document(DATA / "chapter.odt")
+            body = doc.body._xml_element
+            content = list(body)
+            for _ in range(copies - 1):
+                body.extend(copy.deepcopy(e) for e in content)
+            doc.save(path)
+        return path
+
+    def test_long_chapter_export(self):
+        def export(copies):
+            return OdtChapter(self.make_chapter(copies)).to_sfm("NFC")
+
+        self.assertLinear(export, 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from odt2sfm.odt import OdtBook
+from odt2sfm.search import SearchIndex, tokenize
+from odt2sfm.sfm import SfmBook
+
+DATA = Path(__file__).parent / "data"
+
+
+class TestSearchIndex(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.sfm_path = Path(self.tmp.name) / "book.sfm"
+        shutil.copy(DATA / "book.sfm", self.sfm_path)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_tokenize(self):
+        self.assertEqual(tokenize("Café, CAFÉ!"), ["café", "café"])
+
+    def test_search_sfm_book(self):
+        index = SearchIndex()
+        self.assertEqual(index.add_sfm_book(SfmBook(self.sfm_path)), 4)
+        hits = index.search("section HEADER")
+        self.assertTrue(hits)
+        self.assertTrue(all("section header" in h.text.lower() for h in hits))
+        self.assertEqual(index.search("section nonexistentword"), list())
+        # Unchanged chapters aren't indexed again.
+        self.assertEqual(index.add_sfm_book(SfmBook(self.sfm_path)), 0)
+
+    def test_update_changed_chapter(self):
+        index = SearchIndex()
+        index.add_sfm_book(SfmBook(self.sfm_path))
+        text = self.sfm_path.read_text("utf-8")
+        m = text.index("\\c 2")
+        self.sfm_path.write_text(f"{text[:m]}\\c 2\n\\p \\v 1 Zebras{text[m + 4:]}")
+        self.assertEqual(index.add_sfm_book(SfmBook(self.sfm_path)), 1)
+        hits = index.search("zebras")
+        self.assertEqual([(h.chapter, h.verse) for h in hits], [(2, "1")])
+
+    def test_hits_in_verse_order(self):
+        index = SearchIndex()
+        text = self.sfm_path.read_text("utf-8")
+        m = text.index("\\c 2")
+        self.sfm_path.write_text(
+            f"{text[:m]}\\c 2\n\\p \\v 2 Zebras \\v 10 zebras{text[m + 4:]}"
+        )
+        index.add_sfm_book(SfmBook(self.sfm_path))
+        self.assertEqual([h.verse for h in index.search("zebras")], ["2", "10"])
+
+    def test_remove_missing_chapter(self):
+        index = SearchIndex()
+        index.add_sfm_book(SfmBook(self.sfm_path))
+        text = self.sfm_path.read_text("utf-8")
+        self.sfm_path.write_text(text[: text.index("\\c 3")])
+        # Only chapters in the given range are removed.
+        index.add_sfm_book(SfmBook(self.sfm_path), chapters="1-2")
+        self.assertIn(("book.sfm", 3), index.chapters)
+        index.add_sfm_book(SfmBook(self.sfm_path))
+        self.assertNotIn(("book.sfm", 3), index.chapters)
+        self.assertNotIn(3, {h.chapter for h in index.search("section")})
+
+    def test_save_load(self):
+        index = SearchIndex()
+        index.add_sfm_book(SfmBook(self.sfm_path))
+        index_path = Path(self.tmp.name) / "index.json"
+        index.save(index_path)
+        loaded = SearchIndex.load(index_path)
+        self.assertEqual(
+            [str(h) for h in loaded.search("section")],
+            [str(h) for h in index.search("section")],
+        )
+        loaded.remove_chapter("book.sfm", 1)
+        self.assertNotIn(1, {h.chapter for h in loaded.search("section")})
+
+    def test_search_odt_book(self):
+        book_path = Path(self.tmp.name) / "01LUK"
+        book_path.mkdir()
+        shutil.copy(DATA / "styles-reference.txt", book_path)
+        shutil.copy(DATA / "chapter.odt", book_path / "Luke-Q1-L01.odt")
+        book = OdtBook(book_path, filename="01LUK", normalization_mode="NFC")
+        index = SearchIndex()
+        self.assertEqual(index.add_odt_book(book), 1)
+        paragraph = index.chapters[(book.name, 1)]["paragraphs"][0]
+        word = tokenize(paragraph[1])[0]
+        self.assertIn((1, 0), {(h.chapter, h.paragraph) for h in index.search(word)})
+        self.assertEqual(index.add_odt_book(book), 0)
+        # A deleted lesson's chapter is removed.
+        shutil.copy(DATA / "chapter.odt", book_path / "Luke-Q1-L02.odt")
+        self.assertEqual(index.add_odt_book(OdtBook(book_path)), 1)
+        (book_path / "Luke-Q1-L02.odt").unlink()
+        self.assertEqual(index.add_odt_book(OdtBook(book_path)), 0)
+        self.assertEqual(list(index.chapters), [(book.name, 1)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,8 +1,10 @@
+import tempfile
 import unittest
 from pathlib import Path
 
 from odt2sfm.sfm import SfmBook, SfmChapter
-from odt2sfm.sfm.base import get_sfm_type
+from odt2sfm.sfm.base import get_sfm_marker, get_sfm_type, get_span_end_marker
+from odt2sfm.sfm.diff import SfmBookDiff
 from odt2sfm.sfm.elements import SfmElement, SfmParagraph, SfmSpan, SfmText
 
 BOOK_PATH = Path(__file__).parent / "data" / "book.sfm"
@@ -12,6 +14,21 @@ class TestSfmBase(unittest.TestCase):
     def test_get_sfm_type(self):
         self.assertEqual(get_sfm_type("\\li1"), "li")
         self.assertIsNone(get_sfm_type("\\999"))
+        self.assertEqual(get_sfm_type("\\tc7"), "tc")
+
+    def test_get_sfm_marker(self):
+        self.assertTrue(get_sfm_marker("\\p").is_paragraph)
+        self.assertTrue(get_sfm_marker("\\bd").is_character)
+        self.assertTrue(get_sfm_marker("\\f").is_note)
+        self.assertIs(get_sfm_marker("\\+bd"), get_sfm_marker("\\bd*"))
+
+    def test_get_span_end_marker(self):
+        self.assertEqual(get_span_end_marker("\\bd"), "\\bd*")
+        self.assertEqual(get_span_end_marker("\\b"), "\\b*")
+        self.assertEqual(get_span_end_marker("\\xyz"), "\\xyz*")
+        self.assertIsNone(get_span_end_marker("\\v"))
+        self.assertIsNone(get_span_end_marker("\\tc1"))
+        self.assertIsNone(get_span_end_marker("\\tcr9"))
 
 
 class TestSfmElements(unittest.TestCase):
@@ -39,10 +56,46 @@ class TestSfmBook(unittest.TestCase):
         self.book = SfmBook(BOOK_PATH)
         self.assertEqual(len(self.book.chapters), 4)
 
+    def test_get_chapters(self):
+        self.book = SfmBook(BOOK_PATH)
+        chapters = self.book.get_chapters([0, 3])
+        self.assertEqual([c.number for c in chapters], [0, 3])
+        self.assertIsNone(self.book._chapters)
+        self.assertEqual(chapters[1].sfm_raw, self.book.chapters[3].sfm_raw)
+
     def test_id_text(self):
         self.book = SfmBook(BOOK_PATH)
         self.assertEqual("XXA Book title information, etc.", self.book.id_text)
 
+    def test_get_chapters_decodes_only_chapters(self):
+        self.book = SfmBook(BOOK_PATH)
+        self.book.get_chapters([3])
+        self.assertIsNone(self.book._sfm_raw)
+        self.assertEqual(self.book.encoding, "utf-8")
+
+    def test_encodings(self):
+        text = "\\id XXA Livre, étc.\n\\c 1\n\\p\n\\v 1 Un.\n\\c 3\n\\p\n\\v 1 Trois.\n"
+        with tempfile.TemporaryDirectory() as tmp:
+            for name, data, encoding in (
+                (
+                    "bom-crlf",
+                    b"\xef\xbb\xbf" + text.replace("\n", "\r\n").encode(),
+                    None,
+                ),
+                ("cp1252", text.encode("cp1252"), "cp1252"),
+                ("utf-16", text.encode("utf-16"), None),
+            ):
+                path = Path(tmp) / f"{name}.sfm"
+                path.write_bytes(data)
+                book = SfmBook(path, encoding=encoding)
+                self.assertEqual(book.sfm_raw, text)
+                self.assertEqual(book.id_text, "XXA Livre, étc.")
+                self.assertEqual(
+                    book.get_chapters([3])[0].sfm_raw,
+                    text[text.index("\\c 3") :].rstrip(" "),
+                )
+                book.close()
+
 
 class TestSfmChapter(unittest.TestCase):
     def setUp(self):
@@ -128,6 +181,19 @@ class TestSfmParagraph(unittest.TestCase):
         self.assertEqual(span_end_markers, [s.end_marker for s in p.spans])
         self.assertEqual(texts, [t.text for t in p.texts])
 
+    def test_paragraph_table_row(self):
+        p = SfmParagraph(
+            "\\tr \\tc1 Row 2 / \\bd bolded\\bd* column 1 \\tc2 \\tc3 a _b"
+        )
+        self.assertEqual(
+            [c.marker for c in p.children],
+            ["\\tc1", "\\bd", None, "\\tc2", "\\tc3", None],
+        )
+        self.assertEqual(
+            [c.text for c in p.children],
+            ["Row 2 / ", "bolded", " column 1", "", "a", "b"],
+        )
+
     def test_paragraph_text(self):
         self.assertEqual(
             self.paragraph1.text,
@@ -135,6 +201,25 @@ class TestSfmParagraph(unittest.TestCase):
         )
         self.assertEqual(self.paragraph0.text, "Section Header")
 
+    def test_paragraph_plain_text(self):
+        p = SfmParagraph("\\p \\v 2 2nd verse with some \\bd bolded\\bd* text.")
+        self.assertEqual(p.plain_text, "2 2nd verse with some bolded text.")
+        self.assertIsNone(p._children)
+
+    def test_paragraph_fingerprint(self):
+        p = SfmParagraph("\\p \\v 1 Caf\u00e9 text.")
+        fingerprint = p.fingerprint("NFC")
+        self.assertIsNone(p._children)
+        # Trailing whitespace and Unicode normalization don't matter.
+        self.assertEqual(
+            fingerprint, SfmParagraph("\\p \\v 1 Cafe\u0301 text.  ").fingerprint("NFC")
+        )
+        self.assertNotEqual(
+            fingerprint, SfmParagraph("\\p \\v 1 Cafe text.").fingerprint("NFC")
+        )
+        p.sfm_raw = "\\p \\v 1 Other text."
+        self.assertNotEqual(p.fingerprint("NFC"), fingerprint)
+
 
 class TestSfmSpan(unittest.TestCase):
     def setUp(self):
@@ -143,3 +228,40 @@ class TestSfmSpan(unittest.TestCase):
     def test_span_children_span(self):
         self.assertEqual(len(self.span.children), 1)
         self.assertEqual(self.span.text, "bolded")
+
+
+class TestSfmBookDiff(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.new_path = Path(self.tmp.name) / "new.sfm"
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def get_diff(self, text):
+        self.new_path.write_text(text, encoding="utf-8")
+        return SfmBookDiff(SfmBook(BOOK_PATH), SfmBook(self.new_path))
+
+    def test_unchanged(self):
+        diff = self.get_diff(BOOK_PATH.read_text(encoding="utf-8"))
+        self.assertEqual(diff.changes, list())
+
+    def test_changes(self):
+        text = BOOK_PATH.read_text(encoding="utf-8")
+        text = text.replace("3rd verse, but now 2nd", "3rd verse, now the 2nd", 1)
+        text = text.replace("\\s A 2nd Section Header\n", "", 1)
+        diff = self.get_diff(f"{text.rstrip()}\n\\c 4\n\\p \\v 1 New verse.\n")
+        changes = {(c.chapter, c.key, c.kind) for c in diff.changes}
+        self.assertEqual(
+            changes,
+            {(1, "v3", "changed"), (1, "\\s@v3#1", "removed"), (4, "v1", "added")},
+        )
+        self.assertEqual(diff.changed_chapters, [1, 4])
+        self.assertIn('"kind": "removed"', diff.to_json())
+
+    def test_formatting_change(self):
+        text = BOOK_PATH.read_text(encoding="utf-8")
+        diff = self.get_diff(text.replace("\\b bolded\\b*", "\\it bolded\\it*", 1))
+        changes = {(c.chapter, c.key, c.kind) for c in diff.changes}
+        self.assertEqual(changes, {(1, "v2", "changed")})
+        self.assertEqual(diff.changed_chapters, [1])
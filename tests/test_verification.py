@@ -0,0 +1,45 @@
+import unittest
+from pathlib import Path
+
+from odt2sfm.odt import OdtChapter
+from odt2sfm.sfm import SfmBook, SfmChapter
+from odt2sfm.verification import verify_chapter
+
+from .test_alignment import SFM_REF
+
+DATA = Path(__file__).parent / "data"
+ODT_PATH = DATA / "chapter.odt"
+SFM_PATH = DATA / "book.sfm"
+
+
+class TestVerifyChapter(unittest.TestCase):
+    def setUp(self):
+        self.odt_chapter = OdtChapter(ODT_PATH)
+        self.odt_chapter.sfm_ref = SFM_REF
+        self.sfm_raw = SfmBook(SFM_PATH).chapters[3].sfm_raw
+
+    def test_verify_matching_chapter(self):
+        verification = verify_chapter(SfmChapter(self.sfm_raw), self.odt_chapter, "NFC")
+        self.assertTrue(verification.ok)
+        self.assertEqual(verification.warnings, [])
+
+    def test_verify_collects_all_mismatches(self):
+        sfm_raw = self.sfm_raw.replace("\\q\n", "\\m\n").replace(
+            "\\mt Chapter title information, etc.\n", ""
+        )
+        verification = verify_chapter(SfmChapter(sfm_raw), self.odt_chapter, "NFC")
+        kinds = sorted(m.kind for m in verification.mismatches)
+        self.assertEqual(kinds, ["count", "marker", "unaligned"])
+        self.assertEqual(len(verification.errors), 1)
+        self.assertEqual(verification.as_dict()["chapter"], 3)
+
+    def test_verify_missing_odt_chapter(self):
+        verification = verify_chapter(SfmChapter(self.sfm_raw), None, "NFC")
+        self.assertFalse(verification.ok)
+
+    def test_update_text_uses_verified_pairs(self):
+        sfm_raw = self.sfm_raw.replace("A 2nd Section Header", "Un 2e titre")
+        sfm_chapter = SfmChapter(sfm_raw)
+        verification = verify_chapter(sfm_chapter, self.odt_chapter, "NFC")
+        self.odt_chapter.update_text(sfm_chapter, "NFC", verification=verification)
+        self.assertEqual(self.odt_chapter.paragraphs[4].text_recursive, "Un 2e titre")
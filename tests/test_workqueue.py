@@ -0,0 +1,174 @@
+import logging
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from pathlib import Path
+
+from odt2sfm.conversions import SfmToOdt
+from odt2sfm.odt import OdtBook, OdtChapter, SfmExportTarget
+from odt2sfm.sfm import SfmBook
+from odt2sfm.verification import PreflightError
+from odt2sfm.workqueue import QueueCoordinator, QueueWorker, WorkQueue
+
+DATA = Path(__file__).parent / "data"
+CHAPTER_PATH = DATA / "chapter.odt"
+LOGGER = logging.getLogger()
+LOGLEVEL_INIT = LOGGER.level
+
+
+def run_worker(queue_path, worker_id):
+    logging.getLogger().setLevel(logging.ERROR)
+    QueueWorker(WorkQueue(queue_path), worker_id=worker_id, poll_interval=0.05).run()
+
+
+class TestWorkQueue(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.queue = WorkQueue(Path(self.tmp.name) / "queue")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_claim_is_exclusive(self):
+        self.queue.put({"id": "run-0000", "kind": "export"})
+        claim_path, job = self.queue.claim("a")
+        self.assertEqual(job["id"], "run-0000")
+        self.assertIsNone(self.queue.claim("b"))
+        self.queue.complete(claim_path, {"id": "run-0000"})
+        self.assertEqual(self.queue.get_result("run-0000"), {"id": "run-0000"})
+        self.assertEqual(list(self.queue.claimed_path.iterdir()), [])
+
+    def test_requeue_stale(self):
+        self.queue.put({"id": "run-0000", "kind": "export"})
+        claim_path, _ = self.queue.claim("a")
+        self.assertEqual(self.queue.requeue_stale(60), 0)
+        os.utime(claim_path, (time.time() - 120, time.time() - 120))
+        self.assertEqual(self.queue.requeue_stale(60), 1)
+        _, job = self.queue.claim("b")
+        self.assertEqual(job["id"], "run-0000")
+
+    def test_heartbeat_keeps_slow_job(self):
+        class SlowWorker(QueueWorker):
+            def export(self, job):
+                time.sleep(0.3)
+                return {}
+
+        self.queue.put({"id": "run-0000", "kind": "export"})
+        claim_path, job = self.queue.claim("a")
+        os.utime(claim_path, (time.time() - 120, time.time() - 120))
+        worker = SlowWorker(self.queue, worker_id="a", heartbeat_interval=0.01)
+        thread = threading.Thread(target=worker.process, args=(claim_path, job))
+        thread.start()
+        time.sleep(0.1)
+        # The running job's claim has been refreshed.
+        self.assertEqual(self.queue.requeue_stale(60), 0)
+        thread.join()
+        self.assertEqual(self.queue.get_result("run-0000")["worker"], "a")
+        self.assertFalse(self.queue.refresh(claim_path))
+
+    def test_wait_timeout(self):
+        # Nobody does the jobs.
+        coordinator = QueueCoordinator(self.queue, poll_interval=0.01, timeout=0.05)
+        job_ids = coordinator.submit([{"kind": "export"}])
+        with self.assertRaises(TimeoutError):
+            coordinator.wait(job_ids)
+        self.assertEqual(list(self.queue.pending_path.iterdir()), [])
+
+    def test_conversion_queue_options(self):
+        conv = SfmToOdt(
+            source=DATA / "book.sfm",
+            destination=DATA,
+            queue=self.queue.path,
+            claim_timeout=30,
+            queue_timeout=600,
+        )
+        self.assertEqual(conv.coordinator.claim_timeout, 30)
+        self.assertEqual(conv.coordinator.timeout, 600)
+
+    def test_invalid_job(self):
+        with self.assertRaises(ValueError):
+            self.queue.put({"id": "run-0000", "kind": "other"})
+
+
+class TestQueueWorkers(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.book_path = Path(self.tmp.name) / "01LUK"
+        self.book_path.mkdir()
+        shutil.copy(DATA / "styles-reference.txt", self.book_path)
+        with (self.book_path / "styles-reference.txt").open("a") as f:
+            f.write("T2  \\it\n")
+        shutil.copy(CHAPTER_PATH, self.book_path / "Luke-Q1-TOC.odt")
+        for i in range(1, 4):
+            shutil.copy(CHAPTER_PATH, self.book_path / f"Luke-Q1-L{i:02d}.odt")
+        self.book = OdtBook(self.book_path, filename="01LUK", normalization_mode="NFC")
+        self.queue = WorkQueue(Path(self.tmp.name) / "queue")
+        self.coordinator = QueueCoordinator(self.queue, poll_interval=0.05, timeout=60)
+        # Workers in separate processes, as they would be on other machines.
+        ctx = multiprocessing.get_context("spawn")
+        self.workers = [
+            ctx.Process(target=run_worker, args=(self.queue.path, f"worker-{i}"))
+            for i in range(2)
+        ]
+        for worker in self.workers:
+            worker.start()
+        LOGGER.setLevel(logging.ERROR)
+
+    def tearDown(self):
+        self.queue.close()
+        for worker in self.workers:
+            worker.join(timeout=30)
+        LOGGER.setLevel(LOGLEVEL_INIT)
+        self.tmp.cleanup()
+
+    def test_export(self):
+        targets = [SfmExportTarget("NFC"), SfmExportTarget("NFD", book_id="ACT")]
+        nfc, nfd = self.coordinator.to_sfm_targets(self.book, targets)
+        self.assertEqual(nfc, self.book.to_sfm())
+        self.assertTrue(nfd.startswith("\\id ACT "))
+        self.assertEqual(len(self.coordinator.metrics.chapters), 4)
+        # The queue is left empty.
+        self.assertEqual(list(self.queue.results_path.iterdir()), [])
+
+    def test_update_text(self):
+        sfm = self.book.to_sfm(chapters="2-3")
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(sfm.replace("A 2nd Section Header", "A New Header"))
+        dest_path = Path(self.tmp.name) / "updated"
+        verifications = self.coordinator.update_text(
+            self.book, SfmBook(sfm_path), dest_path
+        )
+        self.assertEqual([v.number for v in verifications], [0, 2, 3])
+        self.assertTrue(all(v.ok for v in verifications))
+        self.assertEqual(
+            sorted(p.name for p in dest_path.iterdir()),
+            ["Luke-Q1-L02.odt", "Luke-Q1-L03.odt", "Luke-Q1-TOC.odt"],
+        )
+        chapter = OdtChapter(dest_path / "Luke-Q1-L03.odt")
+        chapter.sfm_ref = self.book.chapters[3].sfm_ref
+        self.assertEqual(chapter.paragraphs[4].text_recursive, "A New Header")
+        self.assertEqual(list(self.queue.results_path.iterdir()), [])
+
+    def test_update_text_errors(self):
+        sfm = self.book.to_sfm(chapters="1-2")
+        sfm_path = Path(self.tmp.name) / "01LUK.sfm"
+        sfm_path.write_text(sfm)
+        # Chapter 2's span style T2 has no SFM marker.
+        shutil.copy(
+            DATA / "styles-reference.txt",
+            self.book_path / "Luke-Q1-L02.styles-reference.txt",
+        )
+        dest_path = Path(self.tmp.name) / "updated"
+        with self.assertRaises(PreflightError) as cm:
+            self.coordinator.update_text(self.book, SfmBook(sfm_path), dest_path)
+        self.assertEqual([v.number for v in cm.exception.verifications], [2])
+        self.assertFalse(dest_path.exists())
+        self.assertEqual(list(self.queue.results_path.iterdir()), [])
+
+
+if __name__ == "__main__":
+    unittest.main()